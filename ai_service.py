@@ -1,44 +1,46 @@
 import os
-from typing import List, Dict, Any, Optional
-import groq
-from groq import Groq
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple
+from groq import Groq, AsyncGroq
 from dotenv import load_dotenv
 
+import telemetry
+
 # Load .env file
 load_dotenv()
 
 # Fetch API key
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 client = Groq(api_key=GROQ_API_KEY)
+
+# Model used for all analysis requests
+GROQ_MODEL = "llama-3.3-70b-versatile"  # Use the strongest available model
+
+# Sampling parameters sent with every request (part of the response cache key)
+GROQ_SAMPLING_PARAMS: Dict[str, Any] = {}
+
 class AIService:
     """
     A service that uses Groq's LLaMA model for chess analysis.
     """
-    
-    def __init__(self):
+
+    def __init__(self, max_concurrency: int = 8, request_timeout: float = 60.0, cache=None):
+        # Optional LLMResponseCache consulted before every request
+        self.cache = cache
         try:
-            self.model_name = "llama3-70b-chat"  # Use the strongest LLaMA model available in Groq
             self.model_available = True
             self.client = Groq(api_key=GROQ_API_KEY)
+            # Bounds for the async fan-out used when analyzing several positions at once
+            self.max_concurrency = max_concurrency
+            self.request_timeout = request_timeout
         except Exception as e:
             self.model_available = False
 
-    def analyze_position(self, fen: str) -> str:
-        """
-        Analyze a chess position given in FEN notation using Groq's API and a LLaMA model.
-
-        Args:
-            fen: The FEN string representing the chess position
-
-        Returns:
-            A string containing the analysis
-        """ 
-        if not self.model_available:
-            return "LLaMA model not available"
-
-        try:
-            # Define the structured prompt
-            prompt = f"""
+    def _position_prompt(self, fen: str) -> str:
+        # Define the structured prompt
+        return f"""
             The following is a conversation with a chess grandmaster AI.
 
             User: Can you analyze this chess position given in FEN notation?
@@ -52,18 +54,46 @@ class AIService:
 
             Grandmaster AI:
             """
-            
-            # Call Groq API
-            response = client.chat.completions.create(
-                model="llama-3.3-70b-versatile",  # Use the strongest available model
-                messages=[{"role": "user", "content": prompt}],
-            )
 
-            return response.choices[0].message.content 
-        
+    def _game_prompt(self, pgn_text: str, player_name: Optional[str] = None) -> str:
+        # Format the prompt as a conversation
+        return f"""
+            The following is a conversation with a chess grandmaster AI.
+
+            User: Can you analyze this chess game?
+            {pgn_text}
+
+            {f'Focus on player: {player_name}' if player_name else ''}
+
+            Please provide:
+            1. Opening identification and assessment
+            2. Key turning points in the game
+            3. Critical mistakes and missed opportunities
+            4. Strategic themes throughout the game
+            5. Suggestions for improvement
+
+            Grandmaster AI:
+            """
+
+    def analyze_position(self, fen: str) -> str:
+        """
+        Analyze a chess position given in FEN notation using Groq's API and a LLaMA model.
+
+        Args:
+            fen: The FEN string representing the chess position
+
+        Returns:
+            A string containing the analysis
+        """
+        if not self.model_available:
+            return "LLaMA model not available"
+
+        try:
+            return self._complete(self._position_prompt(fen))
+
         except Exception as e:
             return f"Error in analysis: {str(e)}"
-    
+
     def analyze_game(self, pgn_text: str, player_name: Optional[str] = None) -> str:
         """
         Analyze a complete chess game from PGN notation.
@@ -79,33 +109,134 @@ class AIService:
             return "LLaMA model not available"
 
         try:
-            # Format the prompt as a conversation
-            prompt = f"""
-            The following is a conversation with a chess grandmaster AI.
-
-            User: Can you analyze this chess game?
-            {pgn_text}
+            return self._complete(self._game_prompt(pgn_text, player_name))
 
-            {f'Focus on player: {player_name}' if player_name else ''}
+        except Exception as e:
+            return f"Error in analysis: {str(e)}"
 
-            Please provide:
-            1. Opening identification and assessment
-            2. Key turning points in the game
-            3. Critical mistakes and missed opportunities
-            4. Strategic themes throughout the game
-            5. Suggestions for improvement
+    def _complete(self, prompt: str) -> str:
+        """Run a single chat completion, answering from the response cache when possible"""
+        if self.cache is not None:
+            cached = self.cache.get(GROQ_MODEL, prompt, GROQ_SAMPLING_PARAMS)
+            if cached is not None:
+                return cached
 
-            Grandmaster AI:
-            """
-
-            # Call Groq API
+        # Call Groq API
+        with telemetry.span("llm.completion", model=GROQ_MODEL):
             response = client.chat.completions.create(
-                model="llama-3.3-70b-versatile",  # Use the strongest available model
+                model=GROQ_MODEL,
                 messages=[{"role": "user", "content": prompt}],
+                timeout=self.request_timeout,
+                **GROQ_SAMPLING_PARAMS
             )
+        content = response.choices[0].message.content
+
+        if self.cache is not None:
+            self.cache.put(GROQ_MODEL, prompt, content, GROQ_SAMPLING_PARAMS)
+        return content
+
+    async def _complete_async(self, async_client: AsyncGroq, semaphore: asyncio.Semaphore, prompt: str) -> str:
+        """Run a single chat completion, bounded by the semaphore and the per-request timeout"""
+        # The cache is a blocking SQLite store, so it is read and written off the event loop
+        if self.cache is not None:
+            cached = await asyncio.to_thread(self.cache.get, GROQ_MODEL, prompt, GROQ_SAMPLING_PARAMS)
+            if cached is not None:
+                return cached
+
+        async with semaphore:
+            # The span starts once a slot is free, so it times the request and not the queue
+            with telemetry.span("llm.completion", model=GROQ_MODEL) as trace:
+                try:
+                    response = await asyncio.wait_for(
+                        async_client.chat.completions.create(
+                            model=GROQ_MODEL,
+                            messages=[{"role": "user", "content": prompt}],
+                            **GROQ_SAMPLING_PARAMS
+                        ),
+                        timeout=self.request_timeout
+                    )
+                    content = response.choices[0].message.content
+                    if self.cache is not None:
+                        await asyncio.to_thread(self.cache.put, GROQ_MODEL, prompt, content, GROQ_SAMPLING_PARAMS)
+                    return content
+                except asyncio.TimeoutError:
+                    trace["status"] = "timeout"
+                    return f"Error in analysis: request timed out after {self.request_timeout:g}s"
+                except Exception as e:
+                    trace["status"] = "error"
+                    return f"Error in analysis: {str(e)}"
+
+    async def analyze_positions_async(self, fens: List[str]) -> Dict[str, str]:
+        """
+        Analyze several positions concurrently.
 
-            return response.choices[0].message.content 
+        Args:
+            fens: FEN strings of the positions to analyze
 
-        except Exception as e:
-            return f"Error in analysis: {str(e)}"
+        Returns:
+            A dict mapping each FEN to its analysis
+        """
+        _, analyses = await self.analyze_game_and_positions_async(None, fens)
+        return analyses
+
+    async def analyze_game_and_positions_async(
+        self,
+        pgn_text: Optional[str],
+        fens: List[str],
+        player_name: Optional[str] = None
+    ) -> Tuple[Optional[str], Dict[str, str]]:
+        """
+        Analyze a game and a set of its positions with all requests in flight at once.
+
+        Args:
+            pgn_text: The PGN text of the chess game, or None to skip the game analysis
+            fens: FEN strings of the positions to analyze
+            player_name: Optional name of the player to focus on
 
+        Returns:
+            A tuple of the game analysis (None if no PGN was given) and a dict
+            mapping each FEN to its analysis
+        """
+        unique_fens = list(dict.fromkeys(fens))
+        if not self.model_available:
+            game_analysis = "LLaMA model not available" if pgn_text is not None else None
+            return game_analysis, {fen: "LLaMA model not available" for fen in unique_fens}
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with AsyncGroq(api_key=GROQ_API_KEY) as async_client:
+            prompts = [self._position_prompt(fen) for fen in unique_fens]
+            if pgn_text is not None:
+                prompts.append(self._game_prompt(pgn_text, player_name))
+
+            responses = await asyncio.gather(
+                *(self._complete_async(async_client, semaphore, prompt) for prompt in prompts)
+            )
+
+        game_analysis = responses.pop() if pgn_text is not None else None
+        return game_analysis, dict(zip(unique_fens, responses))
+
+    def analyze_positions(self, fens: List[str]) -> Dict[str, str]:
+        """Synchronous wrapper around analyze_positions_async"""
+        return self._run_sync(self.analyze_positions_async(fens))
+
+    def analyze_game_and_positions(
+        self,
+        pgn_text: str,
+        fens: List[str],
+        player_name: Optional[str] = None
+    ) -> Tuple[str, Dict[str, str]]:
+        """Synchronous wrapper around analyze_game_and_positions_async"""
+        return self._run_sync(self.analyze_game_and_positions_async(pgn_text, fens, player_name))
+
+    def _run_sync(self, coro):
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            # No event loop in this thread, the usual case for Streamlit and scripts
+            return asyncio.run(coro)
+
+        # Called from inside a running loop: run the coroutine on a loop of its own,
+        # in this context so its spans land in the caller's trace
+        context = contextvars.copy_context()
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            return executor.submit(context.run, asyncio.run, coro).result()
@@ -2,22 +2,35 @@ import streamlit as st
 import chess
 import chess.pgn
 import chess.svg
-import pandas as pd
-import numpy as np
-import matplotlib.pyplot as plt
 import io
 import base64
 import re
 import os
 import time
-import threading
 import logging
-import seaborn as sns
 from io import StringIO
 from datetime import datetime
 
 # Import our chess analysis module
-from chess_analysis import initialize_services, analyze_game_in_background, add_debug_info, debug_info
+from chess_analysis import initialize_services, add_debug_info
+from compact_game import CompactGame
+from pgn_index import get_pgn_index
+from position_index import get_position_index
+from opening_explorer import get_opening_explorer, default_explorer_path
+import telemetry
+import profiling
+
+# Wall-clock budget (seconds) for the engine search behind the suggested-move arrows
+INTERACTIVE_ANALYSIS_TIME = 2.0
+
+# Seconds the suggested-move arrows wait for the interactive engine while another session uses it
+INTERACTIVE_CHECKOUT_TIMEOUT = 1.0
+
+# Seconds between two checks on a running analysis job
+ANALYSIS_POLL_INTERVAL = 1.0
+
+# Database games listed under the game picker that reach the board position
+POSITION_MATCHES_SHOWN = 5
 
 # Configure logging
 logging.basicConfig(
@@ -72,20 +85,22 @@ st.markdown("""
 # Initialize session state
 if 'board' not in st.session_state:
     st.session_state.board = chess.Board()
-if 'move_history' not in st.session_state:
-    st.session_state.move_history = []
+if 'game' not in st.session_state:
+    # Moves, SAN, UCI and positions of the loaded game all come from this one object
+    st.session_state.game = CompactGame()
 if 'current_move_index' not in st.session_state:
     st.session_state.current_move_index = -1
 if 'analysis_results' not in st.session_state:
     st.session_state.analysis_results = {}
 if 'pgn_text' not in st.session_state:
     st.session_state.pgn_text = ""
-if 'analysis_in_progress' not in st.session_state:
-    st.session_state.analysis_in_progress = False
+if 'analysis_job_id' not in st.session_state:
+    st.session_state.analysis_job_id = None
+if 'analysis_error' not in st.session_state:
+    st.session_state.analysis_error = None
 if 'services' not in st.session_state:
+    # The registry is shared by every session; each service starts on first use
     st.session_state.services = initialize_services()
-if 'uci_moves' not in st.session_state:
-    st.session_state.uci_moves = []
 if 'debug_mode' not in st.session_state:
     st.session_state.debug_mode = False
 if 'last_clicked_square' not in st.session_state:
@@ -100,36 +115,34 @@ if 'show_heatmap' not in st.session_state:
     st.session_state.show_heatmap = False
 if 'show_influence' not in st.session_state:
     st.session_state.show_influence = False
-if 'moves' not in st.session_state:
-    st.session_state.moves = []
 if 'current_move_index' not in st.session_state:
     st.session_state.current_move_index = -1
 if 'game_info' not in st.session_state:
     st.session_state.game_info = None
-if 'positions' not in st.session_state:
-    st.session_state.positions = []
-if 'move_notations' not in st.session_state:
-    st.session_state.move_notations = []
 if 'flip_board' not in st.session_state:
     st.session_state.flip_board = False
 if 'analysis_depth' not in st.session_state:
     st.session_state.analysis_depth = "standard"
 if 'show_arrows' not in st.session_state:
     st.session_state.show_arrows = True
+if 'prerender_boards' not in st.session_state:
+    st.session_state.prerender_boards = True
 if 'show_heatmap' not in st.session_state:
     st.session_state.show_heatmap = False
 if 'show_influence' not in st.session_state:
     st.session_state.show_influence = False
-if 'analysis_in_progress' not in st.session_state:
-    st.session_state.analysis_in_progress = False
 if 'services' not in st.session_state:
     st.session_state.services = None
-if 'debug_info' not in st.session_state:
-    st.session_state.debug_info = []
+if 'profile_requests' not in st.session_state:
+    st.session_state.profile_requests = profiling.profiling_enabled()
+if 'render_profile' not in st.session_state:
+    st.session_state.render_profile = None
+if 'trace' not in st.session_state:
+    st.session_state.trace = telemetry.TraceBuffer()
+# Every run records its debug messages and spans into this session's trace
+telemetry.use_buffer(st.session_state.trace)
 if 'analysis_results' not in st.session_state:
     st.session_state.analysis_results = {}
-if 'uci_moves' not in st.session_state:
-    st.session_state.uci_moves = []
 # Helper functions
 def get_svg_board(board, lastmove=None, squares=None, flipped=False):
     """Generate SVG for the current board position"""
@@ -141,6 +154,60 @@ def get_svg_board(board, lastmove=None, squares=None, flipped=False):
         size=400
     )
 
+def current_control_maps():
+    """Control maps (2, 8, 8) of the displayed position, computed once for the whole game"""
+    game = st.session_state.game
+    # The last position's key changes whenever moves are replaced, not just appended
+    signature = (id(game), len(game), game.key(len(game)))
+    if st.session_state.get("control_maps_signature") != signature:
+        st.session_state.control_maps = st.session_state.services["visualization_service"].generate_game_control_maps(
+            game.boards()
+        )
+        st.session_state.control_maps_signature = signature
+        add_debug_info(f"Computed control maps for {len(game) + 1} positions")
+    control_maps = st.session_state.control_maps
+    return control_maps[st.session_state.current_move_index + 1] if control_maps is not None else None
+
+def top_moves_of(eval_result):
+    """The suggested moves of an analysis result, as chess.Move objects"""
+    moves = []
+    for move_info in eval_result["top_moves"]:
+        # Extract first move from UCI format
+        first_move = move_info["Move"]
+        try:
+            moves.append(chess.Move.from_uci(first_move))
+        except ValueError as e:
+            add_debug_info(f"Error parsing suggested move {first_move}: {str(e)}")
+    return moves
+
+def ensure_prerender():
+    """
+    Pre-render every ply of the loaded game in the background, once per game, orientation
+    and set of known suggested moves
+    """
+    game = st.session_state.game
+    suggestions = {}
+    if st.session_state.show_arrows:
+        # The same arrows the board view draws, so the pre-rendered boards are the ones it asks for
+        suggestions = {
+            fen: top_moves_of(result) for fen, result in st.session_state.analysis_results.items()
+            if "error" not in result and "top_moves" in result
+        }
+    signature = (id(game), len(game), game.key(len(game)), st.session_state.flip_board, frozenset(suggestions))
+    if st.session_state.get("prerender_signature") == signature:
+        return
+
+    # Stop rendering a game that is no longer displayed
+    previous = st.session_state.get("prerender_cancel")
+    if previous is not None:
+        previous.set()
+    st.session_state.prerender_cancel = st.session_state.services["visualization_service"].prerender_game(
+        game,
+        flip=st.session_state.flip_board,
+        suggestions=suggestions
+    )
+    st.session_state.prerender_signature = signature
+
 def svg_to_html(svg_str):
     """Convert SVG string to HTML for display"""
     b64 = base64.b64encode(svg_str.encode('utf-8')).decode('utf-8')
@@ -149,11 +216,10 @@ def svg_to_html(svg_str):
 def reset_board():
     """Reset the board to starting position"""
     st.session_state.board = chess.Board()
-    st.session_state.move_history = []
+    st.session_state.game = CompactGame()
     st.session_state.current_move_index = -1
     st.session_state.analysis_results = {}
     st.session_state.pgn_text = ""
-    st.session_state.uci_moves = []
     st.session_state.last_clicked_square = None
     st.session_state.selected_piece = None
     st.session_state.suggested_moves = []
@@ -172,17 +238,13 @@ def make_move(move):
     
     if move in st.session_state.board.legal_moves:
         # If we're not at the end of the move history, truncate it
-        if st.session_state.current_move_index < len(st.session_state.move_history) - 1:
-            st.session_state.move_history = st.session_state.move_history[:st.session_state.current_move_index + 1]
-            st.session_state.uci_moves = st.session_state.uci_moves[:st.session_state.current_move_index + 1]
+        st.session_state.game.truncate(st.session_state.current_move_index + 1)
         
         # Make the move
-        san = st.session_state.board.san(move)
         st.session_state.board.push(move)
         
         # Update move history
-        st.session_state.move_history.append(san)
-        st.session_state.uci_moves.append(move.uci())
+        st.session_state.game.push(move)
         st.session_state.current_move_index += 1
         
         # Clear selection
@@ -197,14 +259,9 @@ def make_move(move):
 
 def navigate_to_move(index):
     """Navigate to a specific move in the history"""
-    if index >= -1 and index < len(st.session_state.move_history):
-        # Reset board
-        st.session_state.board = chess.Board()
-        
-        # Replay moves up to the selected index
-        for i in range(index + 1):
-            move_uci = st.session_state.uci_moves[i]
-            st.session_state.board.push(chess.Move.from_uci(move_uci))
+    if index >= -1 and index < len(st.session_state.game):
+        # Rebuild the board from the nearest snapshot
+        st.session_state.board = st.session_state.game.board_at(index + 1)
         
         st.session_state.current_move_index = index
         
@@ -267,8 +324,7 @@ def generate_pgn():
     node = game
     board = chess.Board()
     
-    for uci_move in st.session_state.uci_moves:
-        move = chess.Move.from_uci(uci_move)
+    for move in st.session_state.game.moves():
         node = node.add_variation(move)
         board.push(move)
     
@@ -298,18 +354,11 @@ def load_pgn(pgn_text):
         # game.headers...
         
         # Play through the moves
-        board = chess.Board()
-        for move in game.mainline_moves():
-            san = board.san(move)
-            board.push(move)
-            
-            # Update our state
-            st.session_state.move_history.append(san)
-            st.session_state.uci_moves.append(move.uci())
+        st.session_state.game = CompactGame.from_pgn_game(game)
         
         # Set the board to the final position
-        st.session_state.board = board
-        st.session_state.current_move_index = len(st.session_state.move_history) - 1
+        st.session_state.board = st.session_state.game.board_at(-1)
+        st.session_state.current_move_index = len(st.session_state.game) - 1
         st.session_state.pgn_text = pgn_text
         
         return True
@@ -318,54 +367,146 @@ def load_pgn(pgn_text):
         st.error(f"Error loading PGN: {str(e)}")
         return False
 
-def start_analysis():
-    """Start the analysis process in a background thread"""
-    if st.session_state.analysis_in_progress:
-        st.warning("Analysis already in progress")
-        return
-    
-    # Generate PGN if needed
-    if not st.session_state.pgn_text:
-        st.session_state.pgn_text = generate_pgn()
-    
-    # Set analysis flag
-    st.session_state.analysis_in_progress = True
-    
-    # Start analysis in a background thread
-    analysis_thread = threading.Thread(
-        target=run_analysis,
-        args=(st.session_state.pgn_text, "standard")
+def select_database_game(path):
+    """Pick a game of a PGN database by number; returns its PGN text, or None"""
+    try:
+        index = get_pgn_index(path)
+    except (OSError, ValueError) as e:
+        st.error(f"Could not open {path}: {str(e)}")
+        return None
+    if len(index) == 0:
+        st.warning(f"No games found in {path}")
+        return None
+
+    number = st.number_input(f"Game (1-{len(index)})", min_value=1, max_value=len(index), value=1, step=1)
+    summary = index.summary(number - 1)
+    st.caption(
+        f"{summary['White'] or '?'} vs {summary['Black'] or '?'}, {summary['Result'] or '*'}"
+        f" ({summary['Event'] or '?'}, {summary['Date'] or '?'})"
     )
-    analysis_thread.daemon = True
-    analysis_thread.start()
+    show_position_matches(path, index)
+    return index.game_text(number - 1)
 
-def run_analysis(pgn_text, depth):
-    """Run the analysis in a background thread"""
+def show_position_matches(path, index):
+    """List the database games reaching the board position, if the database has a position index"""
     try:
-        # Perform analysis
-        result = analyze_game_in_background(
-            pgn_text,
-            depth,
-            st.session_state.services
-        )
-        
-        # Store results
-        if "error" not in result:
-            # Store position analyses for quick access
-            if "position_analyses" in result:
-                st.session_state.analysis_results = result["position_analyses"]
-            
-            # Store UCI moves for better navigation
-            if "uci_moves" in result:
-                st.session_state.uci_moves = result["uci_moves"]
+        positions = get_position_index(path)
+    except (OSError, ValueError) as e:
+        add_debug_info(f"Could not open the position index of {path}: {str(e)}")
+        return
+    if positions is None:
+        return
+
+    matches = {}
+    for game_id, ply in positions.lookup(st.session_state.board):
+        # A PGN rewritten since the index was built may have fewer games
+        if game_id < len(index):
+            matches.setdefault(game_id, ply)
+    st.caption(f"{len(matches)} of {positions.games} games reach the board position")
+    lines = []
+    for game_id, ply in list(matches.items())[:POSITION_MATCHES_SHOWN]:
+        summary = index.summary(game_id)
+        lines.append(f"Game {game_id + 1}, ply {ply}: {summary['White'] or '?'} vs {summary['Black'] or '?'}")
+    if lines:
+        st.caption("  \n".join(lines))
+
+def show_opening_explorer(path):
+    """The continuations played from the board position, with their results"""
+    try:
+        explorer = get_opening_explorer(path)
+    except (OSError, ValueError) as e:
+        add_debug_info(f"Could not open the opening explorer {path}: {str(e)}")
+        return
+    if explorer is None:
+        return
+
+    st.subheader("Opening Explorer")
+    board = st.session_state.board
+    stats = explorer.lookup(board)
+    if not stats["moves"]:
+        st.caption(f"No games of the explorer's {explorer.games} reach this position within {explorer.max_plies} plies")
+        return
+
+    def percent(count, games):
+        return round(100 * count / games, 1)
+
+    st.caption(f"{stats['games']} games: White {percent(stats['white'], stats['games'])}%, "
+               f"draws {percent(stats['draws'], stats['games'])}%, Black {percent(stats['black'], stats['games'])}%")
+    rows = []
+    for move in stats["moves"]:
+        played = chess.Move.from_uci(move["uci"])
+        # A Zobrist key collision could pair the position with moves from another one
+        if not board.is_legal(played):
+            continue
+        rows.append({
+            "move": board.san(played),
+            "games": move["games"],
+            "white %": percent(move["white"], move["games"]),
+            "draw %": percent(move["draws"], move["games"]),
+            "black %": percent(move["black"], move["games"]),
+            "avg rating": move["average_rating"]
+        })
+    st.dataframe(rows, hide_index=True)
+
+def start_analysis(pgn_text, depth):
+    """Submit the game to the background job scheduler"""
+    scheduler = st.session_state.services["analysis_job_scheduler"]
+    if analysis_in_progress():
+        scheduler.cancel(st.session_state.analysis_job_id)
+
+    st.session_state.game_info = None
+    st.session_state.analysis_error = None
+    st.session_state.analysis_job_id = scheduler.submit(pgn_text, depth, profile=st.session_state.profile_requests)
+    add_debug_info(f"Queued analysis job {st.session_state.analysis_job_id}")
+
+def analysis_status():
+    """Status of this session's analysis job, or None if there is none"""
+    if not st.session_state.analysis_job_id:
+        return None
+    return st.session_state.services["analysis_job_scheduler"].status(st.session_state.analysis_job_id)
+
+def analysis_in_progress():
+    status = analysis_status()
+    return status is not None and status["status"] in ("queued", "running")
+
+@st.fragment(run_every=ANALYSIS_POLL_INTERVAL)
+def show_analysis_progress():
+    """Poll the analysis job, and rerun the page once its result is in"""
+    # Fragment reruns skip the top of the script
+    telemetry.use_buffer(st.session_state.trace)
+    status = analysis_status()
+    if status is None:
+        # A failed job's message stays up until the next analysis starts
+        if st.session_state.analysis_error:
+            st.error(st.session_state.analysis_error)
+        return
+    if st.session_state.game_info is not None:
+        return
+
+    scheduler = st.session_state.services["analysis_job_scheduler"]
+    if status["status"] == "completed":
+        st.session_state.game_info = scheduler.result(status["id"])
+        st.session_state.analysis_job_id = None
+        add_debug_info("Analysis completed and stored in session state")
+        st.rerun()
+    elif status["status"] == "failed":
+        # The job is consumed so its error is not reported again and a new analysis can start
+        st.session_state.analysis_job_id = None
+        st.session_state.analysis_error = status["error"]
+        st.error(status["error"])
+        add_debug_info(f"Analysis error: {status['error']}")
+    elif status["status"] == "cancelled":
+        st.session_state.analysis_job_id = None
+        st.warning("Analysis cancelled")
+    else:
+        done, total = status["progress"]["done"], status["progress"]["total"]
+        if status["status"] == "queued" or not total:
+            st.progress(0, text="Analysis queued... Please wait.")
         else:
-            add_debug_info(f"Analysis error: {result['error']}")
-        
-        st.session_state.analysis_in_progress = False
-    
-    except Exception as e:
-        add_debug_info(f"Error in analysis thread: {str(e)}")
-        st.session_state.analysis_in_progress = False
+            st.progress(done / total, text=f"Analyzing positions: {done}/{total}")
+        if st.button("Cancel Analysis"):
+            scheduler.cancel(status["id"])
+            add_debug_info(f"Cancelled analysis job {status['id']}")
 
 # Handle keyboard navigation
 def handle_keyboard_navigation():
@@ -463,6 +604,10 @@ def main():
 
         # Text area for PGN input
         pgn_text = st.text_area("Or paste PGN here", height=150)
+
+        # A PGN database on the server, opened by game number without reading the whole file
+        database_path = st.text_input("Or open a PGN database on the server", value=os.getenv("PGN_DATABASE_PATH", ""))
+        database_game = select_database_game(database_path) if database_path else None
         # Analysis depth selection
         st.session_state.analysis_depth = st.radio(
             "Analysis Depth",
@@ -478,6 +623,16 @@ def main():
         st.session_state.show_arrows = st.checkbox("Show Suggested Moves", value=st.session_state.show_arrows)
         st.session_state.show_heatmap = st.checkbox("Show Control Heatmap", value=st.session_state.show_heatmap)
         st.session_state.show_influence = st.checkbox("Show Piece Influence", value=st.session_state.show_influence)
+        st.session_state.prerender_boards = st.checkbox(
+            "Pre-render All Positions",
+            value=st.session_state.prerender_boards,
+            help="Render every move of the game in the background so stepping through it is instant"
+        )
+        st.session_state.profile_requests = st.checkbox(
+            "Profile Requests",
+            value=st.session_state.profile_requests,
+            help="Run analyses and page renders under the profiler; the reports are under Show Debug Information"
+        )
 
         # Analyze button
         analyze_button = st.button("Analyze Game", type="primary")
@@ -485,24 +640,26 @@ def main():
         # Reset button
         if st.button("Reset Analysis"):
             st.session_state.board = chess.Board()
-            st.session_state.moves = []
-            st.session_state.move_notations = []
+            st.session_state.game = CompactGame()
             st.session_state.current_move_index = -1
             st.session_state.game_info = None
-            st.session_state.positions = []
-            st.session_state.analysis_in_progress = False
+            if st.session_state.analysis_job_id:
+                st.session_state.services["analysis_job_scheduler"].cancel(st.session_state.analysis_job_id)
+                st.session_state.analysis_job_id = None
+            st.session_state.analysis_error = None
             st.session_state.analysis_results = {}
-            st.session_state.uci_moves = []
             add_debug_info("Analysis reset")
             st.experimental_rerun()
 
     # Process uploaded file or pasted PGN
-    if analyze_button and (uploaded_file is not None or pgn_text):
-        st.session_state.analysis_in_progress = True
+    if analyze_button and (uploaded_file is not None or pgn_text or database_game):
         add_debug_info("Starting analysis...")
         if uploaded_file is not None:
             pgn_text = uploaded_file.getvalue().decode("utf-8")
             add_debug_info("Loaded PGN from uploaded file")
+        elif not pgn_text:
+            pgn_text = database_game
+            add_debug_info(f"Loaded PGN from {database_path}")
 
         # Check for FEN tag
         fen_match = re.search(r'\[FEN "(.+?)"\]', pgn_text)
@@ -524,14 +681,7 @@ def main():
         if not game:
             st.error("Invalid PGN format")
             add_debug_info("Invalid PGN format")
-            st.session_state.analysis_in_progress = False
         else:
-            # Extract moves and positions
-            moves = []
-            positions = []
-            move_notations = []
-            uci_moves = []
-
             # Set up board with custom FEN if provided
             if custom_fen:
                 try:
@@ -547,17 +697,11 @@ def main():
             else:
                 board = game.board()
 
-            positions.append(board.fen())
-
+            # Extract moves; positions, SAN and UCI are derived from them on demand
+            compact_game = CompactGame(board.fen())
             for move in game.mainline_moves():
                 try:
-                    san_move = board.san(move)
-                    uci_move = move.uci()
-                    move_notations.append(san_move)
-                    uci_moves.append(uci_move)
-                    board.push(move)
-                    moves.append(move)
-                    positions.append(board.fen())
+                    compact_game.push(move)
                 except Exception as e:
                     add_debug_info(f"Error processing move: {str(e)}")
                     continue
@@ -577,40 +721,28 @@ def main():
                 st.session_state.board = chess.Board()
                 add_debug_info(f"Set initial board position: {st.session_state.board.fen()}")
 
-            st.session_state.moves = moves
-            st.session_state.move_notations = move_notations
-            st.session_state.positions = positions
+            st.session_state.game = compact_game
             st.session_state.current_move_index = -1
-            st.session_state.uci_moves = uci_moves
 
-            add_debug_info(f"Loaded game with {len(moves)} moves")
-
-            # Run analysis directly (no threading to avoid session state issues)
-            result = analyze_game_in_background(pgn_text, st.session_state.analysis_depth, st.session_state.services)
-
-            # Store analysis result
-            if "error" not in result:
-                st.session_state.game_info = result
-                add_debug_info("Analysis completed and stored in session state")
-
-                # Store position analyses for quick access
-                #if "position_analyses" in result:
-                 #   st.session_state.analysis_results = result["position_analyses"]
-
-                # Store UCI moves for better navigation
-                if "uci_moves" in result:
-                    st.session_state.uci_moves = result["uci_moves"]
-            else:
-                add_debug_info(f"Analysis error: {result['error']}")
+            add_debug_info(f"Loaded game with {len(compact_game)} moves ({compact_game.nbytes} bytes)")
 
-            st.session_state.analysis_in_progress = False
+            # Analyze in the background; the page keeps responding while the job runs
+            start_analysis(pgn_text, st.session_state.analysis_depth)
 
     # Main content area
     col1, col2 = st.columns([1, 1])
 
     with col1:
         # Display navigation controls and chessboard if moves are available
-        if st.session_state.moves:
+        if len(st.session_state.game):
+            game = st.session_state.game
+
+            def go_to(index):
+                # Rebuild the board from the nearest snapshot instead of parsing a FEN
+                st.session_state.current_move_index = index
+                st.session_state.board = game.board_at(index + 1)
+                add_debug_info(f"Moved to move index: {index}")
+
             # Navigation controls
             st.subheader("Navigation")
             nav_col1, nav_col2, nav_col3, nav_col4, nav_col5 = st.columns(5)
@@ -618,116 +750,37 @@ def main():
             with nav_col1:
                 if st.button("⏮️ Start", key="start_button"):
                     add_debug_info("Start button clicked")
-                    st.session_state.current_move_index = -1
-
-                    # Reset board to initial position
-                    if st.session_state.positions and len(st.session_state.positions) > 0:
-                        try:
-                            # Get the initial FEN position
-                            initial_fen = st.session_state.positions[0]
-                            st.session_state.board = chess.Board(initial_fen)
-                            add_debug_info(f"Set board to initial position: {initial_fen}")
-                        except Exception as e:
-                            add_debug_info(f"Error setting initial board position: {str(e)}")
-                            st.session_state.board = chess.Board()
+                    go_to(-1)
 
             with nav_col2:
                 if st.button("⏪ Previous", key="prev_button"):
                     add_debug_info("Previous button clicked")
                     if st.session_state.current_move_index >= 0:
-                        st.session_state.current_move_index -= 1
-                        add_debug_info(f"Moved to move index: {st.session_state.current_move_index}")
-
-                        # Set board directly to the position after this move
-                        position_index = st.session_state.current_move_index + 1
-                        if position_index >= 0 and position_index < len(st.session_state.positions):
-                            try:
-                                st.session_state.board = chess.Board(st.session_state.positions[position_index])
-                                add_debug_info(f"Set board to position {position_index}: {st.session_state.positions[position_index]}")
-                            except Exception as e:
-                                add_debug_info(f"Error setting board position: {str(e)}")
-                                # Fallback: reset and replay moves
-                                try:
-                                    st.session_state.board = chess.Board(st.session_state.positions[0])
-                                    for i in range(st.session_state.current_move_index + 1):
-                                        st.session_state.board.push(st.session_state.moves[i])
-                                    add_debug_info("Fallback: Reset and replayed moves")
-                                except Exception as e2:
-                                    add_debug_info(f"Error in fallback move replay: {str(e2)}")
+                        go_to(st.session_state.current_move_index - 1)
                     else:
                         add_debug_info("Already at first move")
-                        # Ensure we're at the initial position
-                        if st.session_state.positions and len(st.session_state.positions) > 0:
-                            try:
-                                st.session_state.board = chess.Board(st.session_state.positions[0])
-                                add_debug_info(f"Reset to initial position: {st.session_state.positions[0]}")
-                            except Exception as e:
-                                add_debug_info(f"Error resetting to initial position: {str(e)}")
 
             with nav_col3:
                 current_move = st.session_state.current_move_index + 1
-                total_moves = len(st.session_state.moves)
+                total_moves = len(game)
                 st.markdown(f"<div class='move-display'>Move {current_move}/{total_moves}</div>", unsafe_allow_html=True)
 
             with nav_col4:
                 if st.button("⏩ Next", key="next_button"):
                     add_debug_info("Next button clicked")
-                    if st.session_state.current_move_index < len(st.session_state.moves) - 1:
-                        st.session_state.current_move_index += 1
-                        add_debug_info(f"Moved to move index: {st.session_state.current_move_index}")
-
-                        # Set board directly to the position after this move
-                        position_index = st.session_state.current_move_index + 1
-                        if position_index < len(st.session_state.positions):
-                            try:
-                                st.session_state.board = chess.Board(st.session_state.positions[position_index])
-                                add_debug_info(f"Set board to position {position_index}: {st.session_state.positions[position_index]}")
-                            except Exception as e:
-                                add_debug_info(f"Error setting board position: {str(e)}")
-                                # Fallback: try to apply the move to current board
-                                try:
-                                    move = st.session_state.moves[st.session_state.current_move_index]
-                                    st.session_state.board.push(move)
-                                    add_debug_info(f"Applied move: {move}")
-                                except Exception as e2:
-                                    add_debug_info(f"Error applying move: {str(e2)}")
-                                    # Last resort: reset and replay all moves
-                                    try:
-                                        st.session_state.board = chess.Board(st.session_state.positions[0])
-                                        for i in range(st.session_state.current_move_index + 1):
-                                            st.session_state.board.push(st.session_state.moves[i])
-                                        add_debug_info("Last resort: Reset and replayed all moves")
-                                    except Exception as e3:
-                                        add_debug_info(f"Error in last resort move replay: {str(e3)}")
+                    if st.session_state.current_move_index < len(game) - 1:
+                        go_to(st.session_state.current_move_index + 1)
                     else:
                         add_debug_info("Already at last move")
 
             with nav_col5:
                 if st.button("⏭️ End", key="end_button"):
                     add_debug_info("End button clicked")
-                    st.session_state.current_move_index = len(st.session_state.moves) - 1
-                    add_debug_info(f"Moved to final move index: {st.session_state.current_move_index}")
-
-                    # Set board directly to the final position
-                    if st.session_state.positions and len(st.session_state.positions) > st.session_state.current_move_index + 1:
-                        try:
-                            final_position = st.session_state.positions[-1]
-                            st.session_state.board = chess.Board(final_position)
-                            add_debug_info(f"Set board to final position: {final_position}")
-                        except Exception as e:
-                            add_debug_info(f"Error setting final board position: {str(e)}")
-                            # Fallback: reset and replay all moves
-                            try:
-                                st.session_state.board = chess.Board(st.session_state.positions[0])
-                                for move in st.session_state.moves:
-                                    st.session_state.board.push(move)
-                                add_debug_info("Fallback: Reset and replayed all moves to final position")
-                            except Exception as e2:
-                                add_debug_info(f"Error in fallback move replay: {str(e2)}")
+                    go_to(len(game) - 1)
 
             # Display current move in algebraic notation
-            if st.session_state.current_move_index >= 0 and len(st.session_state.move_notations) > st.session_state.current_move_index:
-                current_notation = st.session_state.move_notations[st.session_state.current_move_index]
+            if st.session_state.current_move_index >= 0:
+                current_notation = game.san(st.session_state.current_move_index)
                 move_number = (st.session_state.current_move_index // 2) + 1
                 is_white = st.session_state.current_move_index % 2 == 0
                 color = "White" if is_white else "Black"
@@ -740,13 +793,47 @@ def main():
 
         # Get last move for highlighting
         last_move = None
-        if st.session_state.current_move_index >= 0 and st.session_state.moves:
-            last_move = st.session_state.moves[st.session_state.current_move_index]
+        if st.session_state.current_move_index >= 0 and len(st.session_state.game):
+            last_move = st.session_state.game.move(st.session_state.current_move_index)
             add_debug_info(f"Last move for highlighting: {last_move}")
 
+        if st.session_state.prerender_boards and len(st.session_state.game) and st.session_state.services:
+            ensure_prerender()
+
+        # The board is drawn into a placeholder so it can be refined while the engine searches
+        board_placeholder = st.empty()
+
+        def display_board(suggested_moves):
+            try:
+                if st.session_state.show_arrows and suggested_moves and st.session_state.services:
+                    # Render with arrows for suggested moves
+                    add_debug_info("Rendering board with arrows")
+                    board_svg = st.session_state.services["visualization_service"].render_board_with_arrows(
+                        st.session_state.board,
+                        moves=suggested_moves,
+                        last_move=last_move,
+                        flip=st.session_state.flip_board
+                    )
+                else:
+                    # Render standard board
+                    add_debug_info("Rendering standard board")
+                    board_svg = st.session_state.services["visualization_service"].render_board(
+                        st.session_state.board,
+                        last_move=last_move,
+                        flip=st.session_state.flip_board
+                    )
+
+                # Display the board
+                board_placeholder.markdown(board_svg, unsafe_allow_html=True)
+                add_debug_info("Board displayed successfully")
+            except Exception as e:
+                add_debug_info(f"Error displaying board: {str(e)}")
+                st.error(f"Error displaying chessboard: {str(e)}")
+
         # Get suggested moves for arrows
         suggested_moves = []
-        if st.session_state.show_arrows and st.session_state.positions and st.session_state.services:
+        display_board(suggested_moves)
+        if st.session_state.show_arrows and len(st.session_state.game) and st.session_state.services:
             try:
                 current_fen = st.session_state.board.fen()
                 add_debug_info(f"Getting suggested moves for position: {current_fen}")
@@ -754,77 +841,52 @@ def main():
                 # Check if we already have analysis for this position
                 if current_fen in st.session_state.analysis_results:
                     eval_result = st.session_state.analysis_results[current_fen]
+                    if "error" not in eval_result and "top_moves" in eval_result:
+                        suggested_moves = top_moves_of(eval_result)
+                        display_board(suggested_moves)
                 else:
-                    # Get stockfish evaluation for this position
-                    eval_result = st.session_state.services["stockfish_service"].analyze_position(current_fen, multi_pv=3)
-                    # Store for future use
-                    st.session_state.analysis_results[current_fen] = eval_result
-
-                if "error" not in eval_result and "top_moves" in eval_result:
-                    for move_info in eval_result["top_moves"]:
-                        # Extract first move from UCI format
-                        first_move = move_info["Move"]
-                        try:
-                            move = chess.Move.from_uci(first_move)
-                            suggested_moves.append(move)
-                            add_debug_info(f"Added suggested move: {first_move}")
-                        except ValueError as e:
-                            add_debug_info(f"Error parsing suggested move {first_move}: {str(e)}")
-                else:
-                    add_debug_info(f"Error getting suggested moves: {eval_result.get('error', 'Unknown error')}")
+                    # Stream the stockfish evaluation, redrawing the arrows as the search deepens
+                    stream = st.session_state.services["stockfish_service"].stream_analysis(
+                        current_fen,
+                        multi_pv=3,
+                        time_limit=INTERACTIVE_ANALYSIS_TIME,
+                        checkout_timeout=INTERACTIVE_CHECKOUT_TIMEOUT
+                    )
+                    for eval_result in stream:
+                        if eval_result.get("busy"):
+                            st.caption("The engine is busy with another position; suggested moves will show on the next move.")
+                            break
+                        if "error" in eval_result or "top_moves" not in eval_result:
+                            add_debug_info(f"Error getting suggested moves: {eval_result.get('error', 'Unknown error')}")
+                            break
+                        suggested_moves = top_moves_of(eval_result)
+                        display_board(suggested_moves)
+                        if eval_result["final"]:
+                            # Store for future use
+                            st.session_state.analysis_results[current_fen] = eval_result
             except Exception as e:
                 add_debug_info(f"Error getting suggested moves: {str(e)}")
 
-        # Render the chessboard
-        try:
-            if st.session_state.show_arrows and suggested_moves and st.session_state.services:
-                # Render with arrows for suggested moves
-                add_debug_info("Rendering board with arrows")
-                board_svg = st.session_state.services["visualization_service"].render_board_with_arrows(
-                    st.session_state.board,
-                    moves=suggested_moves,
-                    last_move=last_move,
-                    flip=st.session_state.flip_board
-                )
-            else:
-                # Render standard board
-                add_debug_info("Rendering standard board")
-                board_svg = chess.svg.board(
-                    st.session_state.board,
-                    lastmove=last_move,
-                    size=400,
-                    flipped=st.session_state.flip_board
-                )
-
-            # Display the board
-            st.markdown(board_svg, unsafe_allow_html=True)
-            add_debug_info("Board displayed successfully")
-        except Exception as e:
-            add_debug_info(f"Error displaying board: {str(e)}")
-            st.error(f"Error displaying chessboard: {str(e)}")
-
         # Display heatmaps if enabled
         if (st.session_state.show_heatmap or st.session_state.show_influence) and st.session_state.services:
             st.subheader("Board Analysis")
 
             viz_col1, viz_col2 = st.columns(2)
+            control_maps = current_control_maps()
 
             with viz_col1:
                 if st.session_state.show_heatmap:
                     st.markdown("**Board Control Heatmap**")
                     # Generate heatmap for white
                     try:
-                        white_control = st.session_state.services["visualization_service"].generate_control_heatmap(
-                            st.session_state.board,
-                            perspective=chess.WHITE
-                        )
-                        white_heatmap_file = st.session_state.services["visualization_service"].plot_heatmap(
+                        white_control = control_maps[int(chess.WHITE)]
+                        white_heatmap_svg = st.session_state.services["visualization_service"].plot_heatmap(
                             white_control,
                             title="White's Board Control",
                             perspective="White"
                         )
-                        if white_heatmap_file:
-                            st.image(white_heatmap_file)
+                        if white_heatmap_svg:
+                            st.markdown(svg_to_html(white_heatmap_svg), unsafe_allow_html=True)
                             add_debug_info("White's heatmap displayed successfully")
                         else:
                             st.error("Error generating White's heatmap")
@@ -838,17 +900,14 @@ def main():
                     st.markdown("**Board Control Heatmap**")
                     # Generate heatmap for black
                     try:
-                        black_control = st.session_state.services["visualization_service"].generate_control_heatmap(
-                            st.session_state.board,
-                            perspective=chess.BLACK
-                        )
-                        black_heatmap_file = st.session_state.services["visualization_service"].plot_heatmap(
+                        black_control = control_maps[int(chess.BLACK)]
+                        black_heatmap_svg = st.session_state.services["visualization_service"].plot_heatmap(
                             black_control,
                             title="Black's Board Control",
                             perspective="Black"
                         )
-                        if black_heatmap_file:
-                            st.image(black_heatmap_file)
+                        if black_heatmap_svg:
+                            st.markdown(svg_to_html(black_heatmap_svg), unsafe_allow_html=True)
                             add_debug_info("Black's heatmap displayed successfully")
                         else:
                             st.error("Error generating Black's heatmap")
@@ -861,16 +920,14 @@ def main():
                 st.markdown("**Piece Influence Map**")
                 # Generate influence map
                 try:
-                    influence_grid = st.session_state.services["visualization_service"].generate_piece_influence_map(
-                        st.session_state.board
-                    )
-                    influence_file = st.session_state.services["visualization_service"].plot_heatmap(
+                    influence_grid = control_maps[int(chess.WHITE)] - control_maps[int(chess.BLACK)]
+                    influence_svg = st.session_state.services["visualization_service"].plot_heatmap(
                         influence_grid,
                         title="Piece Influence (Red: White, Blue: Black)",
                         perspective="Neutral"
                     )
-                    if influence_file:
-                        st.image(influence_file)
+                    if influence_svg:
+                        st.markdown(svg_to_html(influence_svg), unsafe_allow_html=True)
                         add_debug_info("Influence map displayed successfully")
                     else:
                         st.error("Error generating influence map")
@@ -880,10 +937,15 @@ def main():
                     add_debug_info(f"Error generating influence map: {str(e)}")
 
     with col2:
-        # Show loading indicator if analysis is in progress
-        if st.session_state.analysis_in_progress:
-            st.info("Analysis in progress... Please wait.")
-            add_debug_info("Showing analysis in progress indicator")
+        # Show progress while the analysis job runs
+        show_analysis_progress()
+
+        # Opening statistics of the board position, from an explorer file built offline
+        explorer_path = os.getenv("OPENING_EXPLORER_PATH") or (
+            default_explorer_path(database_path) if database_path else None
+        )
+        if explorer_path:
+            show_opening_explorer(explorer_path)
 
         # Display analysis results if available
         if st.session_state.game_info:
@@ -899,7 +961,7 @@ def main():
 
 
             # Display current position analysis
-            if st.session_state.board and st.session_state.moves and st.session_state.services:
+            if st.session_state.board and len(st.session_state.game) and st.session_state.services:
                 st.subheader("Current Position Analysis")
                 current_fen = st.session_state.board.fen()
                 add_debug_info(f"Analyzing current position: {current_fen}")
@@ -959,8 +1021,60 @@ def main():
         # Debug information (can be toggled)
         if st.checkbox("Show Debug Information"):
             st.subheader("Debug Information")
-            debug_text = "\n".join(st.session_state.debug_info)
+            debug_text = "\n".join(st.session_state.trace.messages())
             st.markdown(f"<div class='debug-info'>{debug_text}</div>", unsafe_allow_html=True)
+            spans = list(st.session_state.trace.spans)
+            if spans:
+                st.markdown("**Recent Spans**")
+                st.dataframe([
+                    {
+                        "span": span["name"],
+                        "ms": round(span["duration"] * 1000, 1),
+                        "status": span["status"],
+                        "trace": span["trace_id"],
+                        "attributes": str(span["attributes"])
+                    }
+                    for span in reversed(spans[-50:])
+                ])
+            st.download_button(
+                "Download Metrics",
+                telemetry.METRICS.render_prometheus(),
+                file_name="chessailytics_metrics.prom",
+                mime="text/plain"
+            )
+            if st.session_state.services:
+                st.markdown("**Startup Timings (seconds)**")
+                st.json(st.session_state.services.startup_report())
+            if st.session_state.game_info and "profile" in st.session_state.game_info:
+                show_profile("Analysis Profile", st.session_state.game_info["profile"], "analysis.prof")
+            if st.session_state.render_profile:
+                show_profile("Previous Page Render Profile", st.session_state.render_profile, "render.prof")
+
+def show_profile(title, report, file_name):
+    """Top functions of a profile report, with the full profile as a download"""
+    st.markdown(f"**{title}**")
+    if "error" in report:
+        st.warning(report["error"])
+        return
+    st.caption(f"{report['wall_seconds']:.3f}s wall clock, {report['total_calls']} calls, sorted by {report['sort']} time")
+    st.code(profiling.format_report(report), language=None)
+    st.download_button(
+        f"Download {title}",
+        report["stats"],
+        file_name=file_name,
+        mime="application/octet-stream",
+        help="Open with `python -m pstats` or snakeviz"
+    )
+
+def run_page():
+    """Render the page, under the profiler when this session profiles requests"""
+    if not st.session_state.profile_requests:
+        main()
+        return
+    with profiling.Profiler() as profiler:
+        main()
+    # Shown on the next run; this run's page is already drawn
+    st.session_state.render_profile = profiler.report()
 
 if __name__ == "__main__":
-    main()
+    run_page()
@@ -0,0 +1,164 @@
+"""
+Batch analysis of multi-game PGN files.
+
+Indexes a PGN file (see pgn_index), analyzes the games on a pool of worker
+processes and writes one JSON line per game:
+
+    python batch_analysis.py tournament.pgn -o results.jsonl --workers 8
+
+Workers are sent game numbers only and read each game's bytes from the
+memory-mapped file themselves, so even multi-gigabyte files are never read
+into memory as a whole.
+
+The output file doubles as the checkpoint: every line carries the index of
+its game in the PGN file, so rerunning the same command after a crash skips
+the games that already have a result and only analyzes the rest.
+"""
+import os
+import sys
+import json
+import argparse
+import logging
+from multiprocessing.util import Finalize
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, ALL_COMPLETED, wait
+
+from pgn_index import PgnIndex
+
+# Configure logging
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+# Services and PGN index owned by each worker process, created once by _init_worker
+_worker_services = None
+_worker_index = None
+
+
+def _init_worker(pgn_path, index_path):
+    global _worker_services, _worker_index
+    from chess_analysis import initialize_services
+    _worker_services = initialize_services()
+    _worker_index = PgnIndex(pgn_path, index_path)
+    # Worker processes skip atexit handlers but run these before waiting on threads;
+    # the engines' threads would otherwise keep the worker, and the pool, from exiting
+    Finalize(None, _worker_services.close, exitpriority=10)
+
+
+def _analyze(game_index, analysis_depth, include_ai):
+    """Analyze a single game inside a worker process"""
+    try:
+        result = _worker_services["game_analysis_service"].analyze_game(
+            _worker_index.game_text(game_index),
+            analysis_depth,
+            include_ai=include_ai
+        )
+    except Exception as e:
+        result = {"error": f"Analysis error: {str(e)}"}
+    return {"game_index": game_index, **result}
+
+
+def iter_games(pgn_path):
+    """Yield (index, pgn_text) for every game in the file, reading one game at a time"""
+    with PgnIndex(pgn_path) as index:
+        yield from index.iter_games()
+
+
+def load_checkpoint(output_path):
+    """
+    Return the game indices that already have a result in the output file.
+
+    A line cut short by a crash is dropped from the file so the game is
+    analyzed again and the file stays valid JSON lines.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+
+    valid_bytes = 0
+    with open(output_path, "rb") as output:
+        for line in output:
+            try:
+                done.add(json.loads(line)["game_index"])
+            except (ValueError, KeyError):
+                break
+            valid_bytes += len(line)
+
+    if valid_bytes < os.path.getsize(output_path):
+        logger.warning(f"Discarding incomplete trailing data in {output_path}")
+        with open(output_path, "r+b") as output:
+            output.truncate(valid_bytes)
+
+    return done
+
+
+def run_batch(pgn_path, output_path, workers=None, analysis_depth="standard", include_ai=False):
+    """
+    Analyze every game of a PGN file, appending one JSON line per game to output_path.
+
+    Returns:
+        The number of games analyzed in this run
+    """
+    workers = workers or os.cpu_count() or 1
+    done = load_checkpoint(output_path)
+    if done:
+        logger.info(f"Resuming: {len(done)} games already analyzed")
+
+    analyzed = 0
+    # Keep a bounded number of games in flight so huge files are never fully in memory
+    max_in_flight = workers * 2
+    in_flight = set()
+
+    # Built (or reused) here once, so the workers only map it
+    index = PgnIndex(pgn_path)
+
+    with index, open(output_path, "a", encoding="utf-8") as output, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                initargs=(pgn_path, index.index_path)) as executor:
+
+        def drain(return_when):
+            nonlocal analyzed
+            finished, _ = wait(in_flight, return_when=return_when)
+            for future in finished:
+                in_flight.remove(future)
+                result = future.result()
+                output.write(json.dumps(result) + "\n")
+                # Flush every line so the output is a usable checkpoint at all times
+                output.flush()
+                analyzed += 1
+                if "error" in result:
+                    logger.warning(f"Game {result['game_index']}: {result['error']}")
+                if analyzed % 100 == 0:
+                    logger.info(f"Analyzed {analyzed} games")
+
+        for game_index in range(len(index)):
+            if game_index in done:
+                continue
+            in_flight.add(executor.submit(_analyze, game_index, analysis_depth, include_ai))
+            if len(in_flight) >= max_in_flight:
+                drain(FIRST_COMPLETED)
+
+        if in_flight:
+            drain(ALL_COMPLETED)
+
+    logger.info(f"Batch complete: analyzed {analyzed} games, {len(done)} skipped from checkpoint")
+    return analyzed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Analyze every game of a PGN file in parallel")
+    parser.add_argument("pgn", help="PGN file with one or more games")
+    parser.add_argument("-o", "--output", required=True, help="JSON lines output file (also used to resume)")
+    parser.add_argument("-w", "--workers", type=int, default=None, help="Worker processes (default: CPU count)")
+    parser.add_argument("--depth", choices=["minimal", "standard", "deep"], default="standard",
+                        help="Analysis depth passed to GameAnalysisService.analyze_game")
+    parser.add_argument("--with-ai", action="store_true", help="Also request LLM analyses from Groq")
+    args = parser.parse_args(argv)
+
+    run_batch(args.pgn, args.output, workers=args.workers, analysis_depth=args.depth, include_ai=args.with_ai)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,343 @@
+"""
+Performance benchmarks for the analysis pipeline.
+
+Times each stage of the pipeline separately over fixed corpora of short,
+long and pathological games (data/benchmarks/*.pgn) and writes the timings
+as JSON, so that two runs can be compared:
+
+    python benchmarks.py run -o before.json
+    # ... change something ...
+    python benchmarks.py run -o after.json
+    python benchmarks.py compare before.json after.json
+
+Every stage gets one untimed warm-up run per corpus, so one-off costs like
+loading the ECO table are left out. Caches that would make later repeats
+free, such as the rendered SVG caches, are cleared before every repeat.
+"""
+import io
+import os
+import sys
+import json
+import time
+import platform
+import argparse
+import statistics
+import subprocess
+import logging
+import chess
+import chess.pgn
+
+os.environ.setdefault("GROQ_API_KEY", "benchmark")
+
+from chess_analysis import (
+    StockfishService, OpeningDBService, GameAnalysisService, DEFAULT_STOCKFISH_PATH
+)
+from compact_game import CompactGame
+from visualization_service import VisualizationService
+
+# Configure logging
+logging.basicConfig(level=logging.WARNING)
+logger = logging.getLogger(__name__)
+
+DEFAULT_CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "benchmarks")
+CORPORA = ("short", "long", "pathological")
+DEFAULT_REPEATS = 5
+
+# Engine depth for the end-to-end stage; low enough to keep a run to minutes
+DEFAULT_ENGINE_DEPTH = 10
+
+# A stage counts as slower (or faster) in a comparison beyond this ratio of medians
+REGRESSION_THRESHOLD = 1.10
+
+
+def load_corpus(name, corpus_dir=DEFAULT_CORPUS_DIR):
+    """
+    Read a corpus file and prepare everything the stages take as input.
+
+    Returns:
+        A dict with the corpus "name", its raw "text", the PGN "texts" of the
+        single games, and per game its "sans" and "boards" (one per ply)
+    """
+    with open(os.path.join(corpus_dir, f"{name}.pgn"), encoding="utf-8") as f:
+        text = f.read()
+
+    texts, sans, boards = [], [], []
+    pgn = io.StringIO(text)
+    while True:
+        start = pgn.tell()
+        game = chess.pgn.read_game(pgn)
+        if game is None:
+            break
+        texts.append(text[start:pgn.tell()])
+        compact_game = CompactGame.from_pgn_game(game)
+        sans.append(compact_game.san_moves())
+        boards.append(list(compact_game.boards()))
+
+    return {"name": name, "text": text, "texts": texts, "sans": sans, "boards": boards}
+
+
+def create_services(engine_path=None, engine_depth=DEFAULT_ENGINE_DEPTH):
+    """Services for the benchmark, without the shared caches that would hide the work"""
+    opening_db_service = OpeningDBService()
+    # One single-threaded engine searches deterministically, so runs stay comparable
+    stockfish_service = StockfishService(
+        stockfish_path=engine_path or os.getenv("STOCKFISH_PATH") or DEFAULT_STOCKFISH_PATH,
+        depth=engine_depth,
+        threads=1,
+        cache=None
+    )
+    return {
+        "stockfish_service": stockfish_service,
+        "opening_db_service": opening_db_service,
+        "visualization_service": VisualizationService(),
+        "game_analysis_service": GameAnalysisService(stockfish_service, None, opening_db_service)
+    }
+
+
+# Stages: each runs once over a corpus and returns the number of items it processed
+
+def bench_pgn_parse(corpus, services, options):
+    pgn = io.StringIO(corpus["text"])
+    games = 0
+    while chess.pgn.read_game(pgn) is not None:
+        games += 1
+    return games
+
+
+def bench_identify_opening(corpus, services, options):
+    for sans in corpus["sans"]:
+        services["opening_db_service"].identify_opening(sans)
+    return len(corpus["sans"])
+
+
+def bench_control_heatmaps(corpus, services, options):
+    """The per-position heatmap path used while stepping through a game"""
+    visualization_service = services["visualization_service"]
+    positions = 0
+    for boards in corpus["boards"]:
+        for board in boards:
+            visualization_service.generate_control_heatmap(board, chess.WHITE)
+            visualization_service.generate_piece_influence_map(board)
+            positions += 1
+    return positions
+
+
+def bench_game_control_maps(corpus, services, options):
+    """The batched heatmap path over every position of a game"""
+    for boards in corpus["boards"]:
+        services["visualization_service"].generate_game_control_maps(boards)
+    return sum(len(boards) for boards in corpus["boards"])
+
+
+def bench_plot_heatmap(corpus, services, options):
+    visualization_service = services["visualization_service"]
+    visualization_service.heatmap_cache.clear()
+    positions = 0
+    for boards in corpus["boards"]:
+        maps = visualization_service.generate_game_control_maps(boards)
+        for grids in maps:
+            visualization_service.plot_heatmap(grids[int(chess.WHITE)], "White Control", "White")
+            positions += 1
+    return positions
+
+
+def bench_render_board(corpus, services, options):
+    visualization_service = services["visualization_service"]
+    visualization_service.board_cache.clear()
+    positions = 0
+    for boards in corpus["boards"]:
+        for board in boards:
+            last_move = board.peek() if board.move_stack else None
+            visualization_service.render_board(board, last_move=last_move)
+            positions += 1
+    return positions
+
+
+def bench_analyze_game(corpus, services, options):
+    for text in corpus["texts"]:
+        result = services["game_analysis_service"].analyze_game(
+            text, options["analysis_depth"], include_ai=False
+        )
+        if "error" in result:
+            raise RuntimeError(result["error"])
+    return len(corpus["texts"])
+
+
+STAGES = {
+    "pgn_parse": bench_pgn_parse,
+    "identify_opening": bench_identify_opening,
+    "control_heatmaps": bench_control_heatmaps,
+    "game_control_maps": bench_game_control_maps,
+    "plot_heatmap": bench_plot_heatmap,
+    "render_board": bench_render_board,
+    "analyze_game": bench_analyze_game,
+}
+
+
+def skip_reason(stage, services):
+    if stage == "analyze_game" and not services["stockfish_service"].available:
+        return "Stockfish engine not available"
+    return None
+
+
+def time_stage(stage, corpus, services, options, repeats):
+    """Warm up once, then time `repeats` runs of a stage over a corpus"""
+    func = STAGES[stage]
+    func(corpus, services, options)
+    timings = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        items = func(corpus, services, options)
+        timings.append(time.perf_counter() - started)
+
+    median = statistics.median(timings)
+    return {
+        "stage": stage,
+        "corpus": corpus["name"],
+        "items": items,
+        "repeats": repeats,
+        "min": min(timings),
+        "median": median,
+        "mean": statistics.fmean(timings),
+        "stdev": statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        "per_item_median": median / items if items else None
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmarks(stages=None, corpora=CORPORA, repeats=DEFAULT_REPEATS, corpus_dir=DEFAULT_CORPUS_DIR,
+                   engine_path=None, engine_depth=DEFAULT_ENGINE_DEPTH, analysis_depth="standard"):
+    """
+    Run the benchmark stages over the corpora.
+
+    Returns:
+        A dict with "meta" (environment and settings) and "results" (one entry
+        per stage and corpus, with timings in seconds, or a "skipped" reason)
+    """
+    stages = list(stages or STAGES)
+    services = create_services(engine_path, engine_depth)
+    options = {"analysis_depth": analysis_depth}
+
+    results = []
+    for name in corpora:
+        corpus = load_corpus(name, corpus_dir)
+        for stage in stages:
+            reason = skip_reason(stage, services)
+            if reason:
+                results.append({"stage": stage, "corpus": name, "skipped": reason})
+                continue
+            results.append(time_stage(stage, corpus, services, options, repeats))
+            logger.info(f"{stage} on {name}: {results[-1]['median']:.4f}s")
+
+    return {
+        "meta": {
+            "timestamp": time.time(),
+            "git_commit": git_commit(),
+            "python": platform.python_version(),
+            "python_chess": chess.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "repeats": repeats,
+            "analysis_depth": analysis_depth,
+            "engine_depth": engine_depth,
+            "engine": services["stockfish_service"].pool.engine_name if services["stockfish_service"].available else None
+        },
+        "results": results
+    }
+
+
+def compare(baseline, current):
+    """
+    Compare two benchmark runs stage by stage.
+
+    Returns:
+        One dict per stage and corpus found in both runs, with both medians,
+        their ratio (current / baseline) and a "slower"/"faster"/"same" verdict
+    """
+    def timed(run):
+        return {(r["stage"], r["corpus"]): r for r in run["results"] if "skipped" not in r}
+
+    before, after = timed(baseline), timed(current)
+    rows = []
+    for key in before:
+        if key not in after:
+            continue
+        ratio = after[key]["median"] / before[key]["median"] if before[key]["median"] else float("inf")
+        verdict = "same"
+        if ratio > REGRESSION_THRESHOLD:
+            verdict = "slower"
+        elif ratio < 1 / REGRESSION_THRESHOLD:
+            verdict = "faster"
+        rows.append({
+            "stage": key[0],
+            "corpus": key[1],
+            "baseline": before[key]["median"],
+            "current": after[key]["median"],
+            "ratio": ratio,
+            "verdict": verdict
+        })
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the chess analysis pipeline")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run = subparsers.add_parser("run", help="Time every stage over the corpora")
+    run.add_argument("-o", "--output", help="Write the results to this JSON file (default: stdout)")
+    run.add_argument("--stage", action="append", choices=list(STAGES), help="Only run this stage (repeatable)")
+    run.add_argument("--corpus", action="append", choices=list(CORPORA), help="Only use this corpus (repeatable)")
+    run.add_argument("--repeat", type=int, default=DEFAULT_REPEATS, help="Timed runs per stage and corpus")
+    run.add_argument("--engine", help="Path to the Stockfish binary for the analyze_game stage, or 'stub'")
+    run.add_argument("--engine-depth", type=int, default=DEFAULT_ENGINE_DEPTH, help="Engine search depth")
+    run.add_argument("--depth", choices=["minimal", "standard", "deep"], default="standard",
+                     help="Analysis depth passed to analyze_game")
+
+    diff = subparsers.add_parser("compare", help="Compare two result files")
+    diff.add_argument("baseline")
+    diff.add_argument("current")
+
+    args = parser.parse_args(argv)
+
+    if args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        rows = compare(baseline, current)
+        print(f"{'stage':<20} {'corpus':<14} {'baseline':>10} {'current':>10} {'ratio':>7}")
+        for row in rows:
+            print(f"{row['stage']:<20} {row['corpus']:<14} {row['baseline']:>10.4f} {row['current']:>10.4f} "
+                  f"{row['ratio']:>7.2f}  {row['verdict']}")
+        # A non-zero exit lets CI fail on a regression
+        return 1 if any(row["verdict"] == "slower" for row in rows) else 0
+
+    report = run_benchmarks(
+        stages=args.stage,
+        corpora=args.corpus or CORPORA,
+        repeats=args.repeat,
+        engine_path=args.engine,
+        engine_depth=args.engine_depth,
+        analysis_depth=args.depth
+    )
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
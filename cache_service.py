@@ -0,0 +1,296 @@
+import os
+import json
+import time
+import hashlib
+import sqlite3
+import itertools
+import threading
+import logging
+import chess
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# SQLite limits the number of bound parameters per statement
+MAX_KEYS_PER_QUERY = 500
+
+# How many writes may happen between two eviction checks
+EVICTION_CHECK_INTERVAL = 64
+
+# Default on-disk locations of the shared caches
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "chessailytics")
+DEFAULT_EVAL_CACHE_PATH = os.path.join(DEFAULT_CACHE_DIR, "evaluations.db")
+DEFAULT_LLM_CACHE_PATH = os.path.join(DEFAULT_CACHE_DIR, "llm_responses.db")
+
+
+class SQLiteStore:
+    """
+    Base class for caches kept in a SQLite file shared between processes.
+
+    Subclasses list their CREATE statements in `SCHEMA`.
+    """
+
+    SCHEMA = []
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        # next() on a count is atomic, so threads sharing the store never lose a write
+        self._writes = itertools.count(1)
+
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+
+        conn = self._connection()
+        with conn:
+            for statement in self.SCHEMA:
+                conn.execute(statement)
+
+    def _connection(self):
+        # sqlite3 connections can't be shared between threads, so keep one per thread
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            # WAL lets readers in other processes proceed while one process writes
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _eviction_due(self):
+        """Count a write, returning True on every EVICTION_CHECK_INTERVAL-th one"""
+        return next(self._writes) % EVICTION_CHECK_INTERVAL == 0
+
+
+class EvaluationCache(SQLiteStore):
+    """
+    A disk-backed, cross-process cache of engine evaluations.
+
+    Entries are keyed on the normalized position (EPD, i.e. FEN without the
+    halfmove and fullmove clocks) plus the engine settings that produced them,
+    so the same position reached in different games or by different users
+    is only searched once. Entries are evicted least-recently-used once the
+    cache holds more than `max_entries` positions.
+    """
+
+    SCHEMA = [
+        """
+        CREATE TABLE IF NOT EXISTS evaluations (
+            key TEXT PRIMARY KEY,
+            result TEXT NOT NULL,
+            last_access REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS evaluations_last_access ON evaluations (last_access)"
+    ]
+
+    def __init__(self, path=DEFAULT_EVAL_CACHE_PATH, max_entries=200000):
+        self.max_entries = max_entries
+        super().__init__(path)
+
+    @staticmethod
+    def make_key(fen, depth, multi_pv, engine_name):
+        """Build the cache key for a position and the engine settings used to search it"""
+        epd = chess.Board(fen).epd()
+        return f"{epd}|depth={depth}|multipv={multi_pv}|engine={engine_name}"
+
+    def get(self, fen, depth, multi_pv, engine_name):
+        return self.get_many([fen], depth, multi_pv, engine_name).get(fen)
+
+    def get_many(self, fens, depth, multi_pv, engine_name):
+        """Look up several positions at once, returning {fen: result} for the hits"""
+        # A position repeated with different move clocks shares one key
+        keys = {}
+        for fen in fens:
+            keys.setdefault(self.make_key(fen, depth, multi_pv, engine_name), []).append(fen)
+        if not keys:
+            return {}
+
+        try:
+            conn = self._connection()
+            key_list = list(keys)
+            rows = []
+            for start in range(0, len(key_list), MAX_KEYS_PER_QUERY):
+                chunk = key_list[start:start + MAX_KEYS_PER_QUERY]
+                placeholders = ",".join("?" * len(chunk))
+                rows.extend(conn.execute(
+                    f"SELECT key, result FROM evaluations WHERE key IN ({placeholders})",
+                    chunk
+                ).fetchall())
+            if rows:
+                with conn:
+                    conn.executemany(
+                        "UPDATE evaluations SET last_access = ? WHERE key = ?",
+                        [(time.time(), key) for key, _ in rows]
+                    )
+        except sqlite3.Error as e:
+            logger.warning(f"Evaluation cache lookup failed: {str(e)}")
+            return {}
+
+        hits = {}
+        for key, result in rows:
+            for fen in keys[key]:
+                hit = json.loads(result)
+                # The cached entry may come from a different move number of the same position
+                hit["fen"] = fen
+                hits[fen] = hit
+        return hits
+
+    def put(self, fen, depth, multi_pv, engine_name, result):
+        # Never persist failed searches
+        if "error" in result:
+            return
+
+        key = self.make_key(fen, depth, multi_pv, engine_name)
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO evaluations (key, result, last_access) VALUES (?, ?, ?)",
+                    (key, json.dumps(result), time.time())
+                )
+                if self._eviction_due():
+                    self._evict(conn)
+        except sqlite3.Error as e:
+            logger.warning(f"Evaluation cache write failed: {str(e)}")
+
+    def _evict(self, conn):
+        # Counting rows is a full index scan, so this only runs every few writes
+        count = conn.execute("SELECT COUNT(*) FROM evaluations").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            conn.execute(
+                "DELETE FROM evaluations WHERE key IN "
+                "(SELECT key FROM evaluations ORDER BY last_access LIMIT ?)",
+                (overflow,)
+            )
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM evaluations").fetchone()[0]
+
+    def clear(self):
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM evaluations")
+
+
+class LLMResponseCache(SQLiteStore):
+    """
+    A content-addressed, disk-backed cache of LLM responses.
+
+    Responses are keyed by a hash of the model name, the rendered prompt and
+    the sampling parameters. Entries expire after `ttl` seconds, and the least
+    recently used entries are evicted once the stored responses exceed
+    `max_bytes`.
+    """
+
+    SCHEMA = [
+        """
+        CREATE TABLE IF NOT EXISTS responses (
+            key TEXT PRIMARY KEY,
+            response TEXT NOT NULL,
+            size INTEGER NOT NULL,
+            created_at REAL NOT NULL,
+            last_access REAL NOT NULL
+        )
+        """,
+        "CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)"
+    ]
+
+    def __init__(self, path=DEFAULT_LLM_CACHE_PATH, ttl=7 * 24 * 3600, max_bytes=256 * 1024 * 1024):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._stats_lock = threading.Lock()
+        super().__init__(path)
+
+    @staticmethod
+    def make_key(model, prompt, params=None):
+        """Hash the model, prompt and sampling parameters into a cache key"""
+        payload = json.dumps({"model": model, "prompt": prompt, "params": params or {}}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, model, prompt, params=None):
+        key = self.make_key(model, prompt, params)
+        now = time.time()
+        try:
+            conn = self._connection()
+            row = conn.execute(
+                "SELECT response, created_at FROM responses WHERE key = ?",
+                (key,)
+            ).fetchone()
+            if row and now - row[1] > self.ttl:
+                # Expired: drop it and treat as a miss
+                with conn:
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            elif row:
+                with conn:
+                    conn.execute("UPDATE responses SET last_access = ? WHERE key = ?", (now, key))
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache lookup failed: {str(e)}")
+            row = None
+
+        with self._stats_lock:
+            if row:
+                self.hits += 1
+            else:
+                self.misses += 1
+        return row[0] if row else None
+
+    def put(self, model, prompt, response, params=None):
+        key = self.make_key(model, prompt, params)
+        now = time.time()
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO responses (key, response, size, created_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, response, len(response.encode("utf-8")), now, now)
+                )
+                if self._eviction_due():
+                    self._evict(conn)
+        except sqlite3.Error as e:
+            logger.warning(f"LLM cache write failed: {str(e)}")
+
+    def _evict(self, conn):
+        conn.execute("DELETE FROM responses WHERE created_at < ?", (time.time() - self.ttl,))
+
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+
+        # Walk entries from least to most recently used until we are back under the cap
+        doomed = []
+        for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            doomed.append((key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+        conn.executemany("DELETE FROM responses WHERE key = ?", doomed)
+
+    def stats(self):
+        """Hit/miss counters for this process plus the current size of the cache"""
+        conn = self._connection()
+        entries, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        with self._stats_lock:
+            hits, misses = self.hits, self.misses
+        lookups = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": size
+        }
+
+    def __len__(self):
+        return self._connection().execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+    def clear(self):
+        conn = self._connection()
+        with conn:
+            conn.execute("DELETE FROM responses")
@@ -1,155 +1,1179 @@
+import time
+
+# Start of the module import, reported with the service startup timings
+_import_started = time.perf_counter()
+
 import os
+import sys
+import math
 import logging
-import streamlit as st
+from collections import deque
+from collections.abc import Mapping
 from typing import Dict, Any, List, Optional
 import re
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager, ExitStack
 from io import StringIO
 import chess
 import chess.pgn
+import chess.engine
+import chess.polyglot
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Import the AI service and Visualization service
-from ai_service import AIService
-from visualization_service import VisualizationService
-
-# Debug info list for tracking application flow
-debug_info = []
+# The AI and visualization services pull in groq and numpy; they are imported by
+# their factories below so that importing this module stays cheap
+from cache_service import EvaluationCache, LLMResponseCache, DEFAULT_EVAL_CACHE_PATH, DEFAULT_LLM_CACHE_PATH
+import telemetry
+from profiling import profile_call
 
 def add_debug_info(message):
-    """Add a debug message to the global debug info list"""
-    global debug_info
-    debug_info.append(message)
-    logger.info(message)
+    """Log a debug message and add it to the current session's trace"""
+    telemetry.event(message)
+
+class AnalysisCancelled(Exception):
+    """Raised from a progress callback to stop an analysis that is no longer wanted"""
+
+# Default location of the bundled Stockfish binary
+DEFAULT_STOCKFISH_PATH = "./stockfish_14_x64_popcnt"
+
+# STOCKFISH_PATH value that selects the pure-Python stub engine for offline runs
+STUB_ENGINE = "stub"
+
+def engine_command(path):
+    """The command that starts the engine at path, resolving the stub engine alias"""
+    if path == STUB_ENGINE:
+        return [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), "stub_engine.py")]
+    return path
+
+# Drop in the mover's winning chances (in percentage points) for each move classification
+MOVE_CLASSIFICATION_THRESHOLDS = [
+    ("blunder", 30),
+    ("mistake", 20),
+    ("inaccuracy", 10),
+]
+
+def win_chance(score):
+    """Winning chances (0-100) for the side the PovScore-derived score belongs to"""
+    cp = score.score(mate_score=100000)
+    # Logistic model fitted on rated games (as used by Lichess)
+    return 50 + 50 * (2 / (1 + math.exp(-0.00368208 * cp)) - 1)
+
+def classify_move(win_chance_loss):
+    for label, threshold in MOVE_CLASSIFICATION_THRESHOLDS:
+        if win_chance_loss >= threshold:
+            return label
+    return None
+
+# Depth of the quick pass over every ply that finds the positions worth a deep search
+DEFAULT_SCAN_DEPTH = 8
+
+# Positions per game that get a full-depth search
+DEFAULT_CRITICAL_POSITIONS = 10
+
+# Selection score of one unit of tactical tension, in percentage points of evaluation swing
+TENSION_WEIGHT = 2.0
+
+def white_win_chance(result, turn):
+    """White's winning chances from an analyze_position result, or None if it has no evaluation"""
+    evaluation = result.get("evaluation") if result else None
+    if not evaluation:
+        return None
+    if evaluation["type"] == "mate":
+        score = chess.engine.Mate(evaluation["value"])
+    else:
+        score = chess.engine.Cp(evaluation["value"])
+    return win_chance(chess.engine.PovScore(score, turn).white())
+
+def tactical_tension(board):
+    """Captures available to the side to move, with a check counting as three"""
+    return sum(1 for _ in board.generate_legal_captures()) + (3 if board.is_check() else 0)
+
+def select_critical_positions(chances, tensions, budget):
+    """
+    Pick the plies most worth a deep search.
+
+    A ply scores the evaluation swing of the move played from it, in
+    percentage points of White's winning chances, plus its tactical tension.
+    The game's last position has no move to swing on and scores its tension.
+
+    Args:
+        chances: White's winning chances at every ply (None where unknown)
+        tensions: tactical_tension at every ply
+        budget: Maximum number of plies to pick
+
+    Returns:
+        A list of {"ply", "swing", "tension"} dicts in ply order
+    """
+    candidates = []
+    for ply, tension in enumerate(tensions):
+        swing = 0.0
+        if ply + 1 < len(chances) and chances[ply] is not None and chances[ply + 1] is not None:
+            swing = abs(chances[ply + 1] - chances[ply])
+        candidates.append((swing + TENSION_WEIGHT * tension, ply, swing, tension))
+
+    picked = sorted(candidates, key=lambda c: (-c[0], c[1]))[:max(0, budget)]
+    return [
+        {"ply": ply, "swing": round(swing, 1), "tension": tension}
+        for _, ply, swing, tension in sorted(picked, key=lambda c: c[1])
+    ]
+
+# Seconds between checks for dead engines while waiting for an idle one
+ENGINE_CHECKOUT_POLL_SECONDS = 0.5
+
+# Stockfish Engine Pool
+class StockfishEnginePool:
+    """
+    A fixed-size pool of supervised Stockfish processes.
+
+    Engines are checked out for the duration of a single search and checked
+    back in afterwards. An engine that died while checked out is replaced
+    with a fresh process on checkin.
+
+    Engines go to waiting callers first come, first served, so a caller
+    that checks an engine back in and out again between searches cannot
+    starve the others.
+    """
+
+    def __init__(self, engine_path=DEFAULT_STOCKFISH_PATH, size=1, threads=2, hash_mb=128):
+        self.engine_path = engine_path
+        self.size = max(1, int(size))
+        self.options = {"Threads": int(threads), "Hash": int(hash_mb)}
+        self._idle = deque()
+        # One [engine, Event] slot per caller waiting in checkout, oldest first
+        self._waiters = deque()
+        self._engines = []
+        self._lock = threading.Lock()
+        self._closed = False
+
+        try:
+            for _ in range(self.size):
+                engine = self._spawn()
+                self._engines.append(engine)
+                self._idle.append(engine)
+        except Exception:
+            # Don't leave half a pool of orphaned processes behind
+            self.close()
+            raise
+
+    def _spawn(self):
+        engine = chess.engine.SimpleEngine.popen_uci(self.engine_path)
+        engine.configure(self.options)
+        return engine
+
+    @property
+    def engine_name(self):
+        """Name and version reported by the engines, e.g. 'Stockfish 14'"""
+        with self._lock:
+            if not self._engines:
+                return ""
+            return self._engines[0].id.get("name", "")
+
+    def checkout(self, timeout=None):
+        """
+        Take an idle engine from the pool, waiting up to `timeout` seconds (None waits as long as
+        any engine is alive).
+
+        Raises:
+            TimeoutError: No engine became idle in time
+            RuntimeError: The pool is closed, or every engine died and could not be restarted
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._lock:
+            self._check_usable()
+            if self._idle and not self._waiters:
+                # The engine checked in last, so a caller searching again gets its warm hash back
+                return self._idle.pop()
+            slot = [None, threading.Event()]
+            self._waiters.append(slot)
+
+        while True:
+            # Wake up now and then so a pool that loses its last engine fails its waiters
+            wait = ENGINE_CHECKOUT_POLL_SECONDS
+            if deadline is not None:
+                wait = max(0.0, min(wait, deadline - time.monotonic()))
+            slot[1].wait(wait)
+            with self._lock:
+                if slot[1].is_set():
+                    return slot[0]
+                try:
+                    self._check_usable()
+                    if deadline is not None and time.monotonic() >= deadline:
+                        raise TimeoutError("No Stockfish engine became available in time")
+                except Exception:
+                    self._waiters.remove(slot)
+                    raise
+
+    def _check_usable(self):
+        if self._closed:
+            raise RuntimeError("Engine pool is closed")
+        if not self._engines:
+            raise RuntimeError("No Stockfish engine is running")
+
+    def checkin(self, engine, healthy=True):
+        """Return an engine to the pool, restarting it if it is no longer healthy"""
+        if self._closed:
+            self._quit(engine)
+            return
+
+        if not healthy:
+            add_debug_info("Restarting crashed Stockfish engine")
+            self._quit(engine)
+            try:
+                replacement = self._spawn()
+            except Exception as e:
+                # Keep the pool usable with one engine less rather than failing callers
+                add_debug_info(f"Failed to restart Stockfish engine: {str(e)}")
+                with self._lock:
+                    self._engines.remove(engine)
+                return
+            with self._lock:
+                self._engines[self._engines.index(engine)] = replacement
+            engine = replacement
+
+        with self._lock:
+            # Hand the engine straight to the longest waiting caller
+            if self._waiters:
+                slot = self._waiters.popleft()
+                slot[0] = engine
+                slot[1].set()
+            else:
+                self._idle.append(engine)
+
+    @contextmanager
+    def engine(self, timeout=None):
+        """Context manager that checks an engine out and always checks it back in"""
+        engine = self.checkout(timeout=timeout)
+        healthy = True
+        try:
+            yield engine
+        except chess.engine.EngineTerminatedError:
+            healthy = False
+            raise
+        finally:
+            self.checkin(engine, healthy=healthy)
+
+    def _quit(self, engine):
+        try:
+            engine.quit()
+        except Exception:
+            pass
+
+    def close(self):
+        self._closed = True
+        with self._lock:
+            engines, self._engines = self._engines, []
+        for engine in engines:
+            self._quit(engine)
+
+# Search budgets
+# Smallest search a budgeted position gets, even once the budget is used up
+MIN_SEARCH_SECONDS = 0.01
+MIN_SEARCH_NODES = 1000
+
+# Share of a standard analysis' budget reserved for the shallow scan of every ply
+SCAN_BUDGET_SHARE = 0.25
+
+def position_complexity(board):
+    """Rough search cost of a position: more legal moves and more tactics need more time"""
+    if board.is_game_over():
+        return 0.0
+    return 1.0 + board.legal_moves.count() / 10 + tactical_tension(board)
+
+class SearchBudget:
+    """
+    A total time or node budget split across positions by weight.
+
+    Each position gets the unspent budget times its share of the weight
+    still to come, so whatever an easy position leaves over is passed on
+    to the positions after it. Searches may run concurrently; budget handed
+    to a search that is still running is not given out again.
+
+    Args:
+        weights: {fen: weight} for the positions to be searched
+        seconds: Total engine time in seconds
+        nodes: Total node count
+        max_depth: Depth at which a search stops even with budget left
+    """
+
+    def __init__(self, weights, seconds=None, nodes=None, max_depth=None):
+        self.seconds = seconds
+        self.nodes = nodes
+        self.max_depth = max_depth
+        self.spent_seconds = 0.0
+        self.spent_nodes = 0
+        self.depths = {}
+        self._pending = {fen: max(weight, 0.0) for fen, weight in weights.items()}
+        self._reserved_seconds = 0.0
+        self._reserved_nodes = 0
+        self._lock = threading.Lock()
+
+    def _share(self, total, spent, reserved, weight, minimum):
+        remaining_weight = weight + sum(self._pending.values())
+        unspent = max(0, total - spent - reserved)
+        share = unspent * weight / remaining_weight if remaining_weight else unspent
+        return max(minimum, share)
+
+    def reserve(self, fen):
+        """Take this position's share of the budget, returned as a chess.engine.Limit"""
+        with self._lock:
+            weight = self._pending.pop(fen, 1.0)
+            seconds = nodes = None
+            if self.seconds is not None:
+                seconds = self._share(self.seconds, self.spent_seconds, self._reserved_seconds,
+                                      weight, MIN_SEARCH_SECONDS)
+                self._reserved_seconds += seconds
+            if self.nodes is not None:
+                nodes = int(self._share(self.nodes, self.spent_nodes, self._reserved_nodes,
+                                        weight, MIN_SEARCH_NODES))
+                self._reserved_nodes += nodes
+            return chess.engine.Limit(time=seconds, nodes=nodes, depth=self.max_depth)
+
+    def skip(self, fen):
+        """Drop a position that needs no search, e.g. one served from the cache"""
+        with self._lock:
+            self._pending.pop(fen, None)
+
+    def spend(self, fen, limit, info, elapsed):
+        """Book the search of a position against the budget and release its reservation"""
+        with self._lock:
+            if limit.time is not None:
+                self._reserved_seconds -= limit.time
+            if limit.nodes is not None:
+                self._reserved_nodes -= limit.nodes
+            self.spent_seconds += info.get("time", elapsed)
+            self.spent_nodes += info.get("nodes", 0)
+            self.depths[fen] = info.get("depth")
+
+    def report(self):
+        """Budget and spending, plus the depth each searched position reached"""
+        return {
+            "seconds": self.seconds,
+            "nodes": self.nodes,
+            "spent_seconds": round(self.spent_seconds, 3),
+            "spent_nodes": self.spent_nodes,
+            "depths": dict(self.depths)
+        }
+
+# Centipawn score of a tablebase win, less the distance to zeroing, so faster conversions rank higher
+TABLEBASE_WIN_CP = 20000
+
+# Largest number of pieces probed in the tablebases, capped by the largest table found
+DEFAULT_TABLEBASE_PIECES = 7
+
+# Forced moves followed from a position before searching the one they lead to
+MAX_FORCED_MOVES = 8
+
+# Positions answered without an engine search, by what answered them
+POSITIONS_RESOLVED = telemetry.METRICS.counter(
+    "positions_resolved_total", "Positions evaluated without an engine search"
+)
+
+class TablebaseService:
+    """
+    Syzygy endgame tablebases, probed for exact results.
+
+    Args:
+        paths: Directories holding .rtbw/.rtbz files
+        max_pieces: Positions with more pieces (kings included) are not probed
+    """
+
+    def __init__(self, paths, max_pieces=DEFAULT_TABLEBASE_PIECES):
+        import chess.syzygy
+        self.tables = None
+        self.max_pieces = 0
+        # Probing opens and closes table files, which is not thread-safe
+        self._lock = threading.Lock()
+        try:
+            self.tables = chess.syzygy.Tablebase()
+            for path in paths:
+                self.tables.add_directory(path)
+            if self.tables.wdl:
+                largest = max(len(name) - 1 for name in self.tables.wdl)
+                self.max_pieces = min(max_pieces, largest)
+            add_debug_info(f"Loaded {len(self.tables.wdl)} tablebase tables up to {self.max_pieces} pieces")
+        except Exception as e:
+            add_debug_info(f"Failed to load tablebases: {str(e)}")
+        self.available = self.max_pieces > 0
+
+    def probe(self, board):
+        """
+        Exact (WDL, DTZ) of a position for the side to move, or None if it is not in the tables.
+
+        WDL is 2 for a win, 1 for a win spoiled by the fifty-move rule, 0 for
+        a draw and -1/-2 likewise for losses; DTZ counts plies to the next
+        capture or pawn move on the way there.
+        """
+        if not self.available or chess.popcount(board.occupied) > self.max_pieces or board.castling_rights:
+            return None
+        try:
+            with self._lock:
+                return self.tables.probe_wdl(board), self.tables.probe_dtz(board)
+        except KeyError:
+            # A table this position or one of its captures needs is missing
+            return None
+
+    def close(self):
+        if self.tables is not None:
+            self.tables.close()
+
+def tablebase_evaluation(wdl, dtz):
+    """An analyze_position evaluation dict for a tablebase result"""
+    value = 0
+    if wdl == 2:
+        value = TABLEBASE_WIN_CP - abs(dtz)
+    elif wdl == -2:
+        value = -(TABLEBASE_WIN_CP - abs(dtz))
+    # Wins and losses spoiled by the fifty-move rule are draws
+    return {"type": "cp", "value": value, "wdl": wdl, "dtz": dtz}
+
+def evaluation_score(evaluation):
+    """The chess.engine.Score of an evaluation dict"""
+    if evaluation["type"] == "mate":
+        return chess.engine.Mate(evaluation["value"])
+    return chess.engine.Cp(evaluation["value"])
+
+def forced_evaluation(board, move, evaluation):
+    """
+    The evaluation of a position whose only legal move is `move`.
+
+    Args:
+        board: The position, before the move
+        evaluation: The evaluation of the position after the move, for the side to move there
+    """
+    if "wdl" in evaluation:
+        dtz = evaluation["dtz"]
+        if dtz == 0:
+            # A draw, or the opponent is mated by the move
+            dtz = 1 if evaluation["wdl"] < 0 else 0
+        elif board.is_zeroing(move):
+            dtz = 1 if dtz < 0 else -1
+        else:
+            dtz = -dtz + (1 if dtz < 0 else -1)
+        return tablebase_evaluation(-evaluation["wdl"], dtz)
+    if evaluation["type"] == "mate":
+        # Mated in n after the move is mate in n + 1 before it; mating in n is being mated in n
+        value = evaluation["value"]
+        return {"type": "mate", "value": -value + 1 if value <= 0 else -value}
+    return {"type": "cp", "value": -evaluation["value"]}
+
+def resolve_position(board, multi_pv=1, tablebase=None):
+    """
+    Evaluate a position without an engine search, if it has an exact answer.
+
+    Finished games (checkmate, stalemate, insufficient material, the
+    seventy-five-move rule and fivefold repetition) and positions found in
+    the tablebases are answered; everything else returns None.
+
+    Returns:
+        A result in the analyze_position shape, plus "resolved_by" naming what
+        answered it. Tablebase evaluations also carry "wdl" and "dtz".
+    """
+    fen = board.fen()
+    outcome = board.outcome()
+    if outcome is not None:
+        resolved_by = outcome.termination.name.lower()
+        evaluation = {"type": "mate", "value": 0} if outcome.winner is not None else {"type": "cp", "value": 0}
+        # Drawn by material or the move rules, every legal move is equally good
+        top_moves = [
+            {"Move": move.uci(), "Evaluation": dict(evaluation), "SAN": board.san(move)}
+            for move in list(board.legal_moves)[:multi_pv]
+        ]
+        POSITIONS_RESOLVED.inc(by=resolved_by)
+        return {"fen": fen, "top_moves": top_moves, "evaluation": evaluation, "resolved_by": resolved_by}
+
+    probed = tablebase.probe(board) if tablebase is not None else None
+    if probed is None:
+        return None
+
+    wdl, dtz = probed
+    moves = []
+    for move in board.legal_moves:
+        board.push(move)
+        try:
+            if board.is_checkmate():
+                probed = (-2, 0)
+            else:
+                probed = tablebase.probe(board)
+        finally:
+            board.pop()
+        if probed is None:
+            return None
+        evaluation = forced_evaluation(board, move, tablebase_evaluation(*probed))
+        moves.append({"Move": move.uci(), "Evaluation": evaluation, "SAN": board.san(move)})
+    # Best result first, then the fastest win or the slowest loss
+    moves.sort(key=lambda move: (-move["Evaluation"]["wdl"], move["Evaluation"]["dtz"]))
+
+    POSITIONS_RESOLVED.inc(by="tablebase")
+    return {
+        "fen": fen,
+        "top_moves": moves[:multi_pv],
+        "evaluation": tablebase_evaluation(wdl, dtz),
+        "resolved_by": "tablebase"
+    }
+
+def forced_move(board):
+    """The only legal move of a position, or None if there are several or none"""
+    moves = iter(board.legal_moves)
+    first = next(moves, None)
+    if first is None or next(moves, None) is not None:
+        return None
+    return first
+
+# Time of every single engine search, by analysis mode
+ENGINE_SEARCH_SECONDS = telemetry.METRICS.histogram("engine_search_seconds", "Engine search durations")
 
 # Stockfish Service
 class StockfishService:
-    def __init__(self, stockfish_path=None, depth=18):
+    def __init__(self, stockfish_path=None, depth=18, pool_size=1, threads=2, hash_mb=128, cache=None,
+                 tablebase=None):
+        self.depth = depth
+        self.cache = cache
+        self.tablebase = tablebase
+        # Interactive searches get an engine of their own, started on first use, so they never
+        # share one with a whole-game pass (switching games clears the engine's hash)
+        self.interactive_pool = None
+        self._interactive_lock = threading.Lock()
         try:
-            import chess.engine
-            os.chmod("./stockfish_14_x64_popcnt",0o0777)
-            self.engine = chess.engine.SimpleEngine.popen_uci(
-               "./stockfish_14_x64_popcnt" 
+            engine_path = stockfish_path or DEFAULT_STOCKFISH_PATH
+            if engine_path == DEFAULT_STOCKFISH_PATH:
+                os.chmod(engine_path, 0o0777)
+            self._engine_settings = {"threads": threads, "hash_mb": hash_mb}
+            self.pool = StockfishEnginePool(
+                engine_command(engine_path),
+                size=pool_size,
+                threads=threads,
+                hash_mb=hash_mb
             )
-            self.engine.configure({"Threads": 2, "Hash": 128})
-            self.depth = depth
             self.available = True
-            add_debug_info("Stockfish engine initialized successfully")
+            add_debug_info(f"Stockfish engine pool initialized with {self.pool.size} engine(s)")
         except Exception as e:
             add_debug_info(f"Failed to initialize Stockfish engine: {str(e)}")
             self.available = False
-            self.engine = None
+            self.pool = None
+
+    def get_interactive_pool(self):
+        """The single-engine pool reserved for interactive searches, started on first use"""
+        if self.interactive_pool is None:
+            with self._interactive_lock:
+                if self.interactive_pool is None:
+                    self.interactive_pool = StockfishEnginePool(
+                        self.pool.engine_path, size=1, **self._engine_settings
+                    )
+                    add_debug_info("Started the Stockfish engine for interactive analysis")
+        return self.interactive_pool
+
+    def resolve(self, board, multi_pv=1):
+        """The exact result of a position that needs no search, or None (see resolve_position)"""
+        return resolve_position(board, multi_pv, self.tablebase)
+
+    def _forced_result(self, board, move, result):
+        """The result of a position whose only legal move is `move`, from the result after it"""
+        if "evaluation" not in result:
+            return result
+        evaluation = forced_evaluation(board, move, result["evaluation"])
+        forced = {
+            "fen": board.fen(),
+            "top_moves": [{"Move": move.uci(), "Evaluation": evaluation, "SAN": board.san(move)}],
+            "evaluation": evaluation,
+            "resolved_by": "forced_move"
+        }
+        if "depth" in result:
+            forced["depth"] = result["depth"]
+        return forced
 
     def analyze_position(self, fen, multi_pv=1):
-        if not self.available or not self.engine:
+        try:
+            board = chess.Board(fen)
+        except ValueError as e:
+            return {"error": f"Analysis error: {str(e)}"}
+
+        # Finished games and tablebase positions need no engine
+        resolved = self.resolve(board, multi_pv)
+        if resolved:
+            return resolved
+
+        if not self.available or not self.pool:
             return {"error": "Stockfish engine not available"}
 
+        # Follow forced moves and search the first position with a choice instead
+        line = []
+        move = forced_move(board)
+        while move is not None and len(line) < MAX_FORCED_MOVES:
+            line.append((board.copy(stack=False), move))
+            board.push(move)
+            resolved = self.resolve(board)
+            if resolved:
+                break
+            move = forced_move(board)
+        if line:
+            result = resolved or self._cached_search(board.fen(), 1)
+            for parent, move in reversed(line):
+                result = self._forced_result(parent, move, result)
+            POSITIONS_RESOLVED.inc(by="forced_move")
+            return result
+
+        return self._cached_search(fen, multi_pv)
+
+    def _cached_search(self, fen, multi_pv):
+        # Check the shared evaluation cache before starting a search
+        if self.cache is not None:
+            cached = self.cache.get(fen, self.depth, multi_pv, self.pool.engine_name)
+            if cached:
+                return cached
+
+        result = self._search(fen, multi_pv)
+        if self.cache is not None:
+            self.cache.put(fen, self.depth, multi_pv, self.pool.engine_name, result)
+        return result
+
+    def _search(self, fen, multi_pv=1, depth=None, budget=None):
         try:
             board = chess.Board(fen)
             
-            # Get engine evaluation
-            info = self.engine.analyse(
-                board, 
-                chess.engine.Limit(depth=self.depth),
-                multipv=multi_pv
-            )
+            # Get engine evaluation from whichever engine is idle
+            with self.pool.engine() as engine:
+                limit = budget.reserve(fen) if budget else chess.engine.Limit(depth=depth or self.depth)
+                started = time.perf_counter()
+                info = engine.analyse(
+                    board, 
+                    limit,
+                    multipv=multi_pv
+                )
+                elapsed = time.perf_counter() - started
+                if budget:
+                    budget.spend(fen, limit, info[0], elapsed)
+            ENGINE_SEARCH_SECONDS.observe(elapsed, mode="position")
             
-            # Process results
-            result = {
-                "fen": fen,
-                "top_moves": []
-            }
+            return self._build_result(board, fen, info)
             
-            for pv_info in info:
-                score = pv_info["score"].relative
-                
-                # Handle mate scores
-                if score.is_mate():
-                    eval_type = "mate"
-                    eval_value = score.mate()
-                else:
-                    eval_type = "cp"
-                    eval_value = score.score()
-                
-                # For the first PV, set the main evaluation
-                if len(result["top_moves"]) == 0:
-                    result["evaluation"] = {
-                        "type": eval_type,
-                        "value": eval_value
-                    }
-                
-                # Add move info
-                move_info = {
-                    "Move": pv_info["pv"][0].uci(),
-                    "Evaluation": {
-                        "type": eval_type,
-                        "value": eval_value
-                    },
-                    "SAN": board.san(pv_info["pv"][0])
+        except Exception as e:
+            add_debug_info(f"Error in Stockfish analysis: {str(e)}")
+            return {"error": f"Analysis error: {str(e)}"}
+
+    def _build_result(self, board, fen, info):
+        # Process results
+        result = {
+            "fen": fen,
+            "top_moves": []
+        }
+        if info and info[0].get("depth") is not None:
+            result["depth"] = info[0]["depth"]
+        
+        for pv_info in info:
+            score = pv_info["score"].relative
+            
+            # Handle mate scores
+            if score.is_mate():
+                eval_type = "mate"
+                eval_value = score.mate()
+            else:
+                eval_type = "cp"
+                eval_value = score.score()
+            
+            # For the first PV, set the main evaluation
+            if len(result["top_moves"]) == 0:
+                result["evaluation"] = {
+                    "type": eval_type,
+                    "value": eval_value
                 }
-                
-                result["top_moves"].append(move_info)
             
-            return result
+            # Add move info
+            move_info = {
+                "Move": pv_info["pv"][0].uci(),
+                "Evaluation": {
+                    "type": eval_type,
+                    "value": eval_value
+                },
+                "SAN": board.san(pv_info["pv"][0])
+            }
             
+            result["top_moves"].append(move_info)
+        
+        return result
+
+    def stream_analysis(self, fen, multi_pv=1, time_limit=None, nodes=None, max_depth=None,
+                        stable_iterations=4, min_depth=8, checkout_timeout=None):
+        """
+        Analyze a position with iterative deepening, yielding a result after every completed depth.
+
+        Runs on the engine reserved for interactive searches, never on one of the pool's.
+
+        Args:
+            fen: The FEN string of the position to analyze
+            multi_pv: Number of principal variations to report
+            time_limit: Optional wall-clock budget in seconds
+            nodes: Optional node budget
+            max_depth: Optional depth limit (defaults to the service depth when no budget is given)
+            stable_iterations: Stop once the best move has been unchanged for this many depths
+            min_depth: Never stop early on a stable best move before this depth
+            checkout_timeout: Seconds to wait for the interactive engine; past it the only
+                result is an error with "busy" set
+
+        Yields:
+            Results in the same shape as analyze_position, plus "depth", "pv", "nodes",
+            "time" and a "final" flag set on the last result
+        """
+        try:
+            resolved = self.resolve(chess.Board(fen), multi_pv)
+        except ValueError:
+            # Reported by the search below
+            resolved = None
+        if resolved:
+            yield dict(resolved, final=True)
+            return
+
+        if not self.available or not self.pool:
+            yield {"error": "Stockfish engine not available", "final": True}
+            return
+
+        # A full-depth evaluation from the cache beats any partial result
+        if self.cache is not None:
+            cached = self.cache.get(fen, self.depth, multi_pv, self.pool.engine_name)
+            if cached:
+                cached["final"] = True
+                yield cached
+                return
+
+        if time_limit is None and nodes is None and max_depth is None:
+            max_depth = self.depth
+        limit = chess.engine.Limit(time=time_limit, nodes=nodes, depth=max_depth)
+
+        try:
+            board = chess.Board(fen)
+            # The engine never reports more lines than there are legal moves
+            multi_pv = max(1, min(multi_pv, board.legal_moves.count()))
+
+            last = None
+            best_move = None
+            stable_count = 0
+            with self.get_interactive_pool().engine(timeout=checkout_timeout) as engine:
+                with engine.analysis(board, limit, multipv=multi_pv) as analysis:
+                    for info in analysis:
+                        # Wait for the last line of a completed iteration with an exact score
+                        if "pv" not in info or "score" not in info or "depth" not in info:
+                            continue
+                        if info.get("lowerbound") or info.get("upperbound"):
+                            continue
+                        if info.get("multipv", 1) != multi_pv:
+                            continue
+
+                        lines = [line for line in analysis.multipv if "pv" in line and "score" in line]
+                        result = self._build_result(board, fen, lines)
+                        result["depth"] = info["depth"]
+                        result["pv"] = [move.uci() for move in lines[0]["pv"]]
+                        result["nodes"] = info.get("nodes")
+                        result["time"] = info.get("time")
+                        result["final"] = False
+
+                        # Track how long the best move has stayed the same
+                        if lines[0]["pv"][0] == best_move:
+                            stable_count += 1
+                        else:
+                            best_move = lines[0]["pv"][0]
+                            stable_count = 1
+
+                        last = result
+                        if stable_count >= stable_iterations and info["depth"] >= min_depth:
+                            analysis.stop()
+                            break
+
+                        yield result
+
+            if last is None:
+                yield {"error": "Analysis returned no results", "final": True}
+                return
+
+            # Repeat the deepest result with the final flag once the search is over
+            yield dict(last, final=True)
+
+        except TimeoutError:
+            add_debug_info("The interactive engine is busy; skipped the streaming analysis")
+            yield {"error": "The interactive engine is busy with another analysis", "busy": True, "final": True}
         except Exception as e:
-            add_debug_info(f"Error in Stockfish analysis: {str(e)}")
+            add_debug_info(f"Error in streaming Stockfish analysis: {str(e)}")
+            yield {"error": f"Analysis error: {str(e)}", "final": True}
+
+    def analyze_full_game(self, start_fen, uci_moves, progress=None, budget=None):
+        """
+        Analyze every ply of a game in a single engine session.
+
+        The engine is given the start position plus the moves played so far,
+        under one game identity, so it keeps its transposition table between
+        consecutive plies instead of starting from scratch for each position.
+        The engine is held for the whole pass: a search for another game in
+        between would make the engine clear its hash.
+
+        Args:
+            start_fen: FEN of the position the game starts from
+            uci_moves: The moves of the game in UCI notation
+            progress: Optional callable(done, total) invoked after every position
+            budget: Optional SearchBudget replacing the fixed search depth
+
+        Returns:
+            A dict with "analyses" ({fen: result} in the analyze_position shape, for
+            every position of the game) and "plies" (one entry per move with the
+            evaluation after the move from White's point of view, the engine's best
+            move, the drop in winning chances and a blunder/mistake/inaccuracy label)
+        """
+        if not self.available or not self.pool:
+            return {"error": "Stockfish engine not available"}
+
+        try:
+            board = chess.Board(start_fen)
+            moves = [chess.Move.from_uci(uci) for uci in uci_moves]
+            # Any object unique to this pass; the engine only gets ucinewgame when it changes
+            game_token = object()
+
+            analyses = {}
+            scores = []
+            fens = []
+            # Plies whose only legal move was played, with the position before it
+            forced_plies = {}
+
+            # Positions searched to full depth before, in this game or another one, are not searched again
+            cached = {}
+            if self.cache is not None:
+                replay = chess.Board(start_fen)
+                game_fens = [replay.fen()]
+                for move in moves:
+                    replay.push(move)
+                    game_fens.append(replay.fen())
+                cached = self.cache.get_many(game_fens, self.depth, 1, self.pool.engine_name)
+
+            # The engine is only checked out once a position needs a search
+            engine = None
+            with ExitStack() as stack:
+                for ply in range(len(moves) + 1):
+                    fen = board.fen()
+                    fens.append(fen)
+                    # No search needed for finished games, tablebase positions and forced moves
+                    resolved = self.resolve(board)
+                    if resolved:
+                        scores.append(chess.engine.PovScore(evaluation_score(resolved["evaluation"]), board.turn))
+                        analyses[fen] = resolved
+                        if budget:
+                            budget.skip(fen)
+                    elif "evaluation" in cached.get(fen, {}):
+                        scores.append(chess.engine.PovScore(evaluation_score(cached[fen]["evaluation"]), board.turn))
+                        analyses[fen] = cached[fen]
+                        if budget:
+                            budget.skip(fen)
+                    elif ply < len(moves) and forced_move(board) is not None:
+                        # Scored from the next position once that is analyzed; the entry keeps ply order
+                        scores.append(None)
+                        analyses[fen] = None
+                        forced_plies[ply] = board.copy(stack=False)
+                        if budget:
+                            budget.skip(fen)
+                    else:
+                        if engine is None:
+                            engine = stack.enter_context(self.pool.engine())
+                        limit = budget.reserve(fen) if budget else chess.engine.Limit(depth=self.depth)
+                        started = time.perf_counter()
+                        info = engine.analyse(
+                            board,
+                            limit,
+                            multipv=1,
+                            game=game_token
+                        )
+                        elapsed = time.perf_counter() - started
+                        if budget:
+                            budget.spend(fen, limit, info[0], elapsed)
+                        ENGINE_SEARCH_SECONDS.observe(elapsed, mode="full_game")
+                        scores.append(info[0]["score"])
+                        analyses[fen] = self._build_result(board, fen, info)
+                        # Only a search that reached full depth may stand in for one later
+                        if self.cache is not None and (not budget or analyses[fen].get("depth", 0) >= self.depth):
+                            self.cache.put(fen, self.depth, 1, self.pool.engine_name, analyses[fen])
+
+                    if progress:
+                        progress(ply + 1, len(moves) + 1)
+                    if ply < len(moves):
+                        board.push(moves[ply])
+
+            for ply in sorted(forced_plies, reverse=True):
+                parent = forced_plies[ply]
+                analyses[fens[ply]] = self._forced_result(parent, moves[ply], analyses[fens[ply + 1]])
+                scores[ply] = chess.engine.PovScore(evaluation_score(analyses[fens[ply]]["evaluation"]), parent.turn)
+            if forced_plies:
+                POSITIONS_RESOLVED.inc(len(forced_plies), by="forced_move")
+
+            # Replay the game to classify every move by how much it cost the mover
+            board = chess.Board(start_fen)
+            plies = []
+            for ply, move in enumerate(moves):
+                mover = board.turn
+                best_moves = analyses[board.fen()]["top_moves"]
+                san = board.san(move)
+                board.push(move)
+
+                loss = max(0.0, win_chance(scores[ply].pov(mover)) - win_chance(scores[ply + 1].pov(mover)))
+                white_score = scores[ply + 1].white()
+                plies.append({
+                    "ply": ply + 1,
+                    "move": move.uci(),
+                    "san": san,
+                    "fen": board.fen(),
+                    "evaluation": {
+                        "type": "mate" if white_score.is_mate() else "cp",
+                        "value": white_score.mate() if white_score.is_mate() else white_score.score()
+                    },
+                    "best_move": best_moves[0]["Move"] if best_moves else None,
+                    "win_chance_loss": round(loss, 1),
+                    "classification": classify_move(loss)
+                })
+
+            return {"analyses": analyses, "plies": plies}
+
+        except AnalysisCancelled:
+            raise
+        except Exception as e:
+            add_debug_info(f"Error in full-game Stockfish analysis: {str(e)}")
             return {"error": f"Analysis error: {str(e)}"}
 
-    def __del__(self):
-        if hasattr(self, 'engine') and self.engine:
+    def analyze_positions(self, fens, multi_pv=1, progress=None, depth=None, budget=None):
+        """
+        Analyze several positions at once, spread across the engine pool.
+
+        progress, if given, is called as progress(done, total) as positions finish.
+        depth overrides the service depth, e.g. for a quick scan of a whole game.
+        budget, a SearchBudget, replaces the fixed depth with a share of a total
+        time or node budget; its max_depth is then the depth looked up in the cache.
+        """
+        if not self.available or not self.pool:
+            return {fen: {"error": "Stockfish engine not available"} for fen in fens}
+
+        unique_fens = list(dict.fromkeys(fens))
+        depth = (budget.max_depth if budget else depth) or self.depth
+
+        # Finished games and tablebase positions need no search
+        results = {}
+        boards = {}
+        for fen in unique_fens:
+            try:
+                board = chess.Board(fen)
+            except ValueError:
+                # Reported by its search
+                continue
+            resolved = self.resolve(board, multi_pv)
+            if resolved:
+                results[fen] = resolved
+            else:
+                boards[fen] = board
+
+        # A forced move's position takes its result from the one the move leads to, when that is
+        # analyzed too; positions leading to another forced move are searched to keep chains short
+        forced_moves = {fen: move for fen, board in boards.items() if (move := forced_move(board)) is not None}
+        forced = {}
+        for fen, move in forced_moves.items():
+            board = boards[fen]
+            board.push(move)
+            child = board.fen()
+            board.pop()
+            if child in unique_fens and child not in forced_moves:
+                forced[fen] = (move, child)
+
+        # Serve whatever we can from the evaluation cache and only search the rest
+        pending = [fen for fen in unique_fens if fen not in results and fen not in forced]
+        if self.cache is not None:
+            results.update(self.cache.get_many(pending, depth, multi_pv, self.pool.engine_name))
+        misses = [fen for fen in pending if fen not in results]
+        if budget:
+            for fen in unique_fens:
+                if fen not in misses:
+                    budget.skip(fen)
+        if progress:
+            progress(len(results), len(unique_fens))
+
+        if misses:
+            executor = ThreadPoolExecutor(max_workers=self.pool.size)
             try:
-                self.engine.quit()
-            except:
-                pass
+                futures = {
+                    executor.submit(self._search, fen, multi_pv=multi_pv, depth=depth, budget=budget): fen
+                    for fen in misses
+                }
+                for future in as_completed(futures):
+                    fen = futures[future]
+                    results[fen] = future.result()
+                    if self.cache is not None and (not budget or results[fen].get("depth", 0) >= depth):
+                        self.cache.put(fen, depth, multi_pv, self.pool.engine_name, results[fen])
+                    if progress:
+                        progress(len(results), len(unique_fens))
+            finally:
+                # A cancelled analysis drops the searches that haven't started yet
+                executor.shutdown(wait=True, cancel_futures=True)
+
+        for fen, (move, child) in forced.items():
+            results[fen] = self._forced_result(boards[fen], move, results[child])
+        if forced:
+            POSITIONS_RESOLVED.inc(len(forced), by="forced_move")
+            if progress:
+                progress(len(results), len(unique_fens))
+
+        return {fen: results[fen] for fen in unique_fens}
+
+    def close(self):
+        """Quit the engines; their reader threads would otherwise keep the process alive"""
+        if self.pool:
+            self.pool.close()
+        if self.interactive_pool:
+            self.interactive_pool.close()
+        if self.tablebase is not None:
+            self.tablebase.close()
+
+    def __del__(self):
+        for pool in (getattr(self, 'pool', None), getattr(self, 'interactive_pool', None)):
+            if pool:
+                try:
+                    pool.close()
+                except:
+                    pass
 
 # Opening Database Service
-class OpeningDBService:
-    def __init__(self):
-        self.openings_db = {}
+# Bundled ECO table (Lichess chess-openings format: eco, name, pgn columns)
+DEFAULT_ECO_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "eco.tsv")
+
+
+class EcoIndex:
+    """
+    In-memory index of an ECO opening table.
+
+    Every line is stored twice: in a trie keyed by SAN moves, which matches
+    games that follow a book line move for move without touching a board,
+    and in a table keyed by the Zobrist hash of the line's final position,
+    which recognizes openings reached by a different move order.
+    """
+
+    def __init__(self, path=DEFAULT_ECO_PATH):
+        # Trie nodes are [children, opening] pairs; children maps SAN -> node
+        self.root = [{}, None]
+        self.positions = {}
+        self.max_plies = 0
+        self.size = 0
+
+        # A directory is read as the concatenation of its .tsv files (e.g. Lichess a.tsv ... e.tsv)
+        if os.path.isdir(path):
+            paths = [os.path.join(path, name) for name in sorted(os.listdir(path)) if name.endswith(".tsv")]
+        else:
+            paths = [path]
+        for tsv_path in paths:
+            self._load(tsv_path)
+
+    def _load(self, path):
+        with open(path, encoding="utf-8") as tsv:
+            for line_number, line in enumerate(tsv, 1):
+                columns = line.rstrip("\n").split("\t")
+                if len(columns) < 3 or columns[0] == "eco":
+                    continue
+                eco, name, pgn = columns[:3]
+                sans = [token for token in pgn.split() if not token.endswith(".")]
+                try:
+                    self.add(eco, name, sans)
+                except ValueError as e:
+                    add_debug_info(f"Skipping invalid ECO line {path}:{line_number}: {str(e)}")
+
+    def add(self, eco, name, sans):
+        """Add one opening line given as a list of SAN moves"""
+        board = chess.Board()
+        for san in sans:
+            board.push_san(san)
+
+        opening = {"name": name, "eco": eco}
+        node = self.root
+        for san in sans:
+            node = node[0].setdefault(san, [{}, None])
+        if node[1] is None:
+            node[1] = opening
+
+        # The first (most general) line reaching a position names it
+        self.positions.setdefault(chess.polyglot.zobrist_hash(board), opening)
+        self.max_plies = max(self.max_plies, len(sans))
+        self.size += 1
+
+    def lookup(self, moves):
+        """
+        Return the deepest opening matching a game given as SAN moves, or None.
+
+        The game is followed through the trie first; once it leaves the book
+        move order the remaining plies are replayed on a board and matched by
+        position hash, so transpositions back into a known line still count.
+        Moves that are not legal from the standard starting position match nothing.
+        """
+        best = None
+        node = self.root
+        ply = 0
+        for san in moves[:self.max_plies]:
+            child = node[0].get(san)
+            if child is None:
+                break
+            node = child
+            ply += 1
+            if node[1] is not None:
+                best = node[1]
+
+        if ply == min(len(moves), self.max_plies):
+            return best
+
+        board = chess.Board()
         try:
-            # Load ECO codes
-            self.load_eco_codes()
-            self.available = True
+            for san in moves[:ply]:
+                board.push_san(san)
+            for san in moves[ply:self.max_plies]:
+                board.push_san(san)
+                opening = self.positions.get(chess.polyglot.zobrist_hash(board))
+                if opening is not None:
+                    best = opening
+        except ValueError:
+            return None
+        return best
+
+
+# One index per ECO file, built on first use and shared by every session in the process
+_eco_indexes = {}
+_eco_indexes_lock = threading.Lock()
+
+
+def get_eco_index(path=DEFAULT_ECO_PATH):
+    """Return the process-wide EcoIndex for path, loading it on first use"""
+    index = _eco_indexes.get(path)
+    if index is None:
+        with _eco_indexes_lock:
+            index = _eco_indexes.get(path)
+            if index is None:
+                index = EcoIndex(path)
+                _eco_indexes[path] = index
+                add_debug_info(f"Loaded {index.size} ECO lines from {path}")
+    return index
+
+
+class OpeningDBService:
+    def __init__(self, eco_path=None):
+        self.eco_path = eco_path or DEFAULT_ECO_PATH
+        # The ECO table is only read when the first opening is identified
+        self.available = os.path.exists(self.eco_path)
+        if self.available:
             add_debug_info("Opening database initialized successfully")
-        except Exception as e:
-            add_debug_info(f"Failed to initialize opening database: {str(e)}")
-            self.available = False
+        else:
+            add_debug_info(f"Failed to initialize opening database: {self.eco_path} not found")
 
     def load_eco_codes(self):
-        # This is a simplified version - in a real app, you'd load from a file
-        self.openings_db = {
-            "e4 e5 Nf3": {"name": "King's Pawn Game", "eco": "C40"},
-            "e4 e5 Nf3 Nc6 Bb5": {"name": "Ruy Lopez", "eco": "C60"},
-            "e4 c5": {"name": "Sicilian Defense", "eco": "B20"},
-            "d4 d5": {"name": "Queen's Pawn Game", "eco": "D00"},
-            "d4 Nf6 c4 g6": {"name": "King's Indian Defense", "eco": "E60"},
-            # Add more openings as needed
-        }
+        return get_eco_index(self.eco_path)
 
     def identify_opening(self, moves):
         if not self.available:
             return {"error": "Opening database not available"}
             
         try:
-            # Convert moves to a standard format for lookup
-            moves_str = " ".join(moves)
-            
-            # Look for the longest matching sequence
-            best_match = None
-            best_match_length = 0
-            
-            for opening_moves, opening_data in self.openings_db.items():
-                if moves_str.startswith(opening_moves) and len(opening_moves) > best_match_length:
-                    best_match = opening_data
-                    best_match_length = len(opening_moves)
+            opening = self.load_eco_codes().lookup(list(moves))
             
-            if best_match:
+            if opening:
                 return {
-                    "name": best_match["name"],
-                    "eco": best_match["eco"]
+                    "name": opening["name"],
+                    "eco": opening["eco"]
                 }
             else:
                 return {"name": "Unknown Opening", "eco": ""}
@@ -160,12 +1184,38 @@ class OpeningDBService:
 
 # Game Analysis Service
 class GameAnalysisService:
-    def __init__(self, stockfish_service, ai_service, opening_db_service):
+    def __init__(self, stockfish_service, ai_service, opening_db_service,
+                 critical_positions=DEFAULT_CRITICAL_POSITIONS, scan_depth=DEFAULT_SCAN_DEPTH,
+                 time_budget=None, node_budget=None):
         self.stockfish_service = stockfish_service
         self.ai_service = ai_service
         self.opening_db_service = opening_db_service
+        self.critical_positions = critical_positions
+        self.scan_depth = scan_depth
+        self.time_budget = time_budget
+        self.node_budget = node_budget
 
-    def analyze_game(self, pgn_text, analysis_depth="standard"):
+    def analyze_game(self, pgn_text, analysis_depth="standard", include_ai=True, progress=None,
+                     time_budget=None, node_budget=None):
+        """
+        Analyze a game given as PGN text.
+
+        progress, if given, is called as progress(done, total) while the
+        engine works through the positions; it may raise AnalysisCancelled
+        to abort the analysis.
+
+        time_budget (wall-clock seconds) and node_budget cap the engine work
+        for the whole game; they default to the service's budgets. With a
+        budget, positions get search time by complexity instead of a fixed
+        depth, and the result's "search_budget" reports the depth each reached.
+        """
+        with telemetry.span("analyze_game", analysis_depth=analysis_depth) as trace:
+            result = self._analyze_game(pgn_text, analysis_depth, include_ai, progress, time_budget, node_budget)
+            if "error" in result:
+                trace["status"] = "error"
+            return result
+
+    def _analyze_game(self, pgn_text, analysis_depth, include_ai, progress, time_budget, node_budget):
         try:
             # Check for FEN tag
             fen_match = re.search(r'\[FEN \"(.+?)\"\]', pgn_text)
@@ -180,92 +1230,182 @@ class GameAnalysisService:
                     add_debug_info(f"Fixed castling rights in FEN: {custom_fen}")
 
             # Parse the game
-            pgn = StringIO(pgn_text)
-            game = chess.pgn.read_game(pgn)
+            with telemetry.span("parse") as trace:
+                pgn = StringIO(pgn_text)
+                game = chess.pgn.read_game(pgn)
 
-            if not game:
-                return {"error": "Invalid PGN format"}
+                if not game:
+                    trace["status"] = "error"
+                    return {"error": "Invalid PGN format"}
 
-            # Initialize a board with the starting position
-            board = chess.Board(custom_fen) if custom_fen else chess.Board()
+                # Initialize a board with the starting position
+                board = chess.Board(custom_fen) if custom_fen else chess.Board()
 
-            # Extract headers
-            headers = dict(game.headers)
+                # Extract headers
+                headers = dict(game.headers)
             
-            # Extract moves
-            moves = []
-            uci_moves = []
-            positions = []
+                # Extract moves
+                moves = []
+                uci_moves = []
+                positions = []
             
-            # Add initial position
-            positions.append(board.fen())
+                # Add initial position
+                positions.append(board.fen())
+                turns = [board.turn]
+                tensions = [tactical_tension(board)]
+                complexities = [position_complexity(board)]
             
-            # Process each move
-            node = game
-            while node.variations:
-                next_node = node.variations[0]
-                move = next_node.move
+                # Process each move
+                node = game
+                while node.variations:
+                    next_node = node.variations[0]
+                    move = next_node.move
                 
-                # Add SAN and UCI notation
-                san = board.san(move)
-                uci = move.uci()
+                    # Add SAN and UCI notation
+                    san = board.san(move)
+                    uci = move.uci()
                 
-                moves.append(san)
-                uci_moves.append(uci)
+                    moves.append(san)
+                    uci_moves.append(uci)
                 
-                # Make the move on our board
-                board.push(move)
+                    # Make the move on our board
+                    board.push(move)
                 
-                # Add the new position
-                positions.append(board.fen())
+                    # Add the new position
+                    positions.append(board.fen())
+                    turns.append(board.turn)
+                    tensions.append(tactical_tension(board))
+                    complexities.append(position_complexity(board))
                 
-                # Move to the next node
-                node = next_node
+                    # Move to the next node
+                    node = next_node
+                trace["attributes"]["plies"] = len(moves)
             
             # Identify opening
-            opening_info = self.opening_db_service.identify_opening(moves[:10])
+            with telemetry.span("opening_lookup"):
+                if positions[0] != chess.STARTING_FEN:
+                    # Book lines start from the standard position, so a set-up game has no opening
+                    opening_info = {"name": "Unknown Opening", "eco": ""}
+                else:
+                    opening_info = self.opening_db_service.identify_opening(moves)
             
-            # Analyze key positions
             position_analyses = {}
-            
-            # Determine which positions to analyze based on depth
-            positions_to_analyze = []
-            
+            critical_positions = []
+
+            # Engine evaluations. "deep" searches every ply at full depth in one engine
+            # session; "standard" scans every ply at a shallow depth, then spends the
+            # full-depth searches on the plies where the evaluation swung or the position
+            # is tactically tense; "minimal" only looks at the final position
+            engine_analyses = {}
+            ply_analyses = []
+            search_budget = None
+            time_budget = self.time_budget if time_budget is None else time_budget
+            node_budget = self.node_budget if node_budget is None else node_budget
+            budgeted = time_budget is not None or node_budget is not None
             if analysis_depth == "minimal":
-                # Just analyze the final position
                 positions_to_analyze = [positions[-1]]
-            elif analysis_depth == "standard":
-                # Analyze every 5th position plus the final position
-                positions_to_analyze = [positions[i] for i in range(0, len(positions), 5)]
-                if positions[-1] not in positions_to_analyze:
-                    positions_to_analyze.append(positions[-1])
-            elif analysis_depth == "deep":
-                # Analyze every position
-                positions_to_analyze = positions
-            
-            # Limit to a reasonable number to avoid overloading
-            max_positions = 10
-            if len(positions_to_analyze) > max_positions:
-                # Always include first, last, and evenly spaced positions
-                positions_to_analyze = [positions_to_analyze[0]] + \
-                                      [positions_to_analyze[i] for i in range(1, len(positions_to_analyze)-1, 
-                                                                            len(positions_to_analyze)//max_positions)] + \
-                                      [positions_to_analyze[-1]]
-            
-            # Analyze selected positions
-            for fen in positions_to_analyze:
-                try:
-                    #stockfish_analysis = self.stockfish_service.analyze_position(fen)
-                    stockfish_analysis = self.ai_service.analyze_position(fen)
-                    position_analyses[fen] = stockfish_analysis
-                except Exception as e:
-                    add_debug_info(f"Error analyzing position {fen}: {str(e)}")
-            
-            # Get AI analysis for the whole game if AI model is available
-            if self.ai_service.model_available:
-                ai_analysis = self.ai_service.analyze_game(pgn_text)
+                if self.stockfish_service.available:
+                    with telemetry.span("engine.positions", positions=len(positions_to_analyze)):
+                        engine_analyses = self.stockfish_service.analyze_positions(positions_to_analyze, progress=progress)
+            elif self.stockfish_service.available:
+                position_budget = min(self.critical_positions, len(positions))
+                full_depth = self.stockfish_service.depth
+                if analysis_depth == "deep":
+                    # One engine works through the game, so wall-clock and engine time are the same
+                    full_game_budget = None
+                    if budgeted:
+                        full_game_budget = SearchBudget(
+                            dict(zip(positions, complexities)), seconds=time_budget, nodes=node_budget,
+                            max_depth=full_depth
+                        )
+                    with telemetry.span("engine.full_game", positions=len(positions)):
+                        full_game = self.stockfish_service.analyze_full_game(
+                            positions[0], uci_moves, progress=progress, budget=full_game_budget
+                        )
+                    if "error" in full_game:
+                        add_debug_info(f"Full-game analysis failed: {full_game['error']}")
+                    else:
+                        engine_analyses = full_game["analyses"]
+                        ply_analyses = full_game["plies"]
+                    if full_game_budget:
+                        search_budget = {"full_game": full_game_budget.report()}
+                    scan = engine_analyses
+                else:
+                    # Report both passes as one run of positions
+                    scan_total = len(set(positions))
+
+                    def scan_progress(done, total):
+                        if progress:
+                            progress(done, scan_total + position_budget)
+
+                    def deep_progress(done, total):
+                        if progress:
+                            progress(scan_total + done, scan_total + position_budget)
+
+                    # The searches run on every engine in the pool at once, so each
+                    # wall-clock second of the budget buys that many engine-seconds
+                    engine_seconds = time_budget * self.stockfish_service.pool.size if time_budget is not None else None
+                    scan_budget = None
+                    if budgeted:
+                        scan_budget = SearchBudget(
+                            dict(zip(positions, complexities)),
+                            seconds=engine_seconds * SCAN_BUDGET_SHARE if engine_seconds is not None else None,
+                            nodes=node_budget * SCAN_BUDGET_SHARE if node_budget is not None else None,
+                            max_depth=self.scan_depth
+                        )
+                    with telemetry.span("engine.scan", positions=scan_total, depth=self.scan_depth):
+                        scan = self.stockfish_service.analyze_positions(
+                            positions, progress=scan_progress, depth=self.scan_depth, budget=scan_budget
+                        )
+
+                chances = [white_win_chance(scan.get(fen), turn) for fen, turn in zip(positions, turns)]
+                critical_positions = select_critical_positions(chances, tensions, position_budget)
+                for critical in critical_positions:
+                    critical["fen"] = positions[critical["ply"]]
+                positions_to_analyze = list(dict.fromkeys(c["fen"] for c in critical_positions))
+
+                if analysis_depth != "deep":
+                    deep_budget = None
+                    if budgeted:
+                        # The deep pass gets whatever the scan left over
+                        deep_budget = SearchBudget(
+                            {c["fen"]: 1.0 + c["swing"] + TENSION_WEIGHT * c["tension"] for c in critical_positions},
+                            seconds=max(0.0, engine_seconds - scan_budget.spent_seconds) if engine_seconds is not None else None,
+                            nodes=max(0, node_budget - scan_budget.spent_nodes) if node_budget is not None else None,
+                            max_depth=full_depth
+                        )
+                    with telemetry.span("engine.deep", positions=len(positions_to_analyze), depth=full_depth):
+                        deep = self.stockfish_service.analyze_positions(
+                            positions_to_analyze, progress=deep_progress, budget=deep_budget
+                        )
+                    engine_analyses = {**scan, **deep}
+                    if budgeted:
+                        search_budget = {"scan": scan_budget.report(), "deep": deep_budget.report()}
+                add_debug_info(
+                    f"Selected {len(positions_to_analyze)} critical positions out of {len(positions)}"
+                )
             else:
-                ai_analysis = "AI model not available. AI analysis unavailable."
+                # Without an engine, fall back to evenly spaced positions for the LLM
+                stride = max(1, math.ceil(len(positions) / self.critical_positions))
+                positions_to_analyze = positions[::stride][:self.critical_positions]
+
+            # Analyze selected positions and the whole game with the LLM, all requests in flight at once
+            try:
+                if not include_ai:
+                    # Engine-only analysis, e.g. for bulk batch runs
+                    ai_analysis = "AI analysis skipped."
+                elif self.ai_service.model_available:
+                    with telemetry.span("llm", positions=len(positions_to_analyze)):
+                        ai_analysis, position_analyses = self.ai_service.analyze_game_and_positions(
+                            pgn_text,
+                            positions_to_analyze
+                        )
+                else:
+                    position_analyses = self.ai_service.analyze_positions(positions_to_analyze)
+                    ai_analysis = "AI model not available. AI analysis unavailable."
+            except Exception as e:
+                add_debug_info(f"Error in AI analysis: {str(e)}")
+                ai_analysis = f"Error in analysis: {str(e)}"
             
             # Compile results
             result = {
@@ -275,41 +1415,233 @@ class GameAnalysisService:
                 "positions": positions,
                 "opening": opening_info,
                 "position_analyses": position_analyses,
+                "engine_analyses": engine_analyses,
+                "ply_analyses": ply_analyses,
+                "critical_positions": critical_positions,
+                "search_budget": search_budget,
                 "ai_analysis": ai_analysis
             }
             
             return result
             
+        except AnalysisCancelled:
+            raise
         except Exception as e:
             add_debug_info(f"Error in game analysis: {str(e)}")
             return {"error": f"Analysis error: {str(e)}"}
 
 # Initialize services
+def create_evaluation_cache():
+    """Open the shared evaluation cache, or return None if it is disabled or unusable"""
+    path = os.getenv("EVAL_CACHE_PATH", DEFAULT_EVAL_CACHE_PATH)
+    if not path:
+        return None
+    try:
+        return EvaluationCache(path, max_entries=int(os.getenv("EVAL_CACHE_MAX_ENTRIES", "200000")))
+    except Exception as e:
+        add_debug_info(f"Failed to open evaluation cache: {str(e)}")
+        return None
+
+def create_llm_cache():
+    """Open the shared LLM response cache, or return None if it is disabled or unusable"""
+    path = os.getenv("LLM_CACHE_PATH", DEFAULT_LLM_CACHE_PATH)
+    if not path:
+        return None
+    try:
+        return LLMResponseCache(
+            path,
+            ttl=float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600))),
+            max_bytes=int(os.getenv("LLM_CACHE_MAX_MB", "256")) * 1024 * 1024
+        )
+    except Exception as e:
+        add_debug_info(f"Failed to open LLM response cache: {str(e)}")
+        return None
+
+def create_tablebase():
+    """Open the Syzygy tablebases named by SYZYGY_PATH, or return None if it is unset or none load"""
+    paths = [path for path in os.getenv("SYZYGY_PATH", "").split(os.pathsep) if path]
+    if not paths:
+        return None
+    tablebase = TablebaseService(
+        paths,
+        max_pieces=int(os.getenv("SYZYGY_MAX_PIECES", str(DEFAULT_TABLEBASE_PIECES)))
+    )
+    return tablebase if tablebase.available else None
+
+def engine_settings():
+    """
+    Pool size, threads and hash for the Stockfish service.
+
+    With STOCKFISH_AUTOCONFIG set, the values come from the host's saved (or
+    freshly benchmarked) engine profile; explicit STOCKFISH_* variables
+    still take precedence over it.
+    """
+    settings = {"pool_size": 1, "threads": 2, "hash_mb": 128}
+    if os.getenv("STOCKFISH_AUTOCONFIG", "").lower() in ("1", "true", "yes"):
+        from engine_config import auto_configure, DEFAULT_ENGINE_PROFILE_PATH
+        try:
+            profile = auto_configure(
+                engine_command(os.getenv("STOCKFISH_PATH") or DEFAULT_STOCKFISH_PATH),
+                profile_path=os.getenv("ENGINE_PROFILE_PATH", DEFAULT_ENGINE_PROFILE_PATH)
+            )
+            settings.update({key: profile[key] for key in settings})
+            add_debug_info(f"Auto-configured Stockfish: {settings}")
+        except Exception as e:
+            add_debug_info(f"Stockfish auto-configuration failed, using defaults: {str(e)}")
+
+    for key, variable in [("pool_size", "STOCKFISH_POOL_SIZE"), ("threads", "STOCKFISH_THREADS"),
+                          ("hash_mb", "STOCKFISH_HASH_MB")]:
+        if os.getenv(variable):
+            settings[key] = int(os.environ[variable])
+    return settings
+
+def _create_stockfish_service(registry):
+    return StockfishService(
+        stockfish_path=os.getenv("STOCKFISH_PATH"),
+        cache=create_evaluation_cache(),
+        tablebase=create_tablebase(),
+        **engine_settings()
+    )
+
+def _create_ai_service(registry):
+    from ai_service import AIService
+    return AIService(
+        max_concurrency=int(os.getenv("GROQ_MAX_CONCURRENCY", "8")),
+        request_timeout=float(os.getenv("GROQ_REQUEST_TIMEOUT", "60")),
+        cache=create_llm_cache()
+    )
+
+def _create_opening_db_service(registry):
+    return OpeningDBService(eco_path=os.getenv("ECO_PATH"))
+
+def _create_visualization_service(registry):
+    from visualization_service import VisualizationService
+    return VisualizationService()
+
+def _create_game_analysis_service(registry):
+    return GameAnalysisService(
+        registry["stockfish_service"],
+        registry["ai_service"],
+        registry["opening_db_service"],
+        critical_positions=int(os.getenv("CRITICAL_POSITIONS", str(DEFAULT_CRITICAL_POSITIONS))),
+        scan_depth=int(os.getenv("SCAN_DEPTH", str(DEFAULT_SCAN_DEPTH))),
+        time_budget=float(os.environ["ANALYSIS_TIME_BUDGET"]) if os.getenv("ANALYSIS_TIME_BUDGET") else None,
+        node_budget=int(os.environ["ANALYSIS_NODE_BUDGET"]) if os.getenv("ANALYSIS_NODE_BUDGET") else None
+    )
+
+def _create_analysis_job_scheduler(registry):
+    from job_scheduler import AnalysisJobScheduler
+    return AnalysisJobScheduler(
+        registry["game_analysis_service"],
+        max_workers=int(os.getenv("ANALYSIS_WORKERS", "2"))
+    )
+
+# Factories of the services every session needs, by registry name
+SERVICE_FACTORIES = {
+    "stockfish_service": _create_stockfish_service,
+    "ai_service": _create_ai_service,
+    "opening_db_service": _create_opening_db_service,
+    "visualization_service": _create_visualization_service,
+    "game_analysis_service": _create_game_analysis_service,
+    "analysis_job_scheduler": _create_analysis_job_scheduler
+}
+
+
+class ServiceRegistry(Mapping):
+    """
+    A lazily built set of services, looked up like the dict initialize_services used to return.
+
+    Each service is created by its factory on first access and then reused
+    by every caller, so a process runs one engine pool and one Groq client
+    however many sessions it serves. Creation times are kept in `timings`;
+    a service's time includes the services it depends on.
+    """
+
+    def __init__(self, factories=None):
+        self._factories = dict(factories or SERVICE_FACTORIES)
+        self._services = {}
+        # One lock per service so a slow engine start doesn't hold up the other services
+        self._locks = {name: threading.Lock() for name in self._factories}
+        self.timings = {}
+
+    def __getitem__(self, name):
+        service = self._services.get(name)
+        if service is not None:
+            return service
+        if name not in self._factories:
+            raise KeyError(name)
+
+        with self._locks[name]:
+            service = self._services.get(name)
+            if service is None:
+                started = time.perf_counter()
+                service = self._factories[name](self)
+                self.timings[name] = time.perf_counter() - started
+                self._services[name] = service
+                add_debug_info(f"Initialized {name} in {self.timings[name]:.3f}s")
+        return service
+
+    def __iter__(self):
+        return iter(self._factories)
+
+    def __len__(self):
+        return len(self._factories)
+
+    def is_initialized(self, name):
+        return name in self._services
+
+    def close(self):
+        """Close the services created so far that hold processes or files"""
+        for service in list(self._services.values()):
+            if hasattr(service, "close"):
+                service.close()
+
+    def startup_report(self):
+        """Module import time and per-service creation times, in seconds"""
+        return {
+            "import_seconds": MODULE_IMPORT_TIME,
+            "services": dict(self.timings)
+        }
+
+
+# The registry shared by every session in this process
+_service_registry = None
+_service_registry_lock = threading.Lock()
+
+
 def initialize_services():
-    stockfish_service = StockfishService()
-    ai_service = AIService()
-    opening_db_service = OpeningDBService()
-    visualization_service = VisualizationService()
-    
-    game_analysis_service = GameAnalysisService(stockfish_service, ai_service, opening_db_service)
-    
-    return {
-        "stockfish_service": stockfish_service,
-        "ai_service": ai_service,
-        "opening_db_service": opening_db_service,
-        "visualization_service": visualization_service,
-        "game_analysis_service": game_analysis_service
-    }
+    """
+    Return the process-wide ServiceRegistry.
+
+    Nothing is started here; each service is created on first lookup and
+    shared with every other caller in the process.
+    """
+    global _service_registry
+    if _service_registry is None:
+        with _service_registry_lock:
+            if _service_registry is None:
+                telemetry.start_metrics_exporters()
+                _service_registry = ServiceRegistry()
+    return _service_registry
 
 # Background analysis function
-def analyze_game_in_background(pgn_text, analysis_depth, services):
+def analyze_game_in_background(pgn_text, analysis_depth, services, profile=False):
     try:
         logger.info("Starting background analysis...")
         # Perform analysis
-        result = services["game_analysis_service"].analyze_game(
-            pgn_text,
-            analysis_depth
-        )
+        if profile:
+            # Attach a profile of the whole analysis to its result
+            result, report = profile_call(
+                services["game_analysis_service"].analyze_game,
+                pgn_text,
+                analysis_depth
+            )
+            result["profile"] = report
+        else:
+            result = services["game_analysis_service"].analyze_game(
+                pgn_text,
+                analysis_depth
+            )
 
         logger.info("Background analysis completed successfully")
         # Return result
@@ -317,3 +1649,5 @@ def analyze_game_in_background(pgn_text, analysis_depth, services):
     except Exception as e:
         logger.error(f"Error in background analysis: {str(e)}")
         return {"error": str(e)}
+
+MODULE_IMPORT_TIME = time.perf_counter() - _import_started
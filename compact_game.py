@@ -0,0 +1,161 @@
+"""
+Compact, array-backed representation of a single game.
+
+A game is stored as one 16-bit integer per move and one 64-bit Zobrist key
+per position, plus a board snapshot every few plies. SAN, UCI and FEN are
+only materialized when asked for, and any position is rebuilt by copying
+the nearest snapshot and replaying at most `snapshot_interval - 1` moves.
+"""
+from array import array
+import chess
+import chess.polyglot
+
+# Plies between two stored board snapshots
+DEFAULT_SNAPSHOT_INTERVAL = 16
+
+# Move encoding: bits 0-5 from square, 6-11 to square, 12-14 promotion piece type (0 = none)
+_TO_SHIFT = 6
+_PROMOTION_SHIFT = 12
+_SQUARE_MASK = 0x3F
+
+
+def encode_move(move):
+    """Pack a chess.Move into a 16-bit integer"""
+    return (
+        move.from_square
+        | (move.to_square << _TO_SHIFT)
+        | ((move.promotion or 0) << _PROMOTION_SHIFT)
+    )
+
+
+def decode_move(code):
+    """Unpack a 16-bit integer produced by encode_move"""
+    promotion = code >> _PROMOTION_SHIFT
+    return chess.Move(
+        code & _SQUARE_MASK,
+        (code >> _TO_SHIFT) & _SQUARE_MASK,
+        promotion=promotion or None
+    )
+
+
+class CompactGame:
+    """
+    The mainline of a game from a starting position.
+
+    Ply numbers count positions: ply 0 is the starting position and ply n is
+    the position after the first n moves. Move indices are 0-based, so move
+    i leads from ply i to ply i + 1.
+    """
+
+    def __init__(self, start_fen=chess.STARTING_FEN, snapshot_interval=DEFAULT_SNAPSHOT_INTERVAL):
+        board = chess.Board(start_fen)
+        self.start_fen = board.fen()
+        self.snapshot_interval = snapshot_interval
+        self._moves = array("H")
+        self._keys = array("Q", [chess.polyglot.zobrist_hash(board)])
+        self._snapshots = [board.copy(stack=False)]
+        # Board at the last ply, kept so appending a move never replays the game
+        self._tip = board
+
+    @classmethod
+    def from_moves(cls, moves, start_fen=chess.STARTING_FEN, **kwargs):
+        """Build a game from an iterable of chess.Move objects"""
+        game = cls(start_fen, **kwargs)
+        for move in moves:
+            game.push(move)
+        return game
+
+    @classmethod
+    def from_pgn_game(cls, pgn_game, **kwargs):
+        """Build a game from the mainline of a chess.pgn.Game"""
+        return cls.from_moves(pgn_game.mainline_moves(), start_fen=pgn_game.board().fen(), **kwargs)
+
+    def __len__(self):
+        """Number of moves in the game"""
+        return len(self._moves)
+
+    def push(self, move):
+        """Append a move, raising ValueError if it is illegal in the last position"""
+        if not self._tip.is_legal(move):
+            raise ValueError(f"illegal move {move.uci()} in {self._tip.fen()}")
+
+        self._tip.push(move)
+        self._moves.append(encode_move(move))
+        self._keys.append(chess.polyglot.zobrist_hash(self._tip))
+        if len(self._moves) % self.snapshot_interval == 0:
+            self._snapshots.append(self._tip.copy(stack=False))
+
+    def truncate(self, plies):
+        """Drop every move after the first `plies` moves"""
+        if plies >= len(self._moves):
+            return
+        del self._moves[plies:]
+        del self._keys[plies + 1:]
+        del self._snapshots[plies // self.snapshot_interval + 1:]
+        self._tip = self.board_at(plies)
+
+    def move(self, index):
+        """The move with the given index as a chess.Move"""
+        return decode_move(self._moves[index])
+
+    def moves(self):
+        """Iterate over all moves as chess.Move objects"""
+        return (decode_move(code) for code in self._moves)
+
+    def uci(self, index):
+        return self.move(index).uci()
+
+    def san(self, index):
+        """SAN of the move with the given index, computed from its position"""
+        return self.board_at(index).san(self.move(index))
+
+    def san_moves(self):
+        """SAN of every move, computed in a single pass over the game"""
+        board = chess.Board(self.start_fen)
+        sans = []
+        for move in self.moves():
+            sans.append(board.san(move))
+            board.push(move)
+        return sans
+
+    def key(self, ply):
+        """Zobrist hash of the position at the given ply"""
+        return self._keys[ply]
+
+    def keys(self):
+        """Zobrist hashes of every position, starting position first, as an array("Q")"""
+        return array("Q", self._keys)
+
+    def board_at(self, ply):
+        """
+        A fresh board for the position at the given ply.
+
+        The board carries only the moves replayed since the nearest snapshot,
+        so repetition detection does not see the earlier part of the game.
+        """
+        if ply < 0:
+            ply += len(self._moves) + 1
+        if not 0 <= ply <= len(self._moves):
+            raise IndexError(f"ply {ply} out of range for a game of {len(self._moves)} moves")
+
+        snapshot_index = ply // self.snapshot_interval
+        board = self._snapshots[snapshot_index].copy(stack=False)
+        for index in range(snapshot_index * self.snapshot_interval, ply):
+            board.push(decode_move(self._moves[index]))
+        return board
+
+    def boards(self):
+        """Iterate over independent boards for every ply, starting position first"""
+        board = chess.Board(self.start_fen)
+        yield board.copy(stack=False)
+        for move in self.moves():
+            board.push(move)
+            yield board.copy(stack=False)
+
+    def fen(self, ply):
+        return self.board_at(ply).fen()
+
+    @property
+    def nbytes(self):
+        """Approximate size of the move and key buffers in bytes"""
+        return self._moves.itemsize * len(self._moves) + self._keys.itemsize * len(self._keys)
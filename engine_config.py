@@ -0,0 +1,271 @@
+"""
+Host-aware Stockfish configuration.
+
+Picks the engine pool size, threads per engine and hash size for the machine
+the app runs on. It reads the usable CPU count and available memory, and
+benchmarks the engine at several thread counts to find which split of the
+cores gives the most nodes per second across the whole pool. The chosen
+profile is saved as JSON and reused on later startups while the host and
+engine stay the same.
+
+Run the benchmark by hand with:
+
+    python engine_config.py bench --save
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+import chess
+import chess.engine
+
+from cache_service import DEFAULT_CACHE_DIR
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Default on-disk location of the saved engine profile
+DEFAULT_ENGINE_PROFILE_PATH = os.path.join(DEFAULT_CACHE_DIR, "engine_profile.json")
+
+# Positions searched by the benchmark: opening, middlegame and endgame
+BENCH_FENS = [
+    chess.STARTING_FEN,
+    "r1bq1rk1/pp2bppp/2n1pn2/2pp4/3P4/2PBPN2/PP1N1PPP/R2QK2R w KQ - 0 8",
+    "8/5pk1/6p1/3R4/5P2/6PK/r7/8 w - - 0 45",
+]
+
+# Engine time per benchmark position and thread count
+DEFAULT_BENCH_SECONDS = 0.5
+
+# Hash used while benchmarking; small, so the runs do not depend on memory
+BENCH_HASH_MB = 16
+
+# Share of available memory the engines' hash tables may use in total
+HASH_MEMORY_SHARE = 0.25
+MIN_HASH_MB = 16
+MAX_HASH_MB = 4096
+
+# A larger thread count wins if its pool throughput is within this share of the best,
+# because fewer, stronger engines finish each single position sooner
+THROUGHPUT_TOLERANCE = 0.05
+
+
+def cpu_count():
+    """CPUs this process may use, honouring affinity masks and cgroup CPU quotas"""
+    try:
+        count = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        count = os.cpu_count() or 1
+
+    # Containers often get fewer CPUs than the host shows
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            count = min(count, max(1, int(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return max(1, count)
+
+
+def available_memory_mb():
+    """Memory available to new allocations in MB, or None if it cannot be read"""
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) // 1024
+    except (OSError, ValueError):
+        pass
+    try:
+        return os.sysconf("SC_AVPHYS_PAGES") * os.sysconf("SC_PAGE_SIZE") // (1024 * 1024)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+
+def detect_host():
+    return {"cpus": cpu_count(), "memory_mb": available_memory_mb()}
+
+
+def bench_thread_counts(cpus):
+    """Powers of two up to the CPU count, plus the CPU count itself"""
+    counts = []
+    threads = 1
+    while threads < cpus:
+        counts.append(threads)
+        threads *= 2
+    counts.append(cpus)
+    return counts
+
+
+def bench_engine(engine_path, thread_counts, seconds=DEFAULT_BENCH_SECONDS):
+    """
+    Measure engine speed at several thread counts.
+
+    Args:
+        engine_path: Path to the Stockfish binary
+        thread_counts: Threads settings to try
+        seconds: Search time per benchmark position and thread count
+
+    Returns:
+        A dict with the engine "name" and "nps", a {threads: nodes per second} dict
+    """
+    engine = chess.engine.SimpleEngine.popen_uci(engine_path)
+    try:
+        nps = {}
+        for threads in thread_counts:
+            engine.configure({"Threads": threads, "Hash": BENCH_HASH_MB})
+            nodes = 0
+            elapsed = 0.0
+            for fen in BENCH_FENS:
+                started = time.perf_counter()
+                info = engine.analyse(chess.Board(fen), chess.engine.Limit(time=seconds), game=object())
+                elapsed += info.get("time", time.perf_counter() - started)
+                nodes += info.get("nodes", 0)
+            nps[threads] = int(nodes / elapsed) if elapsed else 0
+            logger.info(f"Benchmark: {threads} thread(s), {nps[threads]} nodes/s")
+        return {"name": engine.id.get("name", ""), "nps": nps}
+    finally:
+        engine.quit()
+
+
+def choose_profile(host, nps):
+    """
+    Pick pool size, threads per engine and hash from the host and benchmark results.
+
+    Every engine in the pool searches its own position, so the pool's
+    throughput is the number of engines that fit on the CPUs times the
+    speed of one engine at the chosen thread count.
+
+    Args:
+        host: detect_host() result
+        nps: {threads: nodes per second} from bench_engine
+
+    Returns:
+        A dict with "pool_size", "threads", "hash_mb" and the expected "pool_nps"
+    """
+    cpus = host["cpus"]
+    throughput = {
+        threads: (cpus // threads) * speed
+        for threads, speed in nps.items()
+        if 0 < threads <= cpus
+    }
+    if not throughput:
+        throughput = {1: cpus * nps.get(1, 0)}
+
+    best = max(throughput.values())
+    threads = max(t for t, total in throughput.items() if total >= best * (1 - THROUGHPUT_TOLERANCE))
+    pool_size = max(1, cpus // threads)
+
+    hash_mb = MAX_HASH_MB
+    if host.get("memory_mb"):
+        hash_mb = int(host["memory_mb"] * HASH_MEMORY_SHARE / pool_size)
+    # Stockfish rounds the hash down to a power of two anyway
+    hash_mb = max(MIN_HASH_MB, min(MAX_HASH_MB, 1 << max(0, hash_mb.bit_length() - 1)))
+
+    return {"pool_size": pool_size, "threads": threads, "hash_mb": hash_mb, "pool_nps": throughput[threads]}
+
+
+def load_profile(path=DEFAULT_ENGINE_PROFILE_PATH):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def save_profile(profile, path=DEFAULT_ENGINE_PROFILE_PATH):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    # Write and rename so concurrent startups never read half a file
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(profile, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def engine_key(engine_path):
+    """How an engine is identified in a saved profile: its absolute path, or its command line"""
+    if isinstance(engine_path, (list, tuple)):
+        return " ".join(engine_path)
+    return os.path.abspath(engine_path)
+
+
+def profile_matches(profile, engine_path, host):
+    """Whether a saved profile was measured with this engine on this kind of host"""
+    return (
+        profile is not None
+        and profile.get("engine_path") == engine_key(engine_path)
+        and profile.get("host", {}).get("cpus") == host["cpus"]
+    )
+
+
+def build_profile(engine_path, host=None, seconds=DEFAULT_BENCH_SECONDS):
+    """Benchmark the engine on this host and return the chosen profile"""
+    host = host or detect_host()
+    bench = bench_engine(engine_path, bench_thread_counts(host["cpus"]), seconds=seconds)
+    profile = {
+        "engine_path": engine_key(engine_path),
+        "engine_name": bench["name"],
+        "host": host,
+        # JSON object keys are strings
+        "nps": {str(threads): speed for threads, speed in bench["nps"].items()},
+        "created_at": time.time()
+    }
+    profile.update(choose_profile(host, bench["nps"]))
+    return profile
+
+
+def auto_configure(engine_path, profile_path=DEFAULT_ENGINE_PROFILE_PATH, rebench=False):
+    """
+    The engine profile for this host, benchmarking only when no saved profile fits.
+
+    Returns:
+        The profile dict, with "pool_size", "threads" and "hash_mb" to pass to
+        StockfishService
+    """
+    host = detect_host()
+    profile = None if rebench else load_profile(profile_path)
+    if profile_matches(profile, engine_path, host):
+        # Memory may have changed since the benchmark; only the hash depends on it
+        nps = {int(threads): speed for threads, speed in profile["nps"].items()}
+        profile.update(choose_profile(host, nps))
+        profile["host"] = host
+        return profile
+
+    profile = build_profile(engine_path, host)
+    try:
+        save_profile(profile, profile_path)
+    except OSError as e:
+        logger.warning(f"Could not save engine profile to {profile_path}: {str(e)}")
+    return profile
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark Stockfish on this host and choose its configuration")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    bench = subparsers.add_parser("bench", help="Measure nodes per second and print the chosen profile")
+    bench.add_argument("--engine", default=os.getenv("STOCKFISH_PATH", "./stockfish_14_x64_popcnt"),
+                       help="Path to the Stockfish binary, or 'stub' for the stub engine")
+    bench.add_argument("--seconds", type=float, default=DEFAULT_BENCH_SECONDS,
+                       help="Search time per position and thread count")
+    bench.add_argument("--save", action="store_true", help="Save the profile for later startups")
+    bench.add_argument("--profile", default=os.getenv("ENGINE_PROFILE_PATH", DEFAULT_ENGINE_PROFILE_PATH),
+                       help="Where the profile is saved")
+    args = parser.parse_args(argv)
+
+    from chess_analysis import engine_command
+    profile = build_profile(engine_command(args.engine), seconds=args.seconds)
+    print(json.dumps(profile, indent=2))
+    if args.save:
+        save_profile(profile, args.profile)
+        print(f"Saved to {args.profile}", file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,220 @@
+"""
+A local stand-in for the Groq chat completions API.
+
+Answers POST /openai/v1/chat/completions in the OpenAI-compatible format
+the groq SDK expects, after a configurable delay and with a configurable
+share of injected errors. Responses are derived from the prompt, so the same
+request always gets the same text. Point the app at it with GROQ_BASE_URL:
+
+    python fake_groq_server.py --port 8765 --latency 0.5 --error-rate 0.05
+    GROQ_BASE_URL=http://127.0.0.1:8765 GROQ_API_KEY=fake streamlit run app.py
+
+GET /stats returns request, error and concurrency counters as JSON, for
+checking how many requests the app really has in flight.
+"""
+import sys
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+import logging
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CHAT_COMPLETIONS_PATH = "/openai/v1/chat/completions"
+STATS_PATH = "/stats"
+
+# Error bodies in the shape the Groq API returns them
+ERROR_MESSAGES = {
+    429: ("rate_limit_exceeded", "Rate limit reached (injected by fake_groq_server)"),
+    500: ("internal_server_error", "Internal server error (injected by fake_groq_server)"),
+    503: ("service_unavailable", "Service unavailable (injected by fake_groq_server)"),
+}
+
+
+def fake_completion(prompt, model):
+    """A deterministic completion for a prompt"""
+    digest = hashlib.sha1(prompt.encode("utf-8")).hexdigest()
+    content = (
+        f"Offline analysis {digest[:12]}.\n"
+        "1. The position is roughly balanced.\n"
+        "2. Both sides should complete development and fight for the centre.\n"
+        "3. Avoid leaving pieces undefended."
+    )
+    prompt_tokens = len(prompt.split())
+    completion_tokens = len(content.split())
+    return {
+        "id": f"chatcmpl-{digest[:24]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{
+            "index": 0,
+            "message": {"role": "assistant", "content": content},
+            "finish_reason": "stop"
+        }],
+        "usage": {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens
+        }
+    }
+
+
+class FakeGroqServer:
+    """
+    The fake API on a background thread.
+
+    Args:
+        host: Interface to listen on
+        port: Port to listen on (0 picks a free one; see `url`)
+        latency: Seconds every request takes
+        jitter: Up to this many seconds added at random to the latency
+        error_rate: Share of requests (0-1) answered with an error
+        error_status: HTTP status of the injected errors (429, 500 or 503)
+        seed: Seed for the jitter and error draws, for reproducible runs
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, error_rate=0.0,
+                 error_status=500, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                server._handle_completion(self)
+
+            def do_GET(self):
+                if self.path == STATS_PATH:
+                    server._send_json(self, 200, server.stats())
+                else:
+                    server._send_error(self, 404, "not_found", f"Unknown path {self.path}")
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        logger.info(f"Fake Groq API listening on {self.url}")
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *args):
+        self.stop()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "in_flight": self.in_flight,
+                "max_in_flight": self.max_in_flight
+            }
+
+    def _handle_completion(self, handler):
+        if handler.path != CHAT_COMPLETIONS_PATH:
+            self._send_error(handler, 404, "not_found", f"Unknown path {handler.path}")
+            return
+
+        try:
+            length = int(handler.headers.get("Content-Length", 0))
+            body = json.loads(handler.rfile.read(length) or b"{}")
+            prompt = "\n".join(message.get("content", "") for message in body["messages"])
+            model = body.get("model", "")
+        except (ValueError, KeyError, TypeError, AttributeError):
+            self._send_error(handler, 400, "invalid_request_error", "Request body is not a chat completion request")
+            return
+
+        with self._lock:
+            self.requests += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            delay = self.latency + self._random.uniform(0, self.jitter)
+            fail = self._random.random() < self.error_rate
+            if fail:
+                self.errors += 1
+
+        try:
+            time.sleep(delay)
+            if fail:
+                code, message = ERROR_MESSAGES.get(self.error_status, ERROR_MESSAGES[500])
+                self._send_error(handler, self.error_status, code, message)
+            else:
+                self._send_json(handler, 200, fake_completion(prompt, model))
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+    def _send_error(self, handler, status, code, message):
+        self._send_json(handler, status, {"error": {"message": message, "type": code, "code": code}})
+
+    def _send_json(self, handler, status, payload):
+        data = json.dumps(payload).encode("utf-8")
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        if status == 429:
+            handler.send_header("Retry-After", "0")
+        handler.end_headers()
+        handler.wfile.write(data)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a fake Groq chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds every request takes")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random extra seconds, up to this much")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Share of requests that fail (0-1)")
+    parser.add_argument("--error-status", type=int, choices=sorted(ERROR_MESSAGES), default=500,
+                        help="HTTP status of the injected errors")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for jitter and error injection")
+    args = parser.parse_args(argv)
+
+    server = FakeGroqServer(args.host, args.port, args.latency, args.jitter, args.error_rate,
+                            args.error_status, args.seed)
+    print(f"Set GROQ_BASE_URL={server.url} to use this server", file=sys.stderr)
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
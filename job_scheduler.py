@@ -0,0 +1,207 @@
+"""
+Background game-analysis jobs.
+
+The scheduler runs GameAnalysisService.analyze_game on a small worker pool.
+Callers submit a game, get a job ID back straight away and poll the job for
+its status and per-position progress, so a page never blocks on an analysis.
+Jobs can be cancelled while queued or between two engine positions.
+"""
+import time
+import uuid
+import threading
+import contextvars
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import telemetry
+from profiling import profile_call
+from chess_analysis import AnalysisCancelled, add_debug_info
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+COMPLETED = "completed"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+FINISHED_STATES = (COMPLETED, FAILED, CANCELLED)
+
+# Finished jobs whose results are kept for retrieval, oldest dropped first
+DEFAULT_MAX_FINISHED_JOBS = 100
+
+JOBS_TOTAL = telemetry.METRICS.counter("analysis_jobs_total", "Finished analysis jobs by final status")
+JOB_QUEUE_SECONDS = telemetry.METRICS.histogram("analysis_job_queue_seconds", "Time jobs waited for a worker")
+
+
+class AnalysisJob:
+    """State of one submitted analysis"""
+
+    def __init__(self, pgn_text, analysis_depth, include_ai, profile=False):
+        self.id = uuid.uuid4().hex
+        self.pgn_text = pgn_text
+        self.analysis_depth = analysis_depth
+        self.include_ai = include_ai
+        self.profile = profile
+        self.status = QUEUED
+        self.done = 0
+        self.total = 0
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.cancel_requested = threading.Event()
+        self.future = None
+
+    def snapshot(self):
+        """A JSON-friendly view of the job, without its result"""
+        return {
+            "id": self.id,
+            "status": self.status,
+            "progress": {"done": self.done, "total": self.total},
+            "analysis_depth": self.analysis_depth,
+            "profile": self.profile,
+            "error": self.error,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at
+        }
+
+
+class AnalysisJobScheduler:
+    """
+    Runs game analyses in the background.
+
+    Args:
+        game_analysis_service: The GameAnalysisService that does the work
+        max_workers: Number of analyses that may run at once
+        max_finished_jobs: Finished jobs kept for status and result lookups
+    """
+
+    def __init__(self, game_analysis_service, max_workers=2, max_finished_jobs=DEFAULT_MAX_FINISHED_JOBS):
+        self.game_analysis_service = game_analysis_service
+        self.max_finished_jobs = max_finished_jobs
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="analysis-job")
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def submit(self, pgn_text, analysis_depth="standard", include_ai=True, profile=False):
+        """
+        Queue a game for analysis and return the job ID.
+
+        With profile, the analysis runs under the profiler and its result
+        gets a "profile" report (see profiling.Profiler.report).
+        """
+        job = AnalysisJob(pgn_text, analysis_depth, include_ai, profile)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._forget_finished_jobs()
+        # The job runs in the submitter's context, so its spans go to the submitter's trace
+        context = contextvars.copy_context()
+        job.future = self._executor.submit(context.run, self._run, job)
+        add_debug_info(f"Submitted analysis job {job.id} ({analysis_depth})")
+        return job.id
+
+    def status(self, job_id):
+        """Status and progress of a job, or None for an unknown job"""
+        job = self._jobs.get(job_id)
+        return job.snapshot() if job else None
+
+    def result(self, job_id):
+        """The analysis result of a completed job, or None if it has none (yet)"""
+        job = self._jobs.get(job_id)
+        return job.result if job and job.status == COMPLETED else None
+
+    def cancel(self, job_id):
+        """
+        Ask a job to stop.
+
+        A queued job never starts; a running job stops at its next engine
+        position. Returns False if the job is unknown or already finished.
+        """
+        job = self._jobs.get(job_id)
+        if job is None or job.status in FINISHED_STATES:
+            return False
+
+        job.cancel_requested.set()
+        if job.future is not None and job.future.cancel():
+            self._finish(job, CANCELLED)
+        return True
+
+    def jobs(self):
+        """Snapshots of every known job, oldest first"""
+        with self._lock:
+            return [job.snapshot() for job in self._jobs.values()]
+
+    def shutdown(self, wait=True):
+        """Cancel all unfinished jobs and stop the workers"""
+        for job_id in list(self._jobs):
+            self.cancel(job_id)
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _run(self, job):
+        if job.cancel_requested.is_set():
+            self._finish(job, CANCELLED)
+            return
+
+        job.status = RUNNING
+        job.started_at = time.time()
+
+        def progress(done, total):
+            if job.cancel_requested.is_set():
+                raise AnalysisCancelled()
+            job.done, job.total = done, total
+
+        try:
+            if job.profile:
+                result, report = profile_call(
+                    self.game_analysis_service.analyze_game,
+                    job.pgn_text,
+                    job.analysis_depth,
+                    include_ai=job.include_ai,
+                    progress=progress
+                )
+                result["profile"] = report
+            else:
+                result = self.game_analysis_service.analyze_game(
+                    job.pgn_text,
+                    job.analysis_depth,
+                    include_ai=job.include_ai,
+                    progress=progress
+                )
+        except AnalysisCancelled:
+            self._finish(job, CANCELLED)
+            return
+        except Exception as e:
+            logger.error(f"Analysis job {job.id} crashed: {str(e)}")
+            job.error = f"Analysis error: {str(e)}"
+            self._finish(job, FAILED)
+            return
+
+        if job.cancel_requested.is_set():
+            # Cancelled after the last engine position, e.g. while waiting on the LLM
+            self._finish(job, CANCELLED)
+        elif "error" in result:
+            job.error = result["error"]
+            self._finish(job, FAILED)
+        else:
+            job.result = result
+            self._finish(job, COMPLETED)
+
+    def _finish(self, job, status):
+        job.status = status
+        job.finished_at = time.time()
+        JOBS_TOTAL.inc(status=status)
+        if job.started_at is not None:
+            JOB_QUEUE_SECONDS.observe(job.started_at - job.submitted_at)
+        add_debug_info(f"Analysis job {job.id} {status}")
+
+    def _forget_finished_jobs(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED_STATES]
+        for job_id in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+            del self._jobs[job_id]
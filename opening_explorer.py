@@ -0,0 +1,372 @@
+"""
+Opening explorer statistics precomputed from a PGN collection.
+
+For every position of the first `max_plies` plies of every finished game,
+the explorer file stores each continuation played from it: how many games
+played it, how many of those White won, drew and lost, and the average
+rating of the players. It is built once, offline:
+
+    python opening_explorer.py build lichess_db.pgn --max-plies 24 --workers 8
+    python opening_explorer.py show lichess_db.pgn.explorer "<FEN>"
+
+and opened by memory mapping it, so a lookup is a binary search over the
+position keys plus a read of that position's few continuations.
+
+Explorer file layout (little-endian):
+    header       magic, version, max plies, games, position count, move count
+    keys         uint64 x positions, sorted Zobrist keys
+    offsets      uint32 x (positions + 1); position i has moves [o[i], o[i+1])
+    games        uint32 x moves, per continuation, most played first
+    white        uint32 x moves, games White won
+    draws        uint32 x moves
+    black        uint32 x moves, games Black won
+    moves        uint16 x moves, encoded as in compact_game
+    ratings      uint16 x moves, average rating of the players (0 if unknown)
+"""
+import os
+import sys
+import mmap
+import struct
+import argparse
+import threading
+import logging
+from io import StringIO
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import chess
+import chess.pgn
+import chess.polyglot
+
+from compact_game import encode_move, decode_move
+from pgn_index import PgnIndex, close_replaced
+from position_index import position_key
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+EXPLORER_MAGIC = b"CAOPENX\x00"
+EXPLORER_VERSION = 1
+_HEADER = struct.Struct("<8sIIQQQ")
+
+# Explorer file name: the PGN path plus this suffix
+EXPLORER_SUFFIX = ".explorer"
+
+# Plies of each game counted by default
+DEFAULT_MAX_PLIES = 20
+
+# Games parsed per worker task while building
+BUILD_CHUNK_GAMES = 2000
+
+# Continuation rows collected before they are folded into the running totals
+MERGE_ROWS = 4 * 1024 * 1024
+
+# Result tag -> column of the game's outcome among white, draws, black
+_OUTCOMES = {"1-0": 0, "1/2-1/2": 1, "0-1": 2}
+
+# Build-time columns: position key and move, then the counts that are summed
+_SUM_COLUMNS = ("games", "white", "draws", "black", "rating_sum", "rated")
+
+
+def default_explorer_path(pgn_path):
+    return pgn_path + EXPLORER_SUFFIX
+
+
+class _OpeningMoves(chess.pgn.BaseVisitor):
+    """Collects (position key, move) for the first plies of a game's mainline"""
+
+    def __init__(self, max_plies):
+        self.max_plies = max_plies
+        self.moves = []
+
+    def begin_variation(self):
+        return chess.pgn.SKIP
+
+    def begin_parse_san(self, board, san):
+        # Nothing past the last counted ply needs parsing
+        if len(self.moves) >= self.max_plies:
+            return chess.pgn.SKIP
+
+    def visit_move(self, board, move):
+        if move and len(self.moves) < self.max_plies:
+            self.moves.append((chess.polyglot.zobrist_hash(board), encode_move(move)))
+
+    def handle_error(self, error):
+        # Keep the moves before an illegal move or a bad FEN, and nothing after
+        self.max_plies = len(self.moves)
+
+    def result(self):
+        return self.moves
+
+
+def game_rating(summary):
+    """Average of the players' ratings from a pgn_index summary, or None if neither is rated"""
+    ratings = []
+    for tag in ("WhiteElo", "BlackElo"):
+        try:
+            ratings.append(int(summary[tag]))
+        except ValueError:
+            pass
+    ratings = [rating for rating in ratings if rating > 0]
+    return sum(ratings) / len(ratings) if ratings else None
+
+
+def _empty_rows():
+    rows = {"key": np.empty(0, np.uint64), "move": np.empty(0, np.uint16)}
+    rows.update((column, np.empty(0, np.uint64)) for column in _SUM_COLUMNS)
+    return rows
+
+
+def aggregate(rows):
+    """Sum rows with the same (key, move) into one, sorted by key and move"""
+    if len(rows["key"]) == 0:
+        return rows
+    order = np.lexsort((rows["move"], rows["key"]))
+    key, move = rows["key"][order], rows["move"][order]
+    starts = np.flatnonzero(np.concatenate(([True], (key[1:] != key[:-1]) | (move[1:] != move[:-1]))))
+    result = {"key": key[starts], "move": move[starts]}
+    for column in _SUM_COLUMNS:
+        result[column] = np.add.reduceat(rows[column][order], starts)
+    return result
+
+
+def _concatenate(parts):
+    return {column: np.concatenate([part[column] for part in parts]) for column in parts[0]}
+
+
+def _count_range(pgn_path, start, stop, max_plies):
+    """Aggregated continuation rows of games [start, stop) of a PGN file, for a worker process"""
+    keys, moves, outcomes, ratings = [], [], [], []
+    with PgnIndex(pgn_path) as pgn:
+        for game_id in range(start, stop):
+            summary = pgn.summary(game_id)
+            outcome = _OUTCOMES.get(summary["Result"])
+            # Unfinished games have no score to count
+            if outcome is None:
+                continue
+            played = chess.pgn.read_game(StringIO(pgn.game_text(game_id)), Visitor=lambda: _OpeningMoves(max_plies))
+            rating = game_rating(summary)
+            for key, move in played or ():
+                keys.append(key)
+                moves.append(move)
+                outcomes.append(outcome)
+                ratings.append(rating)
+    if not keys:
+        return _empty_rows()
+
+    outcomes = np.array(outcomes, dtype=np.uint8)
+    rated = np.array([rating is not None for rating in ratings])
+    rows = {
+        "key": np.array(keys, dtype=np.uint64),
+        "move": np.array(moves, dtype=np.uint16),
+        "games": np.ones(len(keys), dtype=np.uint64),
+        "white": (outcomes == 0).astype(np.uint64),
+        "draws": (outcomes == 1).astype(np.uint64),
+        "black": (outcomes == 2).astype(np.uint64),
+        "rating_sum": np.array([round(rating or 0) for rating in ratings], dtype=np.uint64),
+        "rated": rated.astype(np.uint64),
+    }
+    return aggregate(rows)
+
+
+def write_explorer(path, rows, max_plies, games, min_games=1):
+    """
+    Write aggregated rows as an explorer file, replacing it atomically.
+
+    Continuations played in fewer than `min_games` games are left out.
+    """
+    keep = rows["games"] >= min_games
+    rows = {column: values[keep] for column, values in rows.items()}
+    # Most played continuation first within each position
+    order = np.lexsort((rows["move"], -rows["games"].astype(np.int64), rows["key"]))
+    rows = {column: values[order] for column, values in rows.items()}
+
+    keys, starts = np.unique(rows["key"], return_index=True)
+    offsets = np.append(starts, len(rows["key"])).astype(np.uint32)
+    ratings = np.divide(rows["rating_sum"], rows["rated"], out=np.zeros(len(rows["key"])), where=rows["rated"] > 0)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(EXPLORER_MAGIC, EXPLORER_VERSION, max_plies, games, len(keys), len(rows["key"])))
+        for column, dtype in ((keys, "<u8"), (offsets, "<u4"), (rows["games"], "<u4"), (rows["white"], "<u4"),
+                              (rows["draws"], "<u4"), (rows["black"], "<u4"), (rows["move"], "<u2"),
+                              (np.rint(ratings), "<u2")):
+            f.write(np.ascontiguousarray(column, dtype=dtype).tobytes())
+    os.replace(tmp_path, path)
+
+
+def build_explorer(pgn_path, explorer_path=None, max_plies=DEFAULT_MAX_PLIES, min_games=1, workers=1,
+                   chunk_games=BUILD_CHUNK_GAMES):
+    """
+    Count the opening continuations of every game in a PGN file and write the explorer file.
+
+    Returns:
+        The number of games in the PGN file
+    """
+    explorer_path = explorer_path or default_explorer_path(pgn_path)
+    with PgnIndex(pgn_path) as pgn:
+        total = len(pgn)
+    chunks = [(first, min(first + chunk_games, total)) for first in range(0, total, chunk_games)]
+
+    totals = _empty_rows()
+    pending = []
+    pending_rows = 0
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 and len(chunks) > 1 else None
+    try:
+        if executor:
+            results = executor.map(_count_range, [pgn_path] * len(chunks), *zip(*chunks),
+                                   [max_plies] * len(chunks))
+        else:
+            results = (_count_range(pgn_path, first, stop, max_plies) for first, stop in chunks)
+        for rows in results:
+            pending.append(rows)
+            pending_rows += len(rows["key"])
+            # Fold into the totals once the pending rows outgrow them, so folding stays linear overall
+            if pending_rows >= max(MERGE_ROWS, len(totals["key"])):
+                totals = aggregate(_concatenate([totals] + pending))
+                pending, pending_rows = [], 0
+    finally:
+        if executor:
+            executor.shutdown()
+    totals = aggregate(_concatenate([totals] + pending))
+
+    write_explorer(explorer_path, totals, max_plies, total, min_games)
+    logger.info(f"Counted openings of {total} games from {pgn_path}")
+    return total
+
+
+class OpeningExplorer:
+    """An explorer file, memory-mapped for lookups"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.max_plies, self.games, positions, moves = _HEADER.unpack_from(self._map)
+        if magic != EXPLORER_MAGIC or version != EXPLORER_VERSION:
+            self._map.close()
+            raise ValueError(f"{path} is not an opening explorer file")
+
+        offset = _HEADER.size
+        columns = {}
+        for name, dtype, count in (("keys", "<u8", positions), ("offsets", "<u4", positions + 1),
+                                   ("games", "<u4", moves), ("white", "<u4", moves), ("draws", "<u4", moves),
+                                   ("black", "<u4", moves), ("moves", "<u2", moves), ("ratings", "<u2", moves)):
+            columns[name] = np.frombuffer(self._map, dtype=dtype, count=count, offset=offset)
+            offset += columns[name].nbytes
+        self._columns = columns
+
+    def __len__(self):
+        """Number of positions with statistics"""
+        return len(self._columns["keys"])
+
+    def lookup(self, board_or_key):
+        """
+        The continuations played from a position.
+
+        Args:
+            board_or_key: A chess.Board or its Zobrist key
+
+        Returns:
+            A dict with the position's total "games", "white", "draws" and
+            "black", and "moves": one dict per continuation, most played first,
+            with "uci", the same counts and "average_rating" (None if unknown)
+        """
+        columns = self._columns
+        key = np.uint64(position_key(board_or_key))
+        position = int(np.searchsorted(columns["keys"], key))
+        if position == len(columns["keys"]) or columns["keys"][position] != key:
+            return {"games": 0, "white": 0, "draws": 0, "black": 0, "moves": []}
+
+        start, end = int(columns["offsets"][position]), int(columns["offsets"][position + 1])
+        moves = [
+            {
+                "uci": decode_move(code).uci(),
+                "games": games,
+                "white": white,
+                "draws": draws,
+                "black": black,
+                "average_rating": rating or None
+            }
+            for code, games, white, draws, black, rating in zip(
+                columns["moves"][start:end].tolist(), columns["games"][start:end].tolist(),
+                columns["white"][start:end].tolist(), columns["draws"][start:end].tolist(),
+                columns["black"][start:end].tolist(), columns["ratings"][start:end].tolist()
+            )
+        ]
+        return {
+            "games": sum(move["games"] for move in moves),
+            "white": sum(move["white"] for move in moves),
+            "draws": sum(move["draws"] for move in moves),
+            "black": sum(move["black"] for move in moves),
+            "moves": moves
+        }
+
+    def close(self):
+        # The arrays export the map's buffer, so they go first
+        self._columns = None
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+# One explorer per file, opened on first use and shared by every session in the process
+_explorers = {}
+_explorers_lock = threading.Lock()
+
+
+def get_opening_explorer(path):
+    """The process-wide OpeningExplorer for a file, or None if it does not exist; reopened when rebuilt"""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    key = os.path.abspath(path)
+    stale = None
+    with _explorers_lock:
+        entry = _explorers.get(key)
+        if entry is None or entry[0] != (stat.st_size, stat.st_mtime_ns):
+            stale = entry[1] if entry else None
+            entry = ((stat.st_size, stat.st_mtime_ns), OpeningExplorer(path))
+            _explorers[key] = entry
+    if stale is not None:
+        close_replaced(stale)
+    return entry[1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Precompute opening explorer statistics from a PGN collection")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="Count the opening continuations of every game")
+    build.add_argument("pgn")
+    build.add_argument("-o", "--output", help=f"Explorer file (default: the PGN path plus {EXPLORER_SUFFIX})")
+    build.add_argument("--max-plies", type=int, default=DEFAULT_MAX_PLIES, help="Plies counted per game")
+    build.add_argument("--min-games", type=int, default=1, help="Leave out continuations played less often")
+    build.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    show = subparsers.add_parser("show", help="Print the continuations of a position")
+    show.add_argument("explorer")
+    show.add_argument("fen", nargs="?", default=chess.STARTING_FEN)
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        games = build_explorer(args.pgn, args.output, max_plies=args.max_plies, min_games=args.min_games,
+                               workers=args.workers)
+        print(f"{games} games", file=sys.stderr)
+        return 0
+
+    board = chess.Board(args.fen)
+    with OpeningExplorer(args.explorer) as explorer:
+        stats = explorer.lookup(board)
+        for move in stats["moves"]:
+            san = board.san(chess.Move.from_uci(move["uci"]))
+            print(f"{san}\t{move['games']}\t+{move['white']} ={move['draws']} -{move['black']}\t"
+                  f"{move['average_rating'] or '-'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,334 @@
+"""
+Random access to the games of large PGN files.
+
+The PGN file is memory-mapped and scanned once for the byte offset of every
+game and a summary of its headers. Both go to a sidecar index file next to
+the PGN (games.pgn -> games.pgn.idx), which is itself memory-mapped on later
+opens, so a multi-gigabyte database is browsable at once and reading game N
+touches only that game's bytes:
+
+    python pgn_index.py build lichess_2024-01.pgn
+    python pgn_index.py show lichess_2024-01.pgn 123456
+
+Every game must start with a tag pair section, as exported PGN always does;
+a game is taken to start at the first tag line after movetext.
+
+Index file layout (little-endian, which the tables are read as natively):
+    header             magic, version, reserved, PGN size, PGN mtime (ns), game count
+    game offsets       uint64 x (games + 1); game i is bytes [o[i], o[i+1]) of the PGN
+    summary offsets    uint64 x (games + 1) into the summary data
+    summary data       one JSON array of SUMMARY_TAGS values per game
+"""
+import os
+import re
+import sys
+import json
+import mmap
+import shutil
+import struct
+import hashlib
+import tempfile
+import argparse
+import threading
+import logging
+from io import StringIO
+import chess.pgn
+
+from cache_service import DEFAULT_CACHE_DIR
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+INDEX_MAGIC = b"CAPGNIX\x00"
+INDEX_VERSION = 1
+# Padded to 40 bytes so the uint64 tables that follow are aligned
+_HEADER = struct.Struct("<8sIIQqQ")
+
+# Sidecar file name: the PGN path plus this suffix
+INDEX_SUFFIX = ".idx"
+
+# Where indexes of PGN files in read-only directories go
+DEFAULT_PGN_INDEX_DIR = os.path.join(DEFAULT_CACHE_DIR, "pgn_index")
+
+# Headers kept per game in the index
+SUMMARY_TAGS = ("Event", "Site", "Date", "White", "Black", "Result", "WhiteElo", "BlackElo", "ECO")
+
+# A tag pair at the start of a line; the regex scan runs in C over the whole map
+_TAG_PAIR = re.compile(rb'^\[([A-Za-z0-9_]+)\s+"((?:[^"\\\r\n]|\\.)*)"\s*\]', re.MULTILINE)
+_ESCAPE = re.compile(r'\\(.)')
+
+
+def default_index_path(pgn_path):
+    """Next to the PGN file, or in the cache directory if the PGN's directory is read-only"""
+    directory = os.path.dirname(os.path.abspath(pgn_path))
+    if os.access(directory, os.W_OK):
+        return pgn_path + INDEX_SUFFIX
+    digest = hashlib.sha1(os.path.abspath(pgn_path).encode("utf-8")).hexdigest()
+    return os.path.join(DEFAULT_PGN_INDEX_DIR, digest + INDEX_SUFFIX)
+
+
+def scan_games(data):
+    """
+    Find the games in PGN bytes.
+
+    Yields:
+        (start offset, summary) per game, the summary being the list of its
+        SUMMARY_TAGS values ("" where a tag is missing)
+    """
+    wanted = {tag.encode("ascii"): i for i, tag in enumerate(SUMMARY_TAGS)}
+    previous_end = None
+    start = None
+    summary = None
+    for match in _TAG_PAIR.finditer(data):
+        # Anything but whitespace between two tag pairs is movetext, so a new game starts
+        if previous_end is None or data[previous_end:match.start()].strip():
+            if summary is not None:
+                yield start, summary
+            start = match.start()
+            summary = [""] * len(SUMMARY_TAGS)
+        previous_end = match.end()
+
+        column = wanted.get(match.group(1))
+        if column is not None:
+            value = match.group(2).decode("utf-8", errors="replace")
+            summary[column] = _ESCAPE.sub(r"\1", value) if "\\" in value else value
+    if summary is not None:
+        yield start, summary
+
+
+def build_index(pgn_path, index_path=None):
+    """
+    Scan a PGN file and write its index.
+
+    The sections are streamed to temporary files while scanning, so memory
+    use does not grow with the number of games.
+
+    Returns:
+        The number of games indexed
+    """
+    index_path = index_path or default_index_path(pgn_path)
+    directory = os.path.dirname(index_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    stat = os.stat(pgn_path)
+
+    count = 0
+    with tempfile.TemporaryFile() as offsets, tempfile.TemporaryFile() as summary_offsets, \
+            tempfile.TemporaryFile() as summaries:
+        summary_end = 0
+        summary_offsets.write(struct.pack("<Q", 0))
+        if stat.st_size:
+            with open(pgn_path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                for start, summary in scan_games(data):
+                    blob = json.dumps(summary, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+                    summaries.write(blob)
+                    summary_end += len(blob)
+                    offsets.write(struct.pack("<Q", start))
+                    summary_offsets.write(struct.pack("<Q", summary_end))
+                    count += 1
+        offsets.write(struct.pack("<Q", stat.st_size))
+
+        # Write and rename so a concurrent reader never maps half an index
+        tmp_path = f"{index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as index:
+            index.write(_HEADER.pack(INDEX_MAGIC, INDEX_VERSION, 0, stat.st_size, stat.st_mtime_ns, count))
+            for section in (offsets, summary_offsets, summaries):
+                section.seek(0)
+                shutil.copyfileobj(section, index)
+        os.replace(tmp_path, index_path)
+
+    logger.info(f"Indexed {count} games in {pgn_path}")
+    return count
+
+
+def _index_matches(header, stat):
+    magic, version, _, size, mtime_ns, _ = header
+    return magic == INDEX_MAGIC and version == INDEX_VERSION and size == stat.st_size and mtime_ns == stat.st_mtime_ns
+
+
+class PgnIndex:
+    """
+    A PGN file opened for random access by game number (0-based).
+
+    The sidecar index is reused while the PGN's size and modification time
+    match it, and rebuilt otherwise.
+    """
+
+    def __init__(self, pgn_path, index_path=None, rebuild=False):
+        self.pgn_path = pgn_path
+        self.index_path = index_path or default_index_path(pgn_path)
+        stat = os.stat(pgn_path)
+
+        self._maps = []
+        index = None
+        if not rebuild and os.path.exists(self.index_path):
+            index = self._map(self.index_path)
+            if len(index) < _HEADER.size or not _index_matches(_HEADER.unpack_from(index), stat):
+                if len(index):
+                    self._maps.pop().close()
+                index = None
+        if index is None:
+            build_index(pgn_path, self.index_path)
+            index = self._map(self.index_path)
+
+        self._index = memoryview(index)
+        count = _HEADER.unpack_from(self._index)[5]
+        table_bytes = 8 * (count + 1)
+        start = _HEADER.size
+        self._offsets = self._index[start:start + table_bytes].cast("Q")
+        self._summary_offsets = self._index[start + table_bytes:start + 2 * table_bytes].cast("Q")
+        self._summaries = self._index[start + 2 * table_bytes:]
+        self._data = self._map(pgn_path) if stat.st_size else b""
+
+    def _map(self, path):
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return b""
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mapped)
+        return mapped
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def _check(self, game_id):
+        if not 0 <= game_id < len(self):
+            raise IndexError(f"game {game_id} out of range for {len(self)} games")
+
+    def offsets(self, game_id):
+        """Byte range [start, end) of a game in the PGN file"""
+        self._check(game_id)
+        return self._offsets[game_id], self._offsets[game_id + 1]
+
+    def game_bytes(self, game_id):
+        start, end = self.offsets(game_id)
+        return bytes(self._data[start:end])
+
+    def game_text(self, game_id):
+        """The PGN text of one game, as analyze_game takes it"""
+        return self.game_bytes(game_id).decode("utf-8", errors="replace")
+
+    def read_game(self, game_id):
+        """One game parsed as a chess.pgn.Game"""
+        return chess.pgn.read_game(StringIO(self.game_text(game_id)))
+
+    def summary(self, game_id):
+        """The SUMMARY_TAGS headers of a game as a dict, without reading the PGN"""
+        self._check(game_id)
+        start = self._summary_offsets[game_id]
+        end = self._summary_offsets[game_id + 1]
+        values = json.loads(bytes(self._summaries[start:end]).decode("utf-8"))
+        return dict(zip(SUMMARY_TAGS, values))
+
+    def iter_games(self, start=0, stop=None):
+        """Yield (game_id, pgn_text) for the games in [start, stop)"""
+        stop = len(self) if stop is None else min(stop, len(self))
+        for game_id in range(start, stop):
+            yield game_id, self.game_text(game_id)
+
+    def partition(self, parts):
+        """
+        Split the file into up to `parts` runs of consecutive games of similar byte size.
+
+        Returns:
+            A list of (first game, last game + 1) ranges covering every game,
+            for workers that each read their own share of the file
+        """
+        count = len(self)
+        if count == 0:
+            return []
+        parts = max(1, min(parts, count))
+        total = self._offsets[count] - self._offsets[0]
+        ranges = []
+        first = 0
+        for part in range(1, parts):
+            target = self._offsets[0] + total * part // parts
+            # The first game starting at or after the byte target begins the next part
+            boundary = _bisect(self._offsets, target, first + 1, count)
+            if boundary > first and boundary < count:
+                ranges.append((first, boundary))
+                first = boundary
+        ranges.append((first, count))
+        return ranges
+
+    def close(self):
+        self._offsets.release()
+        self._summary_offsets.release()
+        self._summaries.release()
+        self._index.release()
+        for mapped in self._maps:
+            mapped.close()
+        self._maps = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _bisect(values, target, low, high):
+    """First index in [low, high) whose value is >= target, or high"""
+    while low < high:
+        middle = (low + high) // 2
+        if values[middle] < target:
+            low = middle + 1
+        else:
+            high = middle
+    return low
+
+
+# One index per PGN file, opened on first use and shared by every session in the process
+_pgn_indexes = {}
+_pgn_indexes_lock = threading.Lock()
+
+
+def get_pgn_index(pgn_path):
+    """The process-wide PgnIndex for a PGN file, reopened when the file has changed"""
+    stat = os.stat(pgn_path)
+    key = os.path.abspath(pgn_path)
+    stale = None
+    with _pgn_indexes_lock:
+        entry = _pgn_indexes.get(key)
+        if entry is None or entry[0] != (stat.st_size, stat.st_mtime_ns):
+            stale = entry[1] if entry else None
+            entry = ((stat.st_size, stat.st_mtime_ns), PgnIndex(pgn_path))
+            _pgn_indexes[key] = entry
+    if stale is not None:
+        close_replaced(stale)
+    return entry[1]
+
+
+def close_replaced(index):
+    """Close an index a rebuilt one has replaced, unless a reader still holds one of its buffers"""
+    try:
+        index.close()
+    except BufferError as e:
+        # The maps are released with the last reference instead
+        logger.warning(f"Could not close replaced index yet: {str(e)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index a PGN file for random access to its games")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="Scan the PGN and write its index file")
+    build.add_argument("pgn")
+    build.add_argument("--index", help=f"Index file (default: the PGN path plus {INDEX_SUFFIX})")
+    show = subparsers.add_parser("show", help="Print one game")
+    show.add_argument("pgn")
+    show.add_argument("game", type=int, help="Game number, from 0")
+    args = parser.parse_args(argv)
+
+    if args.command == "build":
+        with PgnIndex(args.pgn, args.index, rebuild=True) as index:
+            print(f"{len(index)} games", file=sys.stderr)
+        return 0
+
+    with PgnIndex(args.pgn) as index:
+        print(index.game_text(args.game))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,370 @@
+"""
+Which games of a collection reach a given position.
+
+Every position of every indexed game is stored as a (Zobrist key, game id,
+ply) record, sorted by key, in memory-mapped segment files, so finding all
+games through a position is a binary search per segment:
+
+    python position_index.py build lichess_db.pgn --workers 8
+    python position_index.py lookup lichess_db.pgn "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3"
+
+Game ids are game numbers in the PGN file (see pgn_index). New games are
+added as a new sorted segment, so appending to the PGN and running build
+again only indexes the new games; segments are merged once there are more
+than MAX_SEGMENTS. The index is a directory (games.pgn -> games.pgn.positions)
+holding the segments and a manifest.json naming them.
+
+Segment file layout (little-endian):
+    header    magic, version, reserved, record count
+    keys      uint64 x count, sorted
+    games     uint32 x count
+    plies     uint32 x count
+"""
+import os
+import sys
+import json
+import mmap
+import uuid
+import struct
+import argparse
+import threading
+import logging
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import chess
+import chess.polyglot
+
+from compact_game import CompactGame
+from pgn_index import PgnIndex, close_replaced
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SEGMENT_MAGIC = b"CAPOSIX\x00"
+SEGMENT_VERSION = 1
+_HEADER = struct.Struct("<8sIIQ")
+
+MANIFEST_NAME = "manifest.json"
+
+# Index directory name: the PGN path plus this suffix
+INDEX_SUFFIX = ".positions"
+
+# Segments kept before an append merges the smallest ones, down to half as many
+MAX_SEGMENTS = 8
+
+# Games parsed per worker task while building
+BUILD_CHUNK_GAMES = 2000
+
+# Records buffered while building before they are written out as a segment (16 bytes each)
+SEGMENT_RECORDS = 32 * 1024 * 1024
+
+
+def default_index_path(pgn_path):
+    return pgn_path + INDEX_SUFFIX
+
+
+def position_key(board_or_key):
+    """The Zobrist key of a board, or the key itself"""
+    if isinstance(board_or_key, chess.Board):
+        return chess.polyglot.zobrist_hash(board_or_key)
+    return int(board_or_key)
+
+
+def game_records(game_id, pgn_game):
+    """Key, game and ply arrays for every position of a chess.pgn.Game's mainline"""
+    keys = np.frombuffer(CompactGame.from_pgn_game(pgn_game).keys(), dtype=np.uint64)
+    return keys, np.full(len(keys), game_id, dtype=np.uint32), np.arange(len(keys), dtype=np.uint32)
+
+
+def sort_records(keys, games, plies):
+    order = np.lexsort((plies, games, keys))
+    return keys[order], games[order], plies[order]
+
+
+def write_segment(path, keys, games, plies):
+    """Write sorted records to a segment file, replacing it atomically"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(_HEADER.pack(SEGMENT_MAGIC, SEGMENT_VERSION, 0, len(keys)))
+        for column, dtype in ((keys, "<u8"), (games, "<u4"), (plies, "<u4")):
+            f.write(np.ascontiguousarray(column, dtype=dtype).tobytes())
+    os.replace(tmp_path, path)
+
+
+class Segment:
+    """One memory-mapped, sorted run of records"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, _, count = _HEADER.unpack_from(self._map)
+        if magic != SEGMENT_MAGIC or version != SEGMENT_VERSION:
+            self._map.close()
+            raise ValueError(f"{path} is not a position index segment")
+        offset = _HEADER.size
+        self.keys = np.frombuffer(self._map, dtype="<u8", count=count, offset=offset)
+        self.games = np.frombuffer(self._map, dtype="<u4", count=count, offset=offset + 8 * count)
+        self.plies = np.frombuffer(self._map, dtype="<u4", count=count, offset=offset + 12 * count)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def find(self, key):
+        """Slice bounds of the records with this key"""
+        key = np.uint64(key)
+        return np.searchsorted(self.keys, key, "left"), np.searchsorted(self.keys, key, "right")
+
+    def close(self):
+        # The arrays export the map's buffer, so they go first
+        self.keys = self.games = self.plies = None
+        self._map.close()
+
+
+class PositionIndex:
+    """
+    A position index directory, created empty if it does not exist.
+
+    `games` is the number of games indexed so far; game ids run from 0 to
+    games - 1, and the next game added must have id `games`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        manifest = self._read_manifest()
+        self.games = manifest["games"]
+        self.segments = [Segment(os.path.join(path, name)) for name in manifest["segments"]]
+
+    def _read_manifest(self):
+        try:
+            with open(os.path.join(self.path, MANIFEST_NAME)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"games": 0, "segments": []}
+
+    def _write_manifest(self):
+        manifest = {
+            "games": self.games,
+            "segments": [os.path.basename(segment.path) for segment in self.segments]
+        }
+        path = os.path.join(self.path, MANIFEST_NAME)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp_path, path)
+
+    def __len__(self):
+        """Number of (key, game, ply) records"""
+        return sum(len(segment) for segment in self.segments)
+
+    def lookup(self, board_or_key):
+        """
+        Every (game id, ply) reaching a position, ordered by game and ply.
+
+        Args:
+            board_or_key: A chess.Board or its Zobrist key
+        """
+        key = position_key(board_or_key)
+        games, plies = [], []
+        # Appends may merge and close segments
+        with self._lock:
+            for segment in self.segments:
+                low, high = segment.find(key)
+                games.append(segment.games[low:high].copy())
+                plies.append(segment.plies[low:high].copy())
+        if not games:
+            return []
+        games, plies = np.concatenate(games), np.concatenate(plies)
+        order = np.lexsort((plies, games))
+        return list(zip(games[order].tolist(), plies[order].tolist()))
+
+    def count(self, board_or_key):
+        """Number of distinct games reaching a position"""
+        return len({game for game, _ in self.lookup(board_or_key)})
+
+    def append(self, keys, games, plies, game_count):
+        """
+        Add the records of new games as a new segment.
+
+        Args:
+            keys, games, plies: Record arrays, in any order
+            game_count: Number of games they cover; their ids must run from
+                `games` to `games + game_count - 1`
+        """
+        with self._lock:
+            if len(games) and (int(games.min()) < self.games or int(games.max()) >= self.games + game_count):
+                raise ValueError(f"game ids must run from {self.games} to {self.games + game_count - 1}")
+            if len(keys):
+                path = os.path.join(self.path, f"segment-{uuid.uuid4().hex[:12]}.bin")
+                write_segment(path, *sort_records(keys, games, plies))
+                self.segments.append(Segment(path))
+            self.games += game_count
+            self._write_manifest()
+            if len(self.segments) > MAX_SEGMENTS:
+                # Merging only the smallest segments keeps the memory a merge needs bounded
+                by_size = sorted(self.segments, key=len)
+                self._merge(by_size[:len(self.segments) - MAX_SEGMENTS // 2 + 1])
+
+    def add_games(self, pgn_games):
+        """Index chess.pgn.Game objects as the next game ids, in order"""
+        records = [game_records(self.games + offset, game) for offset, game in enumerate(pgn_games)]
+        if records:
+            self.append(*(np.concatenate(column) for column in zip(*records)), len(records))
+
+    def compact(self):
+        """Merge every segment into one; needs memory for all the records"""
+        with self._lock:
+            self._merge(self.segments)
+
+    def _merge(self, segments):
+        if len(segments) < 2:
+            return
+        merged = sort_records(
+            np.concatenate([segment.keys for segment in segments]),
+            np.concatenate([segment.games for segment in segments]),
+            np.concatenate([segment.plies for segment in segments])
+        )
+        path = os.path.join(self.path, f"segment-{uuid.uuid4().hex[:12]}.bin")
+        write_segment(path, *merged)
+        self.segments = [segment for segment in self.segments if segment not in segments] + [Segment(path)]
+        self._write_manifest()
+        for segment in segments:
+            segment.close()
+            os.remove(segment.path)
+        logger.info(f"Merged {len(segments)} position index segments")
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+        self.segments = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def _index_range(pgn_path, start, stop):
+    """Records of games [start, stop) of a PGN file, for a worker process"""
+    with PgnIndex(pgn_path) as pgn:
+        records = []
+        for game_id in range(start, stop):
+            game = pgn.read_game(game_id)
+            if game is not None:
+                records.append(game_records(game_id, game))
+    if not records:
+        return (np.empty(0, np.uint64), np.empty(0, np.uint32), np.empty(0, np.uint32))
+    return tuple(np.concatenate(column) for column in zip(*records))
+
+
+def update_from_pgn(index, pgn_path, workers=1, chunk_games=BUILD_CHUNK_GAMES):
+    """
+    Index the games of a PGN file that the index does not have yet.
+
+    The PGN is treated as append-only: games already indexed are assumed
+    unchanged, so only games from `index.games` on are read.
+
+    Returns:
+        The number of games added
+    """
+    with PgnIndex(pgn_path) as pgn:
+        total = len(pgn)
+    if total < index.games:
+        raise ValueError(f"{pgn_path} has {total} games but the index has {index.games}; rebuild it")
+
+    start = index.games
+    chunks = [(first, min(first + chunk_games, total)) for first in range(start, total, chunk_games)]
+    if not chunks:
+        return 0
+
+    parts = []
+    buffered = 0
+
+    def flush(stop):
+        nonlocal parts, buffered
+        index.append(*(np.concatenate(column) for column in zip(*parts)), stop - index.games)
+        parts, buffered = [], 0
+
+    executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        if executor:
+            results = executor.map(_index_range, [pgn_path] * len(chunks), *zip(*chunks))
+        else:
+            results = (_index_range(pgn_path, first, stop) for first, stop in chunks)
+        # Chunks come back in order, so every flush covers the next run of game ids
+        for (_, stop), part in zip(chunks, results):
+            parts.append(part)
+            buffered += len(part[0])
+            if buffered >= SEGMENT_RECORDS:
+                flush(stop)
+        if parts:
+            flush(total)
+    finally:
+        if executor:
+            executor.shutdown()
+
+    logger.info(f"Indexed positions of {total - start} games from {pgn_path}")
+    return total - start
+
+
+# One index per PGN file, opened on first use and shared by every session in the process
+_position_indexes = {}
+_position_indexes_lock = threading.Lock()
+
+
+def get_position_index(pgn_path):
+    """
+    The process-wide PositionIndex of a PGN file, or None if it has not been built.
+
+    Reopened when the manifest changes, e.g. after `build` ran in another process.
+    """
+    path = default_index_path(pgn_path)
+    try:
+        mtime_ns = os.stat(os.path.join(path, MANIFEST_NAME)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    key = os.path.abspath(path)
+    stale = None
+    with _position_indexes_lock:
+        entry = _position_indexes.get(key)
+        if entry is None or entry[0] != mtime_ns:
+            stale = entry[1] if entry else None
+            entry = (mtime_ns, PositionIndex(path))
+            _position_indexes[key] = entry
+    if stale is not None:
+        close_replaced(stale)
+    return entry[1]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Index every position of a PGN collection")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    build = subparsers.add_parser("build", help="Index the games not indexed yet")
+    build.add_argument("pgn")
+    build.add_argument("--index", help=f"Index directory (default: the PGN path plus {INDEX_SUFFIX})")
+    build.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1, help="Worker processes")
+    lookup = subparsers.add_parser("lookup", help="List the games reaching a position")
+    lookup.add_argument("pgn")
+    lookup.add_argument("fen")
+    lookup.add_argument("--index", help=f"Index directory (default: the PGN path plus {INDEX_SUFFIX})")
+    args = parser.parse_args(argv)
+
+    with PositionIndex(args.index or default_index_path(args.pgn)) as index:
+        if args.command == "build":
+            added = update_from_pgn(index, args.pgn, workers=args.workers)
+            print(f"Added {added} games; {index.games} games, {len(index)} positions indexed", file=sys.stderr)
+            return 0
+
+        with PgnIndex(args.pgn) as pgn:
+            for game_id, ply in index.lookup(chess.Board(args.fen)):
+                summary = pgn.summary(game_id)
+                print(f"{game_id}\t{ply}\t{summary['White']} - {summary['Black']}\t{summary['Result']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,166 @@
+"""
+Opt-in profiling of single requests.
+
+Runs one analysis or one page render under cProfile and condenses the
+result into a report: the top functions by cumulative time, plus the raw
+profile in the pstats file format, which can be downloaded and opened with
+`python -m pstats` or snakeviz:
+
+    python -m pstats analysis.prof
+
+cProfile only sees the thread it runs on. Work done on the engine pool's
+threads shows up as time spent waiting for their results; the spans in the
+session trace break that time down further.
+"""
+import os
+import sys
+import time
+import marshal
+import pstats
+import cProfile
+import threading
+import logging
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Functions listed in a profile report
+DEFAULT_TOP_N = 20
+
+# Sort orders a report can use, as pstats names them, and their column in the raw stats
+SORT_COLUMNS = {"cumulative": 3, "tottime": 2, "ncalls": 1}
+
+_REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+_STDLIB_DIR = os.path.dirname(os.__file__)
+
+# From Python 3.12 on, only one profiler may be active per process, so profiles run one at a time
+_SINGLE_PROFILER = sys.version_info >= (3, 12)
+_profiler_lock = threading.Lock()
+
+
+def profiling_enabled():
+    """Whether requests are profiled by default (PROFILE_REQUESTS)"""
+    return os.getenv("PROFILE_REQUESTS", "").lower() in ("1", "true", "yes")
+
+
+def default_top_n():
+    return int(os.getenv("PROFILE_TOP_N", str(DEFAULT_TOP_N)))
+
+
+def _short_path(path):
+    """A file path relative to the repo, site-packages or the standard library, whichever it is in"""
+    marker = "site-packages" + os.sep
+    if marker in path:
+        return path.split(marker, 1)[1]
+    for directory in (_REPO_DIR, _STDLIB_DIR):
+        if path.startswith(directory + os.sep):
+            return os.path.relpath(path, directory)
+    return path
+
+
+def _function_name(key):
+    path, line, name = key
+    if path == "~":
+        # Built-ins such as {method 'acquire' of '_thread.lock' objects}
+        return name
+    return f"{_short_path(path)}:{line}({name})"
+
+
+class Profiler:
+    """
+    Profile a block of code:
+
+        with Profiler() as profiler:
+            render_page()
+        report = profiler.report()
+
+    If another profile is already running, the block runs unprofiled and
+    the report carries an "error" instead.
+    """
+
+    def __init__(self):
+        self._profile = cProfile.Profile()
+        self._active = False
+        self.wall_seconds = None
+
+    def __enter__(self):
+        self._active = _profiler_lock.acquire(blocking=False) if _SINGLE_PROFILER else True
+        self._started = time.perf_counter()
+        if self._active:
+            self._profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        if self._active:
+            self._profile.disable()
+            if _SINGLE_PROFILER:
+                _profiler_lock.release()
+        self.wall_seconds = time.perf_counter() - self._started
+        return False
+
+    def report(self, top_n=None, sort="cumulative"):
+        """
+        Summarize the profile.
+
+        Args:
+            top_n: Functions to list (default PROFILE_TOP_N, or 20)
+            sort: "cumulative", "tottime" or "ncalls"
+
+        Returns:
+            A dict with the "wall_seconds" of the block, the "total_calls",
+            the "top_functions" (function, calls, own and cumulative seconds)
+            and the raw profile as "stats" bytes, in the pstats file format
+        """
+        if not self._active:
+            return {"error": "Another profile was already running", "wall_seconds": self.wall_seconds}
+        top_n = default_top_n() if top_n is None else top_n
+
+        stats = pstats.Stats(self._profile).stats
+        column = SORT_COLUMNS[sort]
+        ranked = sorted(stats.items(), key=lambda item: item[1][column], reverse=True)
+        return {
+            "wall_seconds": round(self.wall_seconds, 4),
+            "total_calls": sum(value[1] for value in stats.values()),
+            "sort": sort,
+            "top_functions": [
+                {
+                    "function": _function_name(key),
+                    "calls": calls,
+                    "primitive_calls": primitive_calls,
+                    "own_seconds": round(own, 6),
+                    "cumulative_seconds": round(cumulative, 6)
+                }
+                for key, (primitive_calls, calls, own, cumulative, _) in ranked[:top_n]
+            ],
+            "stats": marshal.dumps(stats)
+        }
+
+
+def profile_call(func, *args, top_n=None, **kwargs):
+    """
+    Call func(*args, **kwargs) under the profiler.
+
+    Returns:
+        A tuple of the call's return value and the profile report
+    """
+    with Profiler() as profiler:
+        result = func(*args, **kwargs)
+    report = profiler.report(top_n=top_n)
+    if "error" not in report:
+        logger.info(f"Profiled {getattr(func, '__name__', 'call')}: {report['wall_seconds']:.3f}s, "
+                    f"{report['total_calls']} calls")
+    return result, report
+
+
+def format_report(report):
+    """The top functions of a report as a fixed-width text table"""
+    if "error" in report:
+        return report["error"]
+    lines = [f"{'calls':>10} {'own s':>10} {'cum s':>10}  function"]
+    for row in report["top_functions"]:
+        calls = str(row["calls"])
+        if row["primitive_calls"] != row["calls"]:
+            calls = f"{row['calls']}/{row['primitive_calls']}"
+        lines.append(f"{calls:>10} {row['own_seconds']:>10.4f} {row['cumulative_seconds']:>10.4f}  {row['function']}")
+    return "\n".join(lines)
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+A pure-Python stand-in for Stockfish that speaks UCI.
+
+It plays no real chess: the evaluation is material plus a small offset
+derived from the position's Zobrist hash, and the principal variation
+greedily follows that evaluation. Output depends only on the position and
+the search limits, so runs are reproducible, and search time follows a
+simulated node rate so the pipeline can be load-tested without the
+Stockfish binary:
+
+    STOCKFISH_PATH=stub streamlit run app.py
+
+Speed is set with the NodesPerSecond and Latency UCI options, whose
+defaults come from STUB_ENGINE_NPS and STUB_ENGINE_LATENCY_MS.
+"""
+import os
+import sys
+import time
+import threading
+import chess
+import chess.polyglot
+
+ENGINE_NAME = "Stub Engine 1.0"
+
+# Centipawn value of each piece type for the material evaluation
+PIECE_VALUES = {
+    chess.PAWN: 100,
+    chess.KNIGHT: 300,
+    chess.BISHOP: 320,
+    chess.ROOK: 500,
+    chess.QUEEN: 900,
+    chess.KING: 0,
+}
+
+# Depth searched by "go" without a depth, node or time limit, unless stopped earlier
+MAX_DEPTH = 64
+
+# Simulated nodes searched up to a depth: grows quadratically so deep searches stay cheap
+NODES_PER_DEPTH_SQUARED = 1000
+
+# Length of the reported principal variations
+PV_LENGTH = 4
+
+
+def evaluate(board):
+    """Material plus a deterministic per-position offset, from the side to move's view"""
+    score = 0
+    for piece_type, value in PIECE_VALUES.items():
+        score += value * (len(board.pieces(piece_type, board.turn)) - len(board.pieces(piece_type, not board.turn)))
+    return score + chess.polyglot.zobrist_hash(board) % 41 - 20
+
+
+def ranked_moves(board):
+    """Legal moves with their scores for the side to move, best first"""
+    scored = []
+    for move in board.legal_moves:
+        board.push(move)
+        if board.is_checkmate():
+            score = 100000
+        elif board.is_game_over():
+            score = 0
+        else:
+            score = -evaluate(board)
+        board.pop()
+        # Ties go to the move that sorts first, so the order never varies
+        scored.append((-score, move.uci(), move, score))
+    scored.sort()
+    return [(move, score) for _, _, move, score in scored]
+
+
+def principal_variation(board, first_move):
+    board = board.copy(stack=False)
+    pv = [first_move]
+    board.push(first_move)
+    while len(pv) < PV_LENGTH and not board.is_game_over():
+        reply = ranked_moves(board)[0][0]
+        pv.append(reply)
+        board.push(reply)
+    return pv
+
+
+def nodes_at_depth(depth):
+    return NODES_PER_DEPTH_SQUARED * depth * depth
+
+
+class StubEngine:
+    def __init__(self, output=sys.stdout):
+        self.output = output
+        self.board = chess.Board()
+        self.options = {
+            "Threads": 1,
+            "Hash": 16,
+            "MultiPV": 1,
+            "NodesPerSecond": int(os.getenv("STUB_ENGINE_NPS", "2000000")),
+            "Latency": int(os.getenv("STUB_ENGINE_LATENCY_MS", "0")),
+        }
+        self._stop = threading.Event()
+        self._search = None
+        self._write_lock = threading.Lock()
+
+    def send(self, line):
+        with self._write_lock:
+            self.output.write(line + "\n")
+            self.output.flush()
+
+    def handle(self, line):
+        """Handle one UCI command; returns False on quit"""
+        tokens = line.split()
+        if not tokens:
+            return True
+        command = tokens[0]
+
+        if command == "uci":
+            self.send(f"id name {ENGINE_NAME}")
+            self.send("id author chessAIlytics")
+            self.send("option name Threads type spin default 1 min 1 max 512")
+            self.send("option name Hash type spin default 16 min 1 max 33554432")
+            self.send("option name MultiPV type spin default 1 min 1 max 500")
+            self.send(f"option name NodesPerSecond type spin default {self.options['NodesPerSecond']} min 1 max 1000000000")
+            self.send(f"option name Latency type spin default {self.options['Latency']} min 0 max 600000")
+            self.send("uciok")
+        elif command == "isready":
+            self.send("readyok")
+        elif command == "setoption":
+            self.set_option(tokens)
+        elif command == "ucinewgame":
+            self.wait()
+            self.board = chess.Board()
+        elif command == "position":
+            self.wait()
+            self.set_position(tokens)
+        elif command == "go":
+            self.wait()
+            self._stop.clear()
+            self._search = threading.Thread(target=self.go, args=(self.parse_limits(tokens),), daemon=True)
+            self._search.start()
+        elif command == "stop":
+            self._stop.set()
+            self.wait()
+        elif command == "quit":
+            self._stop.set()
+            self.wait()
+            return False
+        return True
+
+    def wait(self):
+        if self._search is not None:
+            self._search.join()
+            self._search = None
+
+    def set_option(self, tokens):
+        if "name" not in tokens:
+            return
+        name_end = tokens.index("value") if "value" in tokens else len(tokens)
+        name = " ".join(tokens[tokens.index("name") + 1:name_end])
+        value = " ".join(tokens[name_end + 1:])
+        if name in self.options:
+            self.options[name] = int(value)
+
+    def set_position(self, tokens):
+        moves_at = tokens.index("moves") if "moves" in tokens else len(tokens)
+        if tokens[1] == "startpos":
+            self.board = chess.Board()
+        else:
+            self.board = chess.Board(" ".join(tokens[2:moves_at]))
+        for uci in tokens[moves_at + 1:]:
+            self.board.push_uci(uci)
+
+    def parse_limits(self, tokens):
+        limits = {"depth": None, "nodes": None, "movetime": None, "infinite": "infinite" in tokens}
+        for key in ("depth", "nodes", "movetime"):
+            if key in tokens:
+                limits[key] = int(tokens[tokens.index(key) + 1])
+        # Playing with a clock: spend a thirtieth of the remaining time
+        clock = "wtime" if self.board.turn == chess.WHITE else "btime"
+        if clock in tokens and limits["movetime"] is None:
+            limits["movetime"] = int(tokens[tokens.index(clock) + 1]) // 30
+        return limits
+
+    def go(self, limits):
+        board = self.board.copy()
+        started = time.perf_counter()
+
+        if board.is_game_over():
+            score = "mate 0" if board.is_checkmate() else "cp 0"
+            self.send(f"info depth 0 score {score}")
+            self.send("bestmove (none)")
+            return
+
+        moves = ranked_moves(board)
+        multi_pv = max(1, min(self.options["MultiPV"], len(moves)))
+        lines = [(score, principal_variation(board, move)) for move, score in moves[:multi_pv]]
+        nps = max(1, self.options["NodesPerSecond"])
+        max_depth = limits["depth"] or MAX_DEPTH
+        deadline = started + limits["movetime"] / 1000 if limits["movetime"] is not None else None
+
+        depth = 0
+        while depth < max_depth and not self._stop.is_set():
+            nodes = nodes_at_depth(depth + 1)
+            if limits["nodes"] is not None and depth > 0 and nodes > limits["nodes"]:
+                break
+            # Simulate the time the next iteration takes at the configured node rate
+            finished_at = started + nodes / nps
+            if deadline is not None and depth > 0 and finished_at > deadline:
+                break
+            if self._stop.wait(max(0.0, finished_at - time.perf_counter())):
+                break
+
+            depth += 1
+            elapsed_ms = int((time.perf_counter() - started) * 1000)
+            for index, (score, pv_moves) in enumerate(lines, start=1):
+                score_text = "mate 1" if score >= 100000 else f"cp {score}"
+                pv = " ".join(m.uci() for m in pv_moves[:depth])
+                self.send(f"info depth {depth} seldepth {depth} multipv {index} score {score_text} "
+                          f"nodes {nodes} nps {nps} time {elapsed_ms} pv {pv}")
+
+        # An infinite search reports bestmove only once it is stopped
+        if limits["infinite"]:
+            self._stop.wait()
+
+        latency = self.options["Latency"] / 1000
+        if latency:
+            time.sleep(latency)
+        self.send(f"bestmove {moves[0][0].uci()}")
+
+
+def main():
+    engine = StubEngine()
+    for line in sys.stdin:
+        if not engine.handle(line.strip()):
+            break
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,304 @@
+"""
+Tracing and metrics.
+
+Work is recorded as spans: named, timed sections such as a PGN parse or an
+engine pass, nested under the span that was open when they started. Spans
+and debug messages go to the TraceBuffer bound to the current context,
+which the app keeps one of per session; both are bounded ring buffers, so
+a long-running server never accumulates them.
+
+Every span also feeds process-wide metrics (a counter and a latency
+histogram per span name), which can be exported in the Prometheus text
+format, over HTTP (METRICS_PORT) or to a file (METRICS_FILE).
+"""
+import os
+import time
+import uuid
+import bisect
+import threading
+import contextvars
+import logging
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Configure logging
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Spans and messages kept per trace buffer, oldest dropped first
+DEFAULT_MAX_SPANS = 500
+DEFAULT_MAX_EVENTS = 500
+
+# Prefix of every exported metric name
+METRIC_PREFIX = "chessailytics_"
+
+# Latency histogram bucket bounds in seconds
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Seconds between two rewrites of the METRICS_FILE export
+METRICS_FILE_INTERVAL = 15.0
+
+
+class TraceBuffer:
+    """Recent spans and debug messages of one session"""
+
+    def __init__(self, max_spans=DEFAULT_MAX_SPANS, max_events=DEFAULT_MAX_EVENTS):
+        self.spans = deque(maxlen=max_spans)
+        self.events = deque(maxlen=max_events)
+
+    def messages(self):
+        return [event["message"] for event in list(self.events)]
+
+    def clear(self):
+        self.spans.clear()
+        self.events.clear()
+
+
+_current_buffer = contextvars.ContextVar("trace_buffer", default=None)
+_current_span = contextvars.ContextVar("trace_span", default=None)
+
+
+def current_buffer():
+    """The TraceBuffer bound to this context, or None"""
+    return _current_buffer.get()
+
+
+def use_buffer(buffer):
+    """Bind a TraceBuffer to the current context, e.g. at the start of a Streamlit run"""
+    _current_buffer.set(buffer)
+
+
+@contextmanager
+def bind(buffer):
+    """Record into `buffer` for the duration of the block, e.g. on a worker thread"""
+    token = _current_buffer.set(buffer)
+    try:
+        yield buffer
+    finally:
+        _current_buffer.reset(token)
+
+
+def event(message):
+    """Log a debug message and keep it in the current trace buffer"""
+    logger.info(message)
+    buffer = _current_buffer.get()
+    if buffer is not None:
+        span = _current_span.get()
+        buffer.events.append({
+            "time": time.time(),
+            "message": message,
+            "span_id": span["span_id"] if span else None
+        })
+
+
+@contextmanager
+def span(name, **attributes):
+    """
+    Time a block of work as a span.
+
+    Yields the span dict; the block may add to its "attributes". A span that
+    ends with an exception is recorded with status "error".
+    """
+    parent = _current_span.get()
+    record = {
+        "name": name,
+        "trace_id": parent["trace_id"] if parent else uuid.uuid4().hex[:16],
+        "span_id": uuid.uuid4().hex[:16],
+        "parent_id": parent["span_id"] if parent else None,
+        "start": time.time(),
+        "duration": None,
+        "status": "ok",
+        "attributes": attributes
+    }
+    token = _current_span.set(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    except BaseException:
+        record["status"] = "error"
+        raise
+    finally:
+        record["duration"] = time.perf_counter() - started
+        _current_span.reset(token)
+        METRICS.counter("spans_total", "Completed spans").inc(span=name, status=record["status"])
+        METRICS.histogram("span_duration_seconds", "Span durations").observe(record["duration"], span=name)
+        buffer = _current_buffer.get()
+        if buffer is not None:
+            buffer.spans.append(record)
+
+
+def _label_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(key, extra=()):
+    pairs = list(key) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    def __init__(self, name, documentation):
+        self.name = name
+        self.documentation = documentation
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(_label_key(labels), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket (the last one is +Inf), sum]
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.setdefault(key, [[0] * (len(self.buckets) + 1), 0.0])
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def count(self, **labels):
+        series = self._series.get(_label_key(labels))
+        return sum(series[0]) if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, (counts, total) in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + (float("inf"),), counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{self.name}_bucket{_format_labels(key, [('le', le)])} {cumulative}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Process-wide counters and histograms, created on first use by name"""
+
+    def __init__(self, prefix=METRIC_PREFIX):
+        self.prefix = prefix
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, documentation, **kwargs):
+        full_name = self.prefix + name
+        with self._lock:
+            metric = self._metrics.get(full_name)
+            if metric is None:
+                metric = self._metrics[full_name] = cls(full_name, documentation, **kwargs)
+            return metric
+
+    def counter(self, name, documentation=""):
+        return self._get(Counter, name, documentation)
+
+    def histogram(self, name, documentation="", buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, documentation, buckets=buckets)
+
+    def render_prometheus(self):
+        """All metrics in the Prometheus text exposition format"""
+        with self._lock:
+            metrics = [self._metrics[name] for name in sorted(self._metrics)]
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+
+def write_prometheus(path, registry=METRICS):
+    """Write the metrics to a file, replacing it atomically (for a textfile collector)"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w") as f:
+        f.write(registry.render_prometheus())
+    os.replace(tmp_path, path)
+
+
+def start_metrics_server(port, host="127.0.0.1", registry=METRICS):
+    """Serve GET /metrics on a daemon thread; returns the server"""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            data = registry.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True, name="metrics-server").start()
+    logger.info(f"Serving metrics on http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+def start_metrics_file_writer(path, interval=METRICS_FILE_INTERVAL, registry=METRICS):
+    """Rewrite the metrics file every `interval` seconds on a daemon thread"""
+    def run():
+        while True:
+            try:
+                write_prometheus(path, registry)
+            except OSError as e:
+                logger.warning(f"Could not write metrics to {path}: {str(e)}")
+            time.sleep(interval)
+
+    thread = threading.Thread(target=run, daemon=True, name="metrics-file-writer")
+    thread.start()
+    return thread
+
+
+_exporters_started = False
+_exporters_lock = threading.Lock()
+
+
+def start_metrics_exporters():
+    """Start the exporters configured by METRICS_PORT and METRICS_FILE, once per process"""
+    global _exporters_started
+    with _exporters_lock:
+        if _exporters_started:
+            return
+        _exporters_started = True
+
+    if os.getenv("METRICS_PORT"):
+        try:
+            start_metrics_server(int(os.environ["METRICS_PORT"]), host=os.getenv("METRICS_HOST", "127.0.0.1"))
+        except OSError as e:
+            # Another process on this host already serves the port
+            logger.warning(f"Could not start the metrics server: {str(e)}")
+    if os.getenv("METRICS_FILE"):
+        start_metrics_file_writer(os.environ["METRICS_FILE"])
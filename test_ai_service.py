@@ -1,6 +1,11 @@
 import unittest
-from unittest.mock import patch, MagicMock
+from unittest.mock import patch, MagicMock, AsyncMock
+import asyncio
+import os
 import sys
+import time
+
+os.environ.setdefault("GROQ_API_KEY", "test-key")
 
 class TestAIService(unittest.TestCase):
     
@@ -70,5 +75,107 @@ class TestAIService(unittest.TestCase):
             self.assertEqual(result, "Game analysis result")
             mock_pipe.assert_called_once()
 
+
+class FakeAsyncGroq:
+    """Stand-in for groq.AsyncGroq whose completions echo the prompt after a delay"""
+
+    def __init__(self, delay=0.2, **kwargs):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.chat = MagicMock()
+        self.chat.completions.create = self.create
+
+    async def create(self, model, messages):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        finally:
+            self.in_flight -= 1
+        response = MagicMock()
+        response.choices[0].message.content = "Analysis of " + messages[0]["content"].split("\n")[4].strip()
+        return response
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+
+class TestAsyncAIService(unittest.TestCase):
+
+    def setUp(self):
+        from ai_service import AIService
+        self.fens = [
+            "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+            "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1",
+            "rnbqkbnr/pppp1ppp/8/4p3/4P3/8/PPPP1PPP/RNBQKBNR w KQkq - 0 2",
+            "rnbqkbnr/pppp1ppp/8/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R b KQkq - 1 2",
+        ]
+        self.service = AIService(max_concurrency=8, request_timeout=5)
+
+    def test_positions_are_analyzed_concurrently(self):
+        fake = FakeAsyncGroq(delay=0.2)
+        with patch('ai_service.AsyncGroq', return_value=fake):
+            start = time.perf_counter()
+            game_analysis, analyses = self.service.analyze_game_and_positions("1. e4 e5 2. Nf3 *", self.fens)
+            elapsed = time.perf_counter() - start
+
+        self.assertEqual(list(analyses), self.fens)
+        for fen in self.fens:
+            self.assertEqual(analyses[fen], f"Analysis of {fen}")
+        self.assertEqual(game_analysis, "Analysis of 1. e4 e5 2. Nf3 *")
+        self.assertEqual(fake.max_in_flight, len(self.fens) + 1)
+        self.assertLess(elapsed, 0.2 * 3)
+
+    def test_concurrency_is_bounded(self):
+        fake = FakeAsyncGroq(delay=0.05)
+        self.service.max_concurrency = 2
+        with patch('ai_service.AsyncGroq', return_value=fake):
+            analyses = self.service.analyze_positions(self.fens)
+
+        self.assertEqual(len(analyses), len(self.fens))
+        self.assertEqual(fake.max_in_flight, 2)
+
+    def test_slow_requests_time_out(self):
+        fake = FakeAsyncGroq(delay=1)
+        self.service.request_timeout = 0.05
+        with patch('ai_service.AsyncGroq', return_value=fake):
+            analyses = self.service.analyze_positions(self.fens[:1])
+
+        self.assertTrue(analyses[self.fens[0]].startswith("Error in analysis: request timed out"))
+
+    def test_sync_requests_use_the_request_timeout(self):
+        with patch('ai_service.client') as client:
+            client.chat.completions.create.return_value.choices[0].message.content = "Analysis"
+            self.assertEqual(self.service.analyze_position(self.fens[0]), "Analysis")
+
+        self.assertEqual(client.chat.completions.create.call_args.kwargs["timeout"], 5)
+
+    def test_cached_responses_skip_the_api(self):
+        import tempfile
+        from cache_service import LLMResponseCache
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.service.cache = LLMResponseCache(os.path.join(tmpdir, "llm_responses.db"))
+
+            fake = FakeAsyncGroq(delay=0)
+            fake.chat.completions.create = AsyncMock(side_effect=fake.create)
+            with patch('ai_service.AsyncGroq', return_value=fake):
+                first = self.service.analyze_positions(self.fens)
+            self.assertEqual(fake.chat.completions.create.await_count, len(self.fens))
+
+            fake = FakeAsyncGroq(delay=0)
+            fake.chat.completions.create = AsyncMock(side_effect=fake.create)
+            with patch('ai_service.AsyncGroq', return_value=fake):
+                second = self.service.analyze_positions(self.fens)
+            fake.chat.completions.create.assert_not_called()
+
+            self.assertEqual(first, {fen: f"Analysis of {fen}" for fen in self.fens})
+            self.assertEqual(first, second)
+            self.assertEqual(self.service.cache.stats()["hits"], len(self.fens))
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,76 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from batch_analysis import iter_games, load_checkpoint
+
+PGN = """[Event "First"]
+[Result "1-0"]
+
+1. e4 e5 2. Qh5 Nc6 3. Bc4 Nf6 4. Qxf7# 1-0
+
+[Event "Second"]
+[Result "*"]
+
+1. d4 d5 2. c4 *
+"""
+
+
+class TestBatchAnalysis(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_iter_games_streams_every_game(self):
+        path = os.path.join(self.tmpdir.name, "games.pgn")
+        with open(path, "w") as f:
+            f.write(PGN)
+
+        games = list(iter_games(path))
+
+        self.assertEqual([index for index, _ in games], [0, 1])
+        self.assertIn('[Event "Second"]', games[1][1])
+        self.assertIn("2. c4", games[1][1])
+
+    def test_checkpoint_drops_incomplete_line(self):
+        path = os.path.join(self.tmpdir.name, "results.jsonl")
+        with open(path, "w") as f:
+            f.write(json.dumps({"game_index": 3, "moves": []}) + "\n")
+            f.write(json.dumps({"game_index": 0, "moves": []}) + "\n")
+            f.write('{"game_index": 1, "mov')
+
+        self.assertEqual(load_checkpoint(path), {0, 3})
+        with open(path) as f:
+            self.assertEqual(len(f.readlines()), 2)
+
+    def test_missing_output_means_nothing_done(self):
+        self.assertEqual(load_checkpoint(os.path.join(self.tmpdir.name, "missing.jsonl")), set())
+
+    def test_batch_run_with_an_engine_exits(self):
+        pgn_path = os.path.join(self.tmpdir.name, "games.pgn")
+        output_path = os.path.join(self.tmpdir.name, "results.jsonl")
+        with open(pgn_path, "w") as f:
+            f.write(PGN)
+        env = dict(os.environ, STOCKFISH_PATH="stub", STUB_ENGINE_NPS="100000000",
+                   EVAL_CACHE_PATH="", LLM_CACHE_PATH="", GROQ_API_KEY="test-key")
+
+        # The workers' engines must be shut down, or the pool never finishes
+        subprocess.run(
+            [sys.executable, "batch_analysis.py", pgn_path, "-o", output_path, "--workers", "2", "--depth", "minimal"],
+            cwd=os.path.dirname(os.path.abspath(__file__)), env=env, capture_output=True, check=True, timeout=120
+        )
+
+        with open(output_path) as f:
+            results = [json.loads(line) for line in f]
+        self.assertEqual(sorted(result["game_index"] for result in results), [0, 1])
+        self.assertTrue(all("error" not in result for result in results))
+
+
+if __name__ == '__main__':
+    unittest.main()
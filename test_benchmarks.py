@@ -0,0 +1,41 @@
+import os
+import unittest
+
+os.environ.setdefault("GROQ_API_KEY", "test-key")
+
+from benchmarks import load_corpus, run_benchmarks, compare, CORPORA
+
+
+class TestBenchmarks(unittest.TestCase):
+    def test_corpora_are_valid(self):
+        for name in CORPORA:
+            corpus = load_corpus(name)
+            self.assertTrue(corpus["texts"])
+            self.assertEqual(len(corpus["boards"]), len(corpus["texts"]))
+            for sans, boards in zip(corpus["sans"], corpus["boards"]):
+                self.assertEqual(len(boards), len(sans) + 1)
+
+    def test_run_reports_every_stage(self):
+        report = run_benchmarks(
+            stages=["pgn_parse", "render_board", "analyze_game"],
+            corpora=["short"],
+            repeats=1,
+            engine_path="/nonexistent/stockfish"
+        )
+        results = {r["stage"]: r for r in report["results"]}
+        self.assertEqual(results["pgn_parse"]["items"], 4)
+        self.assertGreater(results["render_board"]["median"], 0)
+        self.assertEqual(results["analyze_game"]["skipped"], "Stockfish engine not available")
+        self.assertEqual(report["meta"]["repeats"], 1)
+
+    def test_compare(self):
+        def run(**medians):
+            return {"results": [{"stage": stage, "corpus": "short", "median": median}
+                                for stage, median in medians.items()]}
+        rows = compare(run(pgn_parse=1.0, render_board=1.0, plot_heatmap=1.0),
+                       run(pgn_parse=1.5, render_board=0.5, plot_heatmap=1.05))
+        self.assertEqual([row["verdict"] for row in rows], ["slower", "faster", "same"])
+
+
+if __name__ == '__main__':
+    unittest.main()
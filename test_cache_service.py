@@ -0,0 +1,149 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+
+import chess
+
+from cache_service import EvaluationCache, LLMResponseCache
+
+
+class TestEvaluationCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "evaluations.db")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_key_ignores_move_clocks(self):
+        cache = EvaluationCache(self.path)
+        result = {"fen": "", "evaluation": {"type": "cp", "value": 30}, "top_moves": []}
+        cache.put("rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1", 18, 1, "Stockfish 14", result)
+
+        # Same position reached later in another game
+        later_fen = "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 4 7"
+        hit = cache.get(later_fen, 18, 1, "Stockfish 14")
+        self.assertEqual(hit["evaluation"], {"type": "cp", "value": 30})
+        self.assertEqual(hit["fen"], later_fen)
+
+        # Different engine settings are separate entries
+        self.assertIsNone(cache.get(later_fen, 20, 1, "Stockfish 14"))
+        self.assertIsNone(cache.get(later_fen, 18, 3, "Stockfish 14"))
+        self.assertIsNone(cache.get(later_fen, 18, 1, "Stockfish 16"))
+
+    def test_repeated_position_hits_every_fen(self):
+        cache = EvaluationCache(self.path)
+        first = "r1bqkbnr/pppppppp/2n5/8/8/5N2/PPPPPPPP/RNBQKB1R w KQkq - 2 2"
+        # The same position after Ng1 Nb8 Nf3 Nc6, with different move clocks
+        repeated = "r1bqkbnr/pppppppp/2n5/8/8/5N2/PPPPPPPP/RNBQKB1R w KQkq - 6 4"
+        cache.put(first, 18, 1, "sf", {"evaluation": {"type": "cp", "value": 10}})
+
+        hits = cache.get_many([first, repeated], 18, 1, "sf")
+
+        self.assertEqual(set(hits), {first, repeated})
+        self.assertEqual(hits[first]["fen"], first)
+        self.assertEqual(hits[repeated]["fen"], repeated)
+        self.assertIsNot(hits[first], hits[repeated])
+
+    def test_writes_from_many_threads_are_all_counted(self):
+        cache = EvaluationCache(self.path)
+        board = chess.Board()
+        fens = [board.fen()]
+        for san in ["e4", "e5", "Nf3"]:
+            board.push_san(san)
+            fens.append(board.fen())
+
+        def write(fen):
+            for _ in range(50):
+                cache.put(fen, 18, 1, "sf", {"evaluation": {"type": "cp", "value": 0}})
+
+        threads = [threading.Thread(target=write, args=(fen,)) for fen in fens]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(next(cache._writes), 4 * 50 + 1)
+
+    def test_shared_between_instances(self):
+        fen = chess.STARTING_FEN
+        EvaluationCache(self.path).put(fen, 18, 1, "sf", {"evaluation": {"type": "cp", "value": 20}})
+        self.assertIsNotNone(EvaluationCache(self.path).get(fen, 18, 1, "sf"))
+
+    def test_errors_are_not_cached(self):
+        cache = EvaluationCache(self.path)
+        cache.put(chess.STARTING_FEN, 18, 1, "sf", {"error": "Analysis error"})
+        self.assertEqual(len(cache), 0)
+
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = EvaluationCache(self.path, max_entries=2)
+        board = chess.Board()
+        fens = []
+        for san in ["e4", "e5", "Nf3", "Nc6"]:
+            board.push_san(san)
+            fens.append(board.fen())
+
+        cache.put(fens[0], 18, 1, "sf", {"value": 0})
+        cache.put(fens[1], 18, 1, "sf", {"value": 1})
+        cache.get(fens[0], 18, 1, "sf")
+        cache.put(fens[2], 18, 1, "sf", {"value": 2})
+        cache._evict(cache._connection())
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNotNone(cache.get(fens[0], 18, 1, "sf"))
+        self.assertIsNone(cache.get(fens[1], 18, 1, "sf"))
+
+
+class TestLLMResponseCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "llm_responses.db")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_hit_and_miss_counters(self):
+        cache = LLMResponseCache(self.path)
+        self.assertIsNone(cache.get("model", "prompt"))
+        cache.put("model", "prompt", "response")
+        self.assertEqual(cache.get("model", "prompt"), "response")
+
+        # Model and sampling parameters are part of the key
+        self.assertIsNone(cache.get("other-model", "prompt"))
+        self.assertIsNone(cache.get("model", "prompt", {"temperature": 0.2}))
+
+        stats = cache.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]), (1, 3, 1))
+
+    def test_entries_expire(self):
+        cache = LLMResponseCache(self.path, ttl=60)
+        with patch('cache_service.time.time', return_value=1000.0):
+            cache.put("model", "prompt", "response")
+        with patch('cache_service.time.time', return_value=1059.0):
+            self.assertEqual(cache.get("model", "prompt"), "response")
+        with patch('cache_service.time.time', return_value=1061.0):
+            self.assertIsNone(cache.get("model", "prompt"))
+        self.assertEqual(len(cache), 0)
+
+    def test_size_cap_evicts_least_recently_used(self):
+        cache = LLMResponseCache(self.path, max_bytes=25)
+        now = time.time()
+        with patch('cache_service.time.time', side_effect=[now + 1, now + 2, now + 3, now + 4]):
+            cache.put("model", "a", "x" * 10)
+            cache.put("model", "b", "x" * 10)
+            cache.get("model", "a")
+            cache.put("model", "c", "x" * 10)
+        cache._evict(cache._connection())
+
+        self.assertEqual(len(cache), 2)
+        self.assertIsNotNone(cache.get("model", "a"))
+        self.assertIsNone(cache.get("model", "b"))
+
+
+if __name__ == '__main__':
+    unittest.main()
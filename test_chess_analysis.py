@@ -0,0 +1,674 @@
+import os
+import tempfile
+import threading
+import unittest
+from unittest.mock import patch, MagicMock
+
+import chess
+import chess.engine
+
+os.environ.setdefault("GROQ_API_KEY", "test-key")
+
+
+def make_fake_engine():
+    """Create a mock engine that returns a fixed single-PV analysis"""
+    engine = MagicMock()
+    engine.id = {"name": "Stockfish 14"}
+    engine.analyse.side_effect = lambda board, limit, multipv=None, **kwargs: [{
+        "score": chess.engine.PovScore(chess.engine.Cp(25), board.turn),
+        "pv": [next(iter(board.legal_moves))]
+    }]
+    return engine
+
+
+class FakeAnalysis:
+    """Mimics chess.engine.SimpleAnalysisResult for a list of single-PV info lines"""
+
+    def __init__(self, infos):
+        self.infos = infos
+        self.multipv = [{}]
+        self.stopped = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def __iter__(self):
+        for info in self.infos:
+            if self.stopped:
+                return
+            if "pv" in info:
+                self.multipv[0] = info
+            yield info
+
+    def stop(self):
+        self.stopped = True
+
+
+class TestStockfishEnginePool(unittest.TestCase):
+
+    @patch('chess.engine.SimpleEngine.popen_uci')
+    def test_checkout_and_checkin(self, mock_popen):
+        from chess_analysis import StockfishEnginePool
+        mock_popen.side_effect = lambda path: make_fake_engine()
+
+        pool = StockfishEnginePool("stockfish", size=2, threads=1, hash_mb=16)
+        self.assertEqual(mock_popen.call_count, 2)
+
+        first = pool.checkout()
+        second = pool.checkout()
+        self.assertIsNot(first, second)
+        with self.assertRaises(TimeoutError):
+            pool.checkout(timeout=0.01)
+
+        pool.checkin(first)
+        self.assertIs(pool.checkout(timeout=0.01), first)
+        first.configure.assert_called_once_with({"Threads": 1, "Hash": 16})
+
+    @patch('chess.engine.SimpleEngine.popen_uci')
+    def test_crashed_engine_is_replaced(self, mock_popen):
+        from chess_analysis import StockfishEnginePool
+        mock_popen.side_effect = lambda path: make_fake_engine()
+
+        pool = StockfishEnginePool("stockfish", size=1)
+        with self.assertRaises(chess.engine.EngineTerminatedError):
+            with pool.engine() as engine:
+                crashed = engine
+                raise chess.engine.EngineTerminatedError("engine died")
+
+        replacement = pool.checkout(timeout=0.01)
+        self.assertIsNot(replacement, crashed)
+        self.assertEqual(mock_popen.call_count, 2)
+
+    @patch('chess_analysis.ENGINE_CHECKOUT_POLL_SECONDS', 0.01)
+    @patch('chess.engine.SimpleEngine.popen_uci')
+    def test_waiters_fail_once_no_engine_is_left(self, mock_popen):
+        from chess_analysis import StockfishEnginePool
+        mock_popen.side_effect = lambda path: make_fake_engine()
+        pool = StockfishEnginePool("stockfish", size=1)
+        engine = pool.checkout()
+
+        failures = []
+
+        def wait_for_engine():
+            try:
+                pool.checkout()
+            except RuntimeError as e:
+                failures.append(e)
+
+        waiter = threading.Thread(target=wait_for_engine)
+        waiter.start()
+        # The crashed engine cannot be restarted, so the pool is left empty
+        mock_popen.side_effect = OSError("no such file")
+        pool.checkin(engine, healthy=False)
+        waiter.join(timeout=5)
+
+        self.assertFalse(waiter.is_alive())
+        self.assertEqual(len(failures), 1)
+        with self.assertRaises(RuntimeError):
+            pool.checkout()
+
+    @patch('chess.engine.SimpleEngine.popen_uci')
+    def test_released_engine_goes_to_the_waiter(self, mock_popen):
+        from chess_analysis import StockfishEnginePool
+        mock_popen.side_effect = lambda path: make_fake_engine()
+        pool = StockfishEnginePool("stockfish", size=1)
+        engine = pool.checkout()
+
+        handed = []
+        waiter = threading.Thread(target=lambda: handed.append(pool.checkout(timeout=5)))
+        waiter.start()
+        while not pool._waiters:
+            threading.Event().wait(0.001)
+
+        # The releasing thread asks again straight away but the waiter was first
+        pool.checkin(engine)
+        with self.assertRaises(TimeoutError):
+            pool.checkout(timeout=0.05)
+        waiter.join(timeout=5)
+        self.assertEqual(handed, [engine])
+
+
+class TestStockfishService(unittest.TestCase):
+
+    @patch('chess.engine.SimpleEngine.popen_uci')
+    def test_analyze_positions_uses_whole_pool(self, mock_popen):
+        from chess_analysis import StockfishService
+        engines = []
+
+        def spawn(path):
+            engines.append(make_fake_engine())
+            return engines[-1]
+        mock_popen.side_effect = spawn
+
+        service = StockfishService(stockfish_path="stockfish", pool_size=3)
+        board = chess.Board()
+        fens = [board.fen()]
+        for san in ["e4", "e5", "Nf3", "Nc6"]:
+            board.push_san(san)
+            fens.append(board.fen())
+
+        results = service.analyze_positions(fens)
+
+        self.assertEqual(list(results), fens)
+        for fen in fens:
+            self.assertEqual(results[fen]["evaluation"], {"type": "cp", "value": 25})
+        self.assertEqual(sum(engine.analyse.call_count for engine in engines), len(fens))
+
+    @patch('chess.engine.SimpleEngine.popen_uci')
+    def test_cached_positions_skip_the_engine(self, mock_popen):
+        from chess_analysis import StockfishService
+        from cache_service import EvaluationCache
+        engine = make_fake_engine()
+        mock_popen.return_value = engine
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            cache = EvaluationCache(os.path.join(tmpdir, "evaluations.db"))
+            service = StockfishService(stockfish_path="stockfish", cache=cache)
+            fens = [chess.STARTING_FEN, "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1"]
+
+            first = service.analyze_positions(fens)
+            self.assertEqual(engine.analyse.call_count, 2)
+
+            second = service.analyze_positions(fens)
+            self.assertEqual(engine.analyse.call_count, 2)
+            self.assertEqual(first, second)
+
+            service.analyze_position(fens[0])
+            self.assertEqual(engine.analyse.call_count, 2)
+
+            # A whole-game pass only searches the positions no earlier analysis searched
+            game = service.analyze_full_game(chess.STARTING_FEN, ["e2e4", "e7e5"])
+            self.assertEqual(engine.analyse.call_count, 3)
+            self.assertEqual(game["analyses"][fens[1]], first[fens[1]])
+            self.assertEqual([ply["san"] for ply in game["plies"]], ["e4", "e5"])
+
+            service.analyze_full_game(chess.STARTING_FEN, ["e2e4", "e7e5"])
+            self.assertEqual(engine.analyse.call_count, 3)
+
+    @patch('chess.engine.SimpleEngine.popen_uci')
+    def test_full_game_pass_reuses_one_engine_session(self, mock_popen):
+        from chess_analysis import StockfishService
+        moves = ["e2e4", "e7e5", "d1h5", "b8c6", "f1c4", "g8f6", "h5f7"]
+        board = chess.Board()
+        for uci in moves[:6]:
+            board.push_uci(uci)
+        mating_fen = board.fen()
+
+        stacks = []
+
+        def analyse(board, limit, multipv=None, game=None):
+            stacks.append(len(board.move_stack))
+            # White has mate in one after 3...Nf6, everything else is roughly level
+            score = chess.engine.Mate(1) if board.fen() == mating_fen else chess.engine.Cp(20)
+            return [{"score": chess.engine.PovScore(score, board.turn), "pv": [next(iter(board.legal_moves))]}]
+
+        engine = make_fake_engine()
+        engine.analyse.side_effect = analyse
+        mock_popen.return_value = engine
+        service = StockfishService(stockfish_path="stockfish")
+
+        checkout = service.pool.checkout
+        with patch.object(service.pool, "checkout", side_effect=checkout) as checkouts:
+            result = service.analyze_full_game(chess.STARTING_FEN, moves)
+
+        # The engine is held for the whole pass
+        self.assertEqual(checkouts.call_count, 1)
+        # Every non-terminal position is searched once, in order, as one game
+        self.assertEqual(engine.analyse.call_count, len(moves))
+        games = {call.kwargs["game"] for call in engine.analyse.call_args_list}
+        self.assertEqual(len(games), 1)
+        self.assertEqual(stacks, list(range(len(moves))))
+
+        plies = result["plies"]
+        self.assertEqual(len(plies), len(moves))
+        self.assertEqual(len(result["analyses"]), len(moves) + 1)
+        self.assertEqual(plies[5]["san"], "Nf6")
+        self.assertEqual(plies[5]["classification"], "blunder")
+        self.assertEqual(plies[5]["evaluation"], {"type": "mate", "value": 1})
+        self.assertEqual(plies[6]["san"], "Qxf7#")
+        self.assertIsNone(plies[6]["classification"])
+        self.assertEqual([p["classification"] for p in plies[:5]], [None] * 5)
+
+    @patch('chess.engine.SimpleEngine.popen_uci')
+    def test_progress_and_cancellation(self, mock_popen):
+        from chess_analysis import StockfishService, AnalysisCancelled
+        mock_popen.side_effect = lambda path: make_fake_engine()
+        service = StockfishService(stockfish_path="stockfish", pool_size=2)
+        board = chess.Board()
+        fens = [board.fen()]
+        for san in ["d4", "d5", "c4"]:
+            board.push_san(san)
+            fens.append(board.fen())
+
+        reports = []
+        service.analyze_positions(fens, progress=lambda done, total: reports.append((done, total)))
+        self.assertEqual(reports[0], (0, 4))
+        self.assertEqual(reports[-1], (4, 4))
+
+        def cancel(done, total):
+            if done:
+                raise AnalysisCancelled()
+        with self.assertRaises(AnalysisCancelled):
+            service.analyze_full_game(chess.STARTING_FEN, ["d2d4", "d7d5", "c2c4"], progress=cancel)
+
+
+class TestStreamingAnalysis(unittest.TestCase):
+
+    def make_service(self, mock_popen, best_moves):
+        from chess_analysis import StockfishService
+        board = chess.Board()
+        infos = [{"depth": 1, "currmove": chess.Move.from_uci("e2e4")}]
+        for depth, uci in enumerate(best_moves, start=1):
+            infos.append({
+                "depth": depth,
+                "score": chess.engine.PovScore(chess.engine.Cp(10 * depth), board.turn),
+                "pv": [chess.Move.from_uci(uci)],
+                "nodes": 1000 * depth
+            })
+        engine = make_fake_engine()
+        engine.analysis.return_value = FakeAnalysis(infos)
+        mock_popen.return_value = engine
+        return StockfishService(stockfish_path="stockfish"), engine
+
+    @patch('chess.engine.SimpleEngine.popen_uci')
+    def test_yields_every_completed_depth(self, mock_popen):
+        service, engine = self.make_service(mock_popen, ["e2e4", "d2d4", "e2e4", "d2d4"])
+
+        results = list(service.stream_analysis(chess.STARTING_FEN, time_limit=0.5))
+
+        self.assertEqual([r["depth"] for r in results], [1, 2, 3, 4, 4])
+        self.assertEqual([r["final"] for r in results], [False, False, False, False, True])
+        self.assertEqual(results[-1]["evaluation"], {"type": "cp", "value": 40})
+        self.assertEqual(results[-1]["pv"], ["d2d4"])
+        self.assertEqual(engine.analysis.call_args[0][1], chess.engine.Limit(time=0.5))
+
+    @patch('chess.engine.SimpleEngine.popen_uci')
+    def test_stops_once_best_move_is_stable(self, mock_popen):
+        service, engine = self.make_service(mock_popen, ["d2d4", "e2e4", "e2e4", "e2e4", "e2e4", "e2e4"])
+
+        results = list(service.stream_analysis(chess.STARTING_FEN, stable_iterations=3, min_depth=1))
+
+        self.assertEqual(results[-1]["depth"], 4)
+        self.assertTrue(results[-1]["final"])
+        self.assertTrue(engine.analysis.return_value.stopped)
+
+    @patch('chess.engine.SimpleEngine.popen_uci')
+    def test_busy_engine_gives_up_after_the_checkout_timeout(self, mock_popen):
+        service, engine = self.make_service(mock_popen, ["e2e4"])
+
+        with service.get_interactive_pool().engine():
+            results = list(service.stream_analysis(chess.STARTING_FEN, checkout_timeout=0.01))
+
+        self.assertEqual(len(results), 1)
+        self.assertTrue(results[0]["busy"])
+        self.assertTrue(results[0]["final"])
+        self.assertIn("error", results[0])
+        engine.analysis.assert_not_called()
+
+    @patch('chess.engine.SimpleEngine.popen_uci')
+    def test_interactive_search_does_not_reset_a_game_pass(self, mock_popen):
+        from chess_analysis import StockfishService
+        newgames = {}
+
+        def popen(path):
+            engine = make_fake_engine()
+            last_game = []
+
+            def start(game):
+                # python-chess sends ucinewgame, clearing the hash, whenever the game changes
+                if not last_game or last_game[0] is not game:
+                    newgames[id(engine)] = newgames.get(id(engine), 0) + 1
+                last_game[:] = [game]
+
+            def analyse(board, limit, multipv=None, game=None):
+                start(game)
+                if len(board.move_stack) == 1:
+                    # An interactive search comes in while the game is being analyzed
+                    searcher = threading.Thread(target=lambda: interactive.extend(
+                        service.stream_analysis(chess.STARTING_FEN, min_depth=1, stable_iterations=1,
+                                                checkout_timeout=5)))
+                    searcher.start()
+                    searcher.join(timeout=5)
+                return [{"score": chess.engine.PovScore(chess.engine.Cp(20), board.turn),
+                         "pv": [next(iter(board.legal_moves))]}]
+
+            def analysis(board, limit, multipv=None, game=None):
+                start(game)
+                return FakeAnalysis([{"depth": 1, "score": chess.engine.PovScore(chess.engine.Cp(20), board.turn),
+                                      "pv": [chess.Move.from_uci("e2e4")]}])
+
+            engine.analyse.side_effect = analyse
+            engine.analysis.side_effect = analysis
+            return engine
+
+        mock_popen.side_effect = popen
+        interactive = []
+        service = StockfishService(stockfish_path="stockfish")
+
+        service.analyze_full_game(chess.STARTING_FEN, ["e2e4", "e7e5", "g1f3"])
+
+        self.assertTrue(interactive[-1]["final"])
+        self.assertNotIn("error", interactive[-1])
+        # One new game for the pass and one for the interactive search, each on its own engine
+        self.assertEqual(sorted(newgames.values()), [1, 1])
+
+
+
+class TestOpeningDBService(unittest.TestCase):
+    def setUp(self):
+        from chess_analysis import OpeningDBService
+        self.service = OpeningDBService()
+
+    def test_identifies_deepest_book_line(self):
+        moves = ["e4", "c5", "Nf3", "d6", "d4", "cxd4", "Nxd4", "Nf6", "Nc3", "a6", "Be3", "e5"]
+        opening = self.service.identify_opening(moves)
+        self.assertEqual(opening["eco"], "B90")
+        self.assertEqual(opening["name"], "Sicilian Defense: Najdorf Variation, English Attack")
+
+    def test_recognizes_transpositions(self):
+        # Reaches the Queen's Gambit Declined via the Reti move order
+        moves = ["Nf3", "d5", "d4", "Nf6", "c4", "e6", "Nc3", "Be7"]
+        opening = self.service.identify_opening(moves)
+        self.assertEqual(opening["eco"], "D37")
+        self.assertEqual(opening["name"], "Queen's Gambit Declined: Three Knights Variation")
+
+    def test_unknown_opening(self):
+        self.assertEqual(self.service.identify_opening([]), {"name": "Unknown Opening", "eco": ""})
+
+    def test_index_is_loaded_once_per_process(self):
+        from chess_analysis import get_eco_index, OpeningDBService
+        self.assertIs(self.service.load_eco_codes(), OpeningDBService().load_eco_codes())
+        self.assertIs(self.service.load_eco_codes(), get_eco_index())
+
+    def test_missing_table_is_unavailable(self):
+        from chess_analysis import OpeningDBService
+        service = OpeningDBService(eco_path="/nonexistent/eco.tsv")
+        self.assertIn("error", service.identify_opening(["e4"]))
+
+    def test_moves_from_another_start_match_nothing(self):
+        # Legal from the FEN below but not from the standard starting position
+        self.assertEqual(self.service.identify_opening(["Kb1", "Kb8"]), {"name": "Unknown Opening", "eco": ""})
+
+    def test_game_from_a_set_up_position_has_no_opening(self):
+        from chess_analysis import GameAnalysisService, StockfishService
+        stockfish_service = MagicMock(spec=StockfishService)
+        stockfish_service.available = False
+        service = GameAnalysisService(stockfish_service, None, self.service)
+        pgn = '[SetUp "1"]\n[FEN "k7/8/8/8/8/8/8/K7 w - - 0 1"]\n\n1. Kb1 Kb8 *'
+
+        result = service.analyze_game(pgn, include_ai=False)
+
+        self.assertNotIn("error", result)
+        self.assertEqual(result["opening"], {"name": "Unknown Opening", "eco": ""})
+
+
+
+class TestServiceRegistry(unittest.TestCase):
+    def test_services_are_created_once_on_first_use(self):
+        from chess_analysis import ServiceRegistry
+        created = []
+
+        def factory(registry):
+            created.append(object())
+            return created[-1]
+
+        registry = ServiceRegistry({"a": factory, "b": lambda registry: registry["a"]})
+        self.assertEqual(created, [])
+        self.assertFalse(registry.is_initialized("a"))
+
+        self.assertIs(registry["b"], registry["a"])
+        self.assertEqual(len(created), 1)
+        self.assertEqual(set(registry.startup_report()["services"]), {"a", "b"})
+        with self.assertRaises(KeyError):
+            registry["missing"]
+
+    def test_concurrent_first_use_creates_one_service(self):
+        import threading
+        import time
+        from chess_analysis import ServiceRegistry
+        calls = []
+
+        def slow_factory(registry):
+            calls.append(1)
+            time.sleep(0.05)
+            return object()
+
+        registry = ServiceRegistry({"slow": slow_factory})
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(registry["slow"])) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertTrue(all(result is results[0] for result in results))
+
+    def test_registry_is_shared_by_the_process(self):
+        from chess_analysis import initialize_services
+        self.assertIs(initialize_services(), initialize_services())
+
+    def test_import_defers_heavy_modules(self):
+        import subprocess
+        import sys
+        code = "import sys, chess_analysis; print(sorted(m for m in ('ai_service', 'streamlit', 'numpy') if m in sys.modules))"
+        output = subprocess.run(
+            [sys.executable, "-c", code],
+            capture_output=True, text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+        ).stdout
+        self.assertEqual(output.strip(), "[]")
+
+
+class TestCriticalPositions(unittest.TestCase):
+
+    def test_selects_largest_swings_and_tension(self):
+        from chess_analysis import select_critical_positions
+        chances = [50, 52, 51, 90, 88, None]
+        tensions = [0, 0, 0, 0, 0, 10]
+        picked = select_critical_positions(chances, tensions, 2)
+        # Ply 2 -> 3 swung by 39 points; ply 5 is unknown but full of captures
+        self.assertEqual([p["ply"] for p in picked], [2, 5])
+        self.assertEqual(picked[0]["swing"], 39.0)
+        self.assertEqual(select_critical_positions(chances, tensions, 0), [])
+
+    @patch('chess.engine.SimpleEngine.popen_uci')
+    def test_standard_analysis_searches_deep_only_where_the_game_changed(self, mock_popen):
+        from chess_analysis import StockfishService, GameAnalysisService, OpeningDBService
+        moves = ["e4", "e5", "Qh5", "Nc6", "Bc4", "Nf6", "Qxf7#"]
+        board = chess.Board()
+        for san in moves[:6]:
+            board.push_san(san)
+        mating_fen = board.fen()
+
+        depths = []
+
+        def analyse(board, limit, multipv=None, **kwargs):
+            depths.append(limit.depth)
+            score = chess.engine.Mate(1) if board.fen() == mating_fen else chess.engine.Cp(20)
+            return [{"score": chess.engine.PovScore(score, board.turn), "pv": [next(iter(board.legal_moves))]}]
+
+        engine = make_fake_engine()
+        engine.analyse.side_effect = analyse
+        mock_popen.return_value = engine
+        ai_service = MagicMock()
+        service = GameAnalysisService(
+            StockfishService(stockfish_path="stockfish"), ai_service, OpeningDBService(),
+            critical_positions=2, scan_depth=6
+        )
+        reports = []
+
+        result = service.analyze_game("1. " + " ".join(moves), include_ai=False,
+                                      progress=lambda done, total: reports.append((done, total)))
+
+        # Every ply but the final checkmate is scanned shallow, then two positions get the full depth
+        self.assertEqual(depths.count(6), len(moves))
+        self.assertEqual(depths.count(18), 2)
+        plies = [c["ply"] for c in result["critical_positions"]]
+        self.assertIn(5, plies)
+        self.assertEqual(len(result["engine_analyses"]), len(moves) + 1)
+        self.assertEqual(reports[-1], (len(moves) + 1 + 2, len(moves) + 1 + 2))
+
+
+class TestSearchBudget(unittest.TestCase):
+
+    def test_splits_by_weight_and_carries_leftovers_forward(self):
+        from chess_analysis import SearchBudget
+        budget = SearchBudget({"a": 1.0, "b": 3.0}, seconds=4.0, max_depth=18)
+
+        first = budget.reserve("a")
+        self.assertAlmostEqual(first.time, 1.0)
+        self.assertEqual(first.depth, 18)
+        budget.spend("a", first, {"time": 0.2, "depth": 18}, 0.25)
+
+        # The 0.8 seconds "a" did not use go to "b"
+        self.assertAlmostEqual(budget.reserve("b").time, 3.8)
+        report = budget.report()
+        self.assertEqual(report["spent_seconds"], 0.2)
+        self.assertEqual(report["depths"], {"a": 18})
+
+    def test_running_searches_keep_their_share(self):
+        from chess_analysis import SearchBudget
+        budget = SearchBudget({"a": 1.0, "b": 1.0, "c": 2.0}, nodes=40000)
+        self.assertEqual(budget.reserve("a").nodes, 10000)
+        self.assertEqual(budget.reserve("b").nodes, 10000)
+        budget.skip("c")
+        self.assertEqual(budget.reserve("d").nodes, 20000)
+
+    @patch('chess.engine.SimpleEngine.popen_uci')
+    def test_budgeted_game_analysis_reports_depth_reached(self, mock_popen):
+        from chess_analysis import StockfishService, GameAnalysisService, OpeningDBService
+        limits = []
+
+        def analyse(board, limit, multipv=None, **kwargs):
+            limits.append(limit)
+            return [{"score": chess.engine.PovScore(chess.engine.Cp(20), board.turn),
+                     "pv": [next(iter(board.legal_moves))], "depth": 5, "time": limit.time / 2}]
+
+        engine = make_fake_engine()
+        engine.analyse.side_effect = analyse
+        mock_popen.return_value = engine
+        service = GameAnalysisService(
+            StockfishService(stockfish_path="stockfish"), MagicMock(), OpeningDBService(),
+            critical_positions=3, time_budget=2.0
+        )
+
+        result = service.analyze_game("1. d4 d5 2. c4 e6 3. Nc3 Nf6", include_ai=False)
+
+        self.assertTrue(all(limit.time is not None for limit in limits))
+        budgets = result["search_budget"]
+        self.assertEqual(budgets["scan"]["seconds"], 0.5)
+        self.assertLessEqual(budgets["scan"]["spent_seconds"], 0.5)
+        # The deep pass gets the rest of the budget, including what the scan left over
+        self.assertAlmostEqual(budgets["deep"]["seconds"], 2.0 - budgets["scan"]["spent_seconds"], places=2)
+        self.assertLessEqual(budgets["scan"]["spent_seconds"] + budgets["deep"]["spent_seconds"], 2.0)
+        self.assertEqual(len(budgets["deep"]["depths"]), 3)
+        self.assertTrue(all(a["depth"] == 5 for a in result["engine_analyses"].values()))
+
+class FakeTables:
+    """chess.syzygy.Tablebase stand-in for KQvK: the side with the queen wins, bare kings draw"""
+    wdl = {"KQvK": "KQvK.rtbw"}
+
+    def add_directory(self, path):
+        pass
+
+    def probe_wdl(self, board):
+        queens = board.pieces(chess.QUEEN, chess.WHITE) or board.pieces(chess.QUEEN, chess.BLACK)
+        if not queens:
+            return 0
+        return 2 if board.color_at(next(iter(queens))) == board.turn else -2
+
+    def probe_dtz(self, board):
+        return {2: 5, 0: 0, -2: -4}[self.probe_wdl(board)]
+
+    def close(self):
+        pass
+
+
+class TestPositionResolver(unittest.TestCase):
+    # Black's only legal move is Kb8, after which Rh8 mates
+    FORCED_FEN = "k7/8/1K6/8/8/8/8/7R b - - 0 1"
+
+    def test_finished_games(self):
+        from chess_analysis import resolve_position
+        mated = resolve_position(chess.Board("7k/6Q1/6K1/8/8/8/8/8 b - - 0 1"))
+        self.assertEqual(mated["evaluation"], {"type": "mate", "value": 0})
+        self.assertEqual(mated["top_moves"], [])
+        self.assertEqual(mated["resolved_by"], "checkmate")
+
+        stalemate = resolve_position(chess.Board("7k/8/6QK/8/8/8/8/8 b - - 0 1"))
+        self.assertEqual((stalemate["evaluation"], stalemate["resolved_by"]), ({"type": "cp", "value": 0}, "stalemate"))
+
+        bare_kings = resolve_position(chess.Board("8/8/4k3/8/8/3K4/8/8 w - - 0 1"), multi_pv=2)
+        self.assertEqual(bare_kings["resolved_by"], "insufficient_material")
+        self.assertEqual(len(bare_kings["top_moves"]), 2)
+        self.assertIsNone(resolve_position(chess.Board()))
+
+    @patch('chess.engine.SimpleEngine.popen_uci')
+    def test_analyze_position_skips_the_engine(self, mock_popen):
+        from chess_analysis import StockfishService
+        engine = make_fake_engine()
+        engine.analyse.side_effect = lambda board, limit, multipv=None, **kwargs: [{
+            "score": chess.engine.PovScore(chess.engine.Mate(1), board.turn),
+            "pv": [chess.Move.from_uci("h1h8")]
+        }]
+        mock_popen.return_value = engine
+        service = StockfishService(stockfish_path="stockfish")
+
+        result = service.analyze_position("7k/6Q1/6K1/8/8/8/8/8 b - - 0 1")
+        self.assertEqual(result["evaluation"], {"type": "mate", "value": 0})
+        engine.analyse.assert_not_called()
+
+        # The forced move is not searched; the position after it is, once
+        result = service.analyze_position(self.FORCED_FEN)
+        self.assertEqual(engine.analyse.call_count, 1)
+        self.assertEqual(engine.analyse.call_args[0][0].fen(), "1k6/8/1K6/8/8/8/8/7R w - - 1 2")
+        self.assertEqual(result["evaluation"], {"type": "mate", "value": -1})
+        self.assertEqual([move["SAN"] for move in result["top_moves"]], ["Kb8"])
+        self.assertEqual(result["resolved_by"], "forced_move")
+
+    @patch('chess.engine.SimpleEngine.popen_uci')
+    def test_game_passes_take_forced_moves_from_the_next_position(self, mock_popen):
+        from chess_analysis import StockfishService
+        engine = make_fake_engine()
+        mock_popen.return_value = engine
+        service = StockfishService(stockfish_path="stockfish")
+
+        game = service.analyze_full_game(self.FORCED_FEN, ["a8b8", "h1h8"])
+        # Only the position after Kb8 has a choice; the game ends in checkmate
+        self.assertEqual(engine.analyse.call_count, 1)
+        self.assertEqual(game["analyses"][self.FORCED_FEN]["evaluation"], {"type": "cp", "value": -25})
+        self.assertEqual([ply["san"] for ply in game["plies"]], ["Kb8", "Rh8#"])
+
+        board = chess.Board(self.FORCED_FEN)
+        fens = [board.fen()]
+        board.push_san("Kb8")
+        fens.append(board.fen())
+        results = service.analyze_positions(fens)
+        self.assertEqual(engine.analyse.call_count, 2)
+        self.assertEqual(results[fens[0]]["evaluation"], {"type": "cp", "value": -25})
+        self.assertEqual(results[fens[0]]["top_moves"][0]["Move"], "a8b8")
+
+    @patch('chess.syzygy.Tablebase', FakeTables)
+    def test_tablebase_positions(self):
+        from chess_analysis import TablebaseService, resolve_position
+        tablebase = TablebaseService(["/syzygy"])
+        self.assertEqual(tablebase.max_pieces, 3)
+        self.assertIsNone(tablebase.probe(chess.Board()))
+
+        board = chess.Board("7k/8/6K1/8/8/8/8/1Q6 w - - 0 1")
+        result = resolve_position(board, multi_pv=3, tablebase=tablebase)
+        self.assertEqual(result["resolved_by"], "tablebase")
+        self.assertEqual(result["evaluation"], {"type": "cp", "value": 19995, "wdl": 2, "dtz": 5})
+        # Mating moves come first, and every move kept the win
+        best = result["top_moves"][0]
+        self.assertEqual((best["Evaluation"]["wdl"], best["Evaluation"]["dtz"]), (2, 1))
+        board.push_uci(best["Move"])
+        self.assertTrue(board.is_checkmate())
+        self.assertEqual(len(result["top_moves"]), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import io
+import unittest
+
+import chess
+import chess.pgn
+import chess.polyglot
+
+from compact_game import CompactGame, encode_move, decode_move
+
+SAMPLE_PGN = """
+[Event "Test"]
+
+1. e4 e5 2. Nf3 Nc6 3. Bb5 a6 4. Ba4 Nf6 5. O-O Be7 6. Re1 b5 7. Bb3 d6
+8. c3 O-O 9. h3 Nb8 10. d4 Nbd7 11. Nbd2 Bb7 12. Bc2 Re8 13. Nf1 Bf8 *
+"""
+
+
+class TestMoveEncoding(unittest.TestCase):
+    def test_round_trip(self):
+        for move in [chess.Move.from_uci("e2e4"), chess.Move.from_uci("e1g1"),
+                     chess.Move.from_uci("a7a8q"), chess.Move.from_uci("h2h1n")]:
+            code = encode_move(move)
+            self.assertLess(code, 1 << 16)
+            self.assertEqual(decode_move(code), move)
+
+
+class TestCompactGame(unittest.TestCase):
+    def setUp(self):
+        self.pgn_game = chess.pgn.read_game(io.StringIO(SAMPLE_PGN))
+        self.game = CompactGame.from_pgn_game(self.pgn_game, snapshot_interval=4)
+
+    def test_positions_match_replay(self):
+        board = self.pgn_game.board()
+        self.assertEqual(self.game.fen(0), board.fen())
+        for ply, move in enumerate(self.pgn_game.mainline_moves(), 1):
+            board.push(move)
+            self.assertEqual(self.game.fen(ply), board.fen())
+            self.assertEqual(self.game.key(ply), chess.polyglot.zobrist_hash(board))
+        self.assertEqual(self.game.board_at(-1).fen(), board.fen())
+        self.assertEqual(list(self.game.keys()), [self.game.key(ply) for ply in range(len(self.game) + 1)])
+
+    def test_san_and_uci(self):
+        board = self.pgn_game.board()
+        expected = []
+        for move in self.pgn_game.mainline_moves():
+            expected.append(board.san(move))
+            board.push(move)
+        self.assertEqual(self.game.san_moves(), expected)
+        self.assertEqual(self.game.san(8), "O-O")
+        self.assertEqual(self.game.uci(0), "e2e4")
+
+    def test_truncate_and_push(self):
+        self.game.truncate(6)
+        self.assertEqual(len(self.game), 6)
+        self.game.push(chess.Move.from_uci("b5c6"))
+        self.assertEqual(self.game.san(6), "Bxc6")
+        with self.assertRaises(IndexError):
+            self.game.board_at(8)
+
+    def test_rejects_illegal_moves(self):
+        with self.assertRaises(ValueError):
+            self.game.push(chess.Move.from_uci("e1e8"))
+        self.assertEqual(len(self.game), 26)
+
+    def test_custom_start_position(self):
+        fen = "4k3/P7/8/8/8/8/8/4K3 w - - 0 1"
+        game = CompactGame.from_moves([chess.Move.from_uci("a7a8q")], start_fen=fen)
+        self.assertEqual(game.san(0), "a8=Q+")
+        self.assertEqual(game.fen(0), fen)
+
+    def test_is_compact(self):
+        # Two bytes per move plus eight per position
+        self.assertEqual(self.game.nbytes, 2 * 26 + 8 * 27)
+
+
+if __name__ == '__main__':
+    unittest.main()
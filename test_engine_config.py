@@ -0,0 +1,77 @@
+import os
+import json
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+
+os.environ.setdefault("GROQ_API_KEY", "test-key")
+
+import engine_config
+from engine_config import bench_thread_counts, choose_profile, auto_configure
+
+
+def make_bench_engine(nps_by_threads):
+    """A mock engine whose speed depends on its Threads option"""
+    engine = MagicMock()
+    engine.id = {"name": "Stockfish 14"}
+    options = {}
+    engine.configure.side_effect = options.update
+    engine.analyse.side_effect = lambda board, limit, **kwargs: {
+        "nodes": int(nps_by_threads[options["Threads"]] * limit.time),
+        "time": limit.time
+    }
+    return engine
+
+
+class TestChooseProfile(unittest.TestCase):
+    def test_thread_counts(self):
+        self.assertEqual(bench_thread_counts(1), [1])
+        self.assertEqual(bench_thread_counts(6), [1, 2, 4, 6])
+
+    def test_prefers_many_engines_when_threads_scale_poorly(self):
+        host = {"cpus": 8, "memory_mb": 8192}
+        profile = choose_profile(host, {1: 1000000, 2: 1500000, 4: 2000000, 8: 2500000})
+        self.assertEqual((profile["pool_size"], profile["threads"]), (8, 1))
+        # A quarter of the memory shared by eight engines
+        self.assertEqual(profile["hash_mb"], 256)
+
+    def test_prefers_fewer_engines_when_throughput_is_equal(self):
+        host = {"cpus": 4, "memory_mb": None}
+        profile = choose_profile(host, {1: 1000000, 2: 1990000, 4: 3900000})
+        self.assertEqual((profile["pool_size"], profile["threads"]), (1, 4))
+        self.assertEqual(profile["hash_mb"], engine_config.MAX_HASH_MB)
+
+
+class TestAutoConfigure(unittest.TestCase):
+    @patch('engine_config.detect_host', return_value={"cpus": 4, "memory_mb": 1024})
+    @patch('chess.engine.SimpleEngine.popen_uci')
+    def test_benchmarks_once_and_reuses_the_profile(self, mock_popen, mock_host):
+        mock_popen.return_value = make_bench_engine({1: 1000000, 2: 1950000, 4: 2600000, 8: 3000000})
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "profile.json")
+
+            profile = auto_configure("stockfish", profile_path=path)
+            self.assertEqual((profile["pool_size"], profile["threads"], profile["hash_mb"]), (2, 2, 128))
+            with open(path) as f:
+                self.assertEqual(json.load(f)["nps"]["4"], 2600000)
+
+            again = auto_configure("stockfish", profile_path=path)
+            self.assertEqual(mock_popen.call_count, 1)
+            self.assertEqual(again["threads"], 2)
+
+            # A different host is benchmarked again
+            mock_host.return_value = {"cpus": 8, "memory_mb": 1024}
+            auto_configure("stockfish", profile_path=path)
+            self.assertEqual(mock_popen.call_count, 2)
+
+    @patch('engine_config.auto_configure', return_value={"pool_size": 4, "threads": 2, "hash_mb": 512})
+    def test_environment_overrides_the_profile(self, mock_auto):
+        from chess_analysis import engine_settings
+        with patch.dict(os.environ, {"STOCKFISH_AUTOCONFIG": "1", "STOCKFISH_THREADS": "3"}):
+            self.assertEqual(engine_settings(), {"pool_size": 4, "threads": 3, "hash_mb": 512})
+        with patch.dict(os.environ, {"STOCKFISH_AUTOCONFIG": ""}):
+            self.assertEqual(engine_settings()["pool_size"], int(os.getenv("STOCKFISH_POOL_SIZE", "1")))
+
+
+if __name__ == '__main__':
+    unittest.main()
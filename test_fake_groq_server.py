@@ -0,0 +1,46 @@
+import json
+import unittest
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import groq
+
+from fake_groq_server import FakeGroqServer
+
+
+def complete(server, prompt, **kwargs):
+    client = groq.Groq(api_key="fake", base_url=server.url, **kwargs)
+    response = client.chat.completions.create(
+        model="llama-3.3-70b-versatile",
+        messages=[{"role": "user", "content": prompt}]
+    )
+    return response.choices[0].message.content
+
+
+class TestFakeGroqServer(unittest.TestCase):
+    def test_answers_chat_completions_deterministically(self):
+        with FakeGroqServer() as server:
+            first = complete(server, "Analyze 1. e4")
+            self.assertEqual(complete(server, "Analyze 1. e4"), first)
+            self.assertNotEqual(complete(server, "Analyze 1. d4"), first)
+            self.assertEqual(server.stats()["requests"], 3)
+
+    def test_injects_errors(self):
+        with FakeGroqServer(error_rate=1.0, error_status=429) as server:
+            with self.assertRaises(groq.RateLimitError):
+                complete(server, "Analyze 1. e4", max_retries=0)
+            self.assertEqual(server.stats()["errors"], 1)
+
+    def test_tracks_concurrency(self):
+        with FakeGroqServer(latency=0.2) as server:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                list(executor.map(lambda i: complete(server, f"prompt {i}"), range(4)))
+            with urllib.request.urlopen(f"{server.url}/stats") as response:
+                stats = json.load(response)
+        self.assertEqual(stats["requests"], 4)
+        self.assertGreater(stats["max_in_flight"], 1)
+        self.assertEqual(stats["in_flight"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
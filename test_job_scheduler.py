@@ -0,0 +1,126 @@
+import os
+import threading
+import unittest
+
+os.environ.setdefault("GROQ_API_KEY", "test-key")
+
+from chess_analysis import AnalysisCancelled
+from job_scheduler import AnalysisJobScheduler
+
+
+class FakeGameAnalysisService:
+    """Reports progress over a few fake positions, optionally waiting on a gate between them"""
+
+    def __init__(self, positions=3, gate=None, result=None):
+        self.positions = positions
+        self.gate = gate
+        self.result = result if result is not None else {"metadata": {}, "plies": []}
+        self.started = threading.Event()
+        # Whatever the progress callback raised, e.g. on cancellation
+        self.raised = None
+
+    def analyze_game(self, pgn_text, analysis_depth="standard", include_ai=True, progress=None):
+        self.started.set()
+        for done in range(self.positions + 1):
+            if progress:
+                try:
+                    progress(done, self.positions)
+                except Exception as e:
+                    self.raised = e
+                    raise
+            if self.gate is not None and done < self.positions:
+                self.gate.wait(5)
+        if pgn_text == "crash":
+            raise RuntimeError("engine died")
+        return self.result
+
+
+def wait_for(scheduler, job_id):
+    scheduler._jobs[job_id].future.exception(timeout=5)
+    return scheduler.status(job_id)
+
+
+class TestAnalysisJobScheduler(unittest.TestCase):
+    def test_completed_job_reports_progress_and_result(self):
+        service = FakeGameAnalysisService(result={"metadata": {"white": "A"}})
+        scheduler = AnalysisJobScheduler(service, max_workers=1)
+        job_id = scheduler.submit("1. e4 *")
+
+        status = wait_for(scheduler, job_id)
+        self.assertEqual(status["status"], "completed")
+        self.assertEqual(status["progress"], {"done": 3, "total": 3})
+        self.assertEqual(scheduler.result(job_id), {"metadata": {"white": "A"}})
+        scheduler.shutdown()
+
+    def test_cancel_running_job(self):
+        gate = threading.Event()
+        service = FakeGameAnalysisService(gate=gate)
+        scheduler = AnalysisJobScheduler(service, max_workers=1)
+        job_id = scheduler.submit("1. e4 *")
+        service.started.wait(5)
+
+        self.assertTrue(scheduler.cancel(job_id))
+        gate.set()
+        status = wait_for(scheduler, job_id)
+        self.assertEqual(status["status"], "cancelled")
+        # The analysis was stopped at its next progress report
+        self.assertIsInstance(service.raised, AnalysisCancelled)
+        self.assertLess(status["progress"]["done"], 3)
+        self.assertIsNone(scheduler.result(job_id))
+        self.assertFalse(scheduler.cancel(job_id))
+        scheduler.shutdown()
+
+    def test_cancel_queued_job(self):
+        gate = threading.Event()
+        scheduler = AnalysisJobScheduler(FakeGameAnalysisService(gate=gate), max_workers=1)
+        running = scheduler.submit("1. e4 *")
+        queued = scheduler.submit("1. d4 *")
+
+        self.assertTrue(scheduler.cancel(queued))
+        self.assertEqual(scheduler.status(queued)["status"], "cancelled")
+        gate.set()
+        self.assertEqual(wait_for(scheduler, running)["status"], "completed")
+        scheduler.shutdown()
+
+    def test_failures_are_reported(self):
+        scheduler = AnalysisJobScheduler(FakeGameAnalysisService(result={"error": "Invalid PGN format"}))
+        invalid = scheduler.submit("not a game")
+        crashed = scheduler.submit("crash")
+
+        self.assertEqual(wait_for(scheduler, invalid)["error"], "Invalid PGN format")
+        status = wait_for(scheduler, crashed)
+        self.assertEqual(status["status"], "failed")
+        self.assertIn("engine died", status["error"])
+        scheduler.shutdown()
+
+    def test_finished_jobs_are_bounded(self):
+        scheduler = AnalysisJobScheduler(FakeGameAnalysisService(), max_workers=1, max_finished_jobs=2)
+        job_ids = []
+        for _ in range(4):
+            job_ids.append(scheduler.submit("1. e4 *"))
+            wait_for(scheduler, job_ids[-1])
+
+        self.assertIsNone(scheduler.status(job_ids[0]))
+        self.assertEqual(len(scheduler.jobs()), 3)
+        scheduler.shutdown()
+
+    def test_profiled_job_attaches_a_profile(self):
+        scheduler = AnalysisJobScheduler(FakeGameAnalysisService(), max_workers=1)
+        profiled = scheduler.submit("1. e4 *", profile=True)
+        wait_for(scheduler, profiled)
+
+        report = scheduler.result(profiled)["profile"]
+        self.assertTrue(any("analyze_game" in row["function"] for row in report["top_functions"]))
+        self.assertIsInstance(report["stats"], bytes)
+        self.assertTrue(scheduler.status(profiled)["profile"])
+        scheduler.shutdown()
+
+        scheduler = AnalysisJobScheduler(FakeGameAnalysisService(), max_workers=1)
+        plain = scheduler.submit("1. e4 *")
+        wait_for(scheduler, plain)
+        self.assertNotIn("profile", scheduler.result(plain))
+        scheduler.shutdown()
+
+
+if __name__ == '__main__':
+    unittest.main()
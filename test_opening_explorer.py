@@ -0,0 +1,115 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import chess
+
+import opening_explorer
+from opening_explorer import OpeningExplorer, build_explorer, get_opening_explorer
+
+PGN = """[Event "One"]
+[Result "1-0"]
+[WhiteElo "2000"]
+[BlackElo "1800"]
+
+1. e4 e5 2. Nf3 Nc6 1-0
+
+[Event "Two"]
+[Result "0-1"]
+[WhiteElo "2200"]
+
+1. e4 c5 (1... e5 2. Qh5) 2. Nf3 0-1
+
+[Event "Three"]
+[Result "1/2-1/2"]
+
+1. d4 d5 1/2-1/2
+
+[Event "Unfinished"]
+[Result "*"]
+
+1. d4 Nf6 *
+
+[Event "Four"]
+[Result "1-0"]
+[WhiteElo "1500"]
+[BlackElo "?"]
+
+1. e4 e5 2. Bc4 1-0
+"""
+
+
+def board_after(*sans):
+    board = chess.Board()
+    for san in sans:
+        board.push_san(san)
+    return board
+
+
+class TestOpeningExplorer(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.pgn_path = os.path.join(self.tmpdir.name, "games.pgn")
+        self.explorer_path = self.pgn_path + ".explorer"
+        with open(self.pgn_path, "w") as f:
+            f.write(PGN)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_statistics_of_continuations(self):
+        self.assertEqual(build_explorer(self.pgn_path), 5)
+        with OpeningExplorer(self.explorer_path) as explorer:
+            self.assertEqual(explorer.games, 5)
+            start = explorer.lookup(chess.Board())
+            # The unfinished game is not counted
+            self.assertEqual((start["games"], start["white"], start["draws"], start["black"]), (4, 2, 1, 1))
+            self.assertEqual([move["uci"] for move in start["moves"]], ["e2e4", "d2d4"])
+            e4 = start["moves"][0]
+            self.assertEqual((e4["games"], e4["white"], e4["draws"], e4["black"]), (3, 2, 0, 1))
+            # Averages of 1900, 2200 and 1500
+            self.assertEqual(e4["average_rating"], 1867)
+            self.assertIsNone(start["moves"][1]["average_rating"])
+
+            # The variation in game two is not counted
+            after_e5 = explorer.lookup(board_after("e4", "e5"))
+            self.assertEqual([(move["uci"], move["games"]) for move in after_e5["moves"]],
+                             [("g1f3", 1), ("f1c4", 1)])
+            self.assertEqual(explorer.lookup(board_after("h4"))["moves"], [])
+
+    def test_max_plies_and_min_games(self):
+        build_explorer(self.pgn_path, max_plies=2, min_games=2)
+        with OpeningExplorer(self.explorer_path) as explorer:
+            self.assertEqual(explorer.max_plies, 2)
+            self.assertEqual([move["uci"] for move in explorer.lookup(chess.Board())["moves"]], ["e2e4"])
+            self.assertEqual([move["uci"] for move in explorer.lookup(board_after("e4"))["moves"]], ["e7e5"])
+            self.assertEqual(explorer.lookup(board_after("e4", "e5"))["moves"], [])
+
+    def test_chunked_build_matches_single_pass(self):
+        build_explorer(self.pgn_path)
+        with open(self.explorer_path, "rb") as f:
+            expected = f.read()
+        with mock.patch.object(opening_explorer, "MERGE_ROWS", 1):
+            build_explorer(self.pgn_path, chunk_games=2)
+        with open(self.explorer_path, "rb") as f:
+            self.assertEqual(f.read(), expected)
+
+    def test_get_opening_explorer(self):
+        self.assertIsNone(get_opening_explorer(self.explorer_path))
+        build_explorer(self.pgn_path)
+        explorer = get_opening_explorer(self.explorer_path)
+        self.assertIs(get_opening_explorer(self.explorer_path), explorer)
+        self.assertEqual(explorer.lookup(board_after("d4"))["moves"][0]["uci"], "d7d5")
+
+        # A rebuilt file replaces the shared explorer, and the old one is closed
+        build_explorer(self.pgn_path, max_plies=1)
+        rebuilt = get_opening_explorer(self.explorer_path)
+        self.assertIsNot(rebuilt, explorer)
+        self.assertEqual(rebuilt.max_plies, 1)
+        self.assertTrue(explorer._map.closed)
+
+
+if __name__ == '__main__':
+    unittest.main()
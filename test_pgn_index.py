@@ -0,0 +1,106 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+import pgn_index
+from pgn_index import PgnIndex, build_index
+
+PGN = """[Event "First"]
+[White "Alice \\"The Rook\\""]
+[Black "Bob"]
+[Result "1-0"]
+
+1. e4 e5 2. Qh5 Nc6 3. Bc4 Nf6 4. Qxf7# 1-0
+
+[Event "Second"]
+[White "Carol"]
+[Black "Dave"]
+[Result "*"]
+[WhiteElo "2100"]
+
+1. d4 { [%clk 0:03:00] } d5 2. c4 *
+
+[Event "Third"]
+[Result "1/2-1/2"]
+
+1. Nf3 Nf6 1/2-1/2
+"""
+
+
+class TestPgnIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmpdir.name, "games.pgn")
+        with open(self.path, "w") as f:
+            f.write(PGN)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_random_access_to_games_and_summaries(self):
+        with PgnIndex(self.path) as index:
+            self.assertEqual(len(index), 3)
+            self.assertTrue(os.path.exists(self.path + ".idx"))
+
+            second = index.read_game(1)
+            self.assertEqual(second.headers["White"], "Carol")
+            self.assertEqual([m.uci() for m in second.mainline_moves()], ["d2d4", "d7d5", "c2c4"])
+            self.assertTrue(index.game_text(2).startswith('[Event "Third"]'))
+
+            self.assertEqual(index.summary(0)["White"], 'Alice "The Rook"')
+            self.assertEqual(index.summary(1)["WhiteElo"], "2100")
+            self.assertEqual(index.summary(2)["Black"], "")
+            with self.assertRaises(IndexError):
+                index.game_text(3)
+
+    def test_shared_index_is_closed_when_the_file_changes(self):
+        index = pgn_index.get_pgn_index(self.path)
+        self.assertIs(pgn_index.get_pgn_index(self.path), index)
+
+        with open(self.path, "a") as f:
+            f.write('\n[Event "Fourth"]\n[Result "*"]\n\n1. c4 *\n')
+        reopened = pgn_index.get_pgn_index(self.path)
+
+        self.assertIsNot(reopened, index)
+        self.assertEqual(len(reopened), 4)
+        self.assertEqual(index._maps, [])
+
+    def test_saved_index_is_reused_until_the_file_changes(self):
+        PgnIndex(self.path).close()
+        with mock.patch.object(pgn_index, "build_index", wraps=build_index) as build:
+            PgnIndex(self.path).close()
+            build.assert_not_called()
+
+            with open(self.path, "a") as f:
+                f.write('\n[Event "Fourth"]\n\n1. c4 *\n')
+            with PgnIndex(self.path) as index:
+                build.assert_called_once()
+                self.assertEqual(len(index), 4)
+                self.assertEqual(index.summary(3)["Event"], "Fourth")
+
+    def test_partition_covers_every_game_once(self):
+        with open(self.path, "w") as f:
+            for i in range(50):
+                f.write(f'[Event "Game {i}"]\n\n1. e4 *\n\n')
+        with PgnIndex(self.path) as index:
+            ranges = index.partition(4)
+            self.assertEqual(len(ranges), 4)
+            self.assertEqual(ranges[0][0], 0)
+            self.assertEqual(ranges[-1][1], 50)
+            for (_, end), (start, _) in zip(ranges, ranges[1:]):
+                self.assertEqual(end, start)
+            ranges = index.partition(100)
+            self.assertLessEqual(len(ranges), 50)
+            self.assertEqual(sum(end - start for start, end in ranges), 50)
+
+    def test_empty_file(self):
+        open(self.path, "w").close()
+        with PgnIndex(self.path) as index:
+            self.assertEqual(len(index), 0)
+            self.assertEqual(index.partition(4), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,138 @@
+import os
+import tempfile
+import unittest
+from io import StringIO
+from unittest import mock
+
+import chess
+import chess.pgn
+
+import position_index
+from position_index import PositionIndex, update_from_pgn
+
+PGN = """[Event "Italian"]
+[White "Alice"]
+[Black "Bob"]
+[Result "1-0"]
+
+1. e4 e5 2. Nf3 Nc6 3. Bc4 Bc5 1-0
+
+[Event "Transposed"]
+[White "Carol"]
+[Black "Dave"]
+[Result "0-1"]
+
+1. Nf3 Nc6 2. e4 e5 3. d4 0-1
+
+[Event "Queen's Gambit"]
+[Result "1/2-1/2"]
+
+1. d4 d5 2. c4 1/2-1/2
+"""
+
+EXTRA = """
+[Event "Fourth"]
+[Result "*"]
+
+1. e4 c5 *
+"""
+
+
+def board_after(*sans):
+    board = chess.Board()
+    for san in sans:
+        board.push_san(san)
+    return board
+
+
+class TestPositionIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.pgn_path = os.path.join(self.tmpdir.name, "games.pgn")
+        self.index_path = self.pgn_path + ".positions"
+        with open(self.pgn_path, "w") as f:
+            f.write(PGN)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_lookup_finds_every_game_through_a_position(self):
+        with PositionIndex(self.index_path) as index:
+            self.assertEqual(update_from_pgn(index, self.pgn_path), 3)
+            self.assertEqual(index.lookup(chess.Board()), [(0, 0), (1, 0), (2, 0)])
+            # Reached by a different move order in game 1
+            self.assertEqual(index.lookup(board_after("e4", "e5", "Nf3", "Nc6")), [(0, 4), (1, 4)])
+            self.assertEqual(index.count(board_after("d4", "d5")), 1)
+            self.assertEqual(index.lookup(board_after("h4")), [])
+
+        # The saved index reopens with the same contents
+        with PositionIndex(self.index_path) as index:
+            self.assertEqual(index.games, 3)
+            self.assertEqual(index.lookup(board_after("d4", "d5", "c4")), [(2, 3)])
+
+    def test_update_indexes_only_appended_games(self):
+        with PositionIndex(self.index_path) as index:
+            update_from_pgn(index, self.pgn_path)
+            with open(self.pgn_path, "a") as f:
+                f.write(EXTRA)
+            self.assertEqual(update_from_pgn(index, self.pgn_path), 1)
+            self.assertEqual(update_from_pgn(index, self.pgn_path), 0)
+            self.assertEqual(len(index.segments), 2)
+            self.assertEqual(index.lookup(board_after("e4")), [(0, 1), (3, 1)])
+
+            with open(self.pgn_path, "w") as f:
+                f.write(EXTRA)
+            with self.assertRaises(ValueError):
+                update_from_pgn(index, self.pgn_path)
+
+    def test_shared_index_is_closed_once_rebuilt(self):
+        self.assertIsNone(position_index.get_position_index(self.pgn_path))
+        with PositionIndex(self.index_path) as index:
+            update_from_pgn(index, self.pgn_path)
+        shared = position_index.get_position_index(self.pgn_path)
+        self.assertIs(position_index.get_position_index(self.pgn_path), shared)
+
+        with open(self.pgn_path, "a") as f:
+            f.write(EXTRA)
+        with PositionIndex(self.index_path) as index:
+            update_from_pgn(index, self.pgn_path)
+        # Make sure the manifest looks rewritten even on a coarse-grained clock
+        manifest = os.path.join(self.index_path, position_index.MANIFEST_NAME)
+        stat = os.stat(manifest)
+        os.utime(manifest, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1000000000))
+        reopened = position_index.get_position_index(self.pgn_path)
+
+        self.assertIsNot(reopened, shared)
+        self.assertEqual(reopened.games, 4)
+        self.assertEqual(shared.segments, [])
+
+    def test_append_rejects_game_ids_out_of_order(self):
+        game = chess.pgn.read_game(StringIO(EXTRA))
+        with PositionIndex(self.index_path) as index:
+            index.add_games([game])
+            with self.assertRaises(ValueError):
+                index.append(*position_index.game_records(0, game), 1)
+            self.assertEqual(index.games, 1)
+
+    def test_merging_segments_keeps_lookups(self):
+        pgn = StringIO(PGN + EXTRA)
+        games = []
+        while (game := chess.pgn.read_game(pgn)) is not None:
+            games.append(game)
+
+        with mock.patch.object(position_index, "MAX_SEGMENTS", 2), PositionIndex(self.index_path) as index:
+            for game in games:
+                index.add_games([game])
+            self.assertLessEqual(len(index.segments), 2)
+            expected = [(0, 1), (3, 1)]
+            self.assertEqual(index.lookup(board_after("e4")), expected)
+            index.compact()
+            self.assertEqual(len(index.segments), 1)
+            self.assertEqual(index.lookup(board_after("e4")), expected)
+            self.assertEqual(sorted(os.listdir(self.index_path)),
+                             sorted(["manifest.json", os.path.basename(index.segments[0].path)]))
+
+
+if __name__ == '__main__':
+    unittest.main()
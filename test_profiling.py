@@ -0,0 +1,52 @@
+import os
+import pstats
+import tempfile
+import unittest
+
+os.environ.setdefault("GROQ_API_KEY", "test-key")
+
+import profiling
+
+
+def slow_sum(n):
+    return sum(square(i) for i in range(n))
+
+
+def square(i):
+    return i * i
+
+
+class TestProfiling(unittest.TestCase):
+    def test_profile_call_returns_result_and_hot_functions(self):
+        result, report = profiling.profile_call(slow_sum, 20000, top_n=5)
+
+        self.assertEqual(result, sum(i * i for i in range(20000)))
+        self.assertNotIn("error", report)
+        self.assertEqual(len(report["top_functions"]), 5)
+        self.assertGreater(report["total_calls"], 20000)
+        self.assertIn("test_profiling.py", report["top_functions"][0]["function"])
+        self.assertIn("slow_sum", report["top_functions"][0]["function"])
+        square_row = [row for row in report["top_functions"] if "square" in row["function"]]
+        self.assertEqual(square_row[0]["calls"], 20000)
+        cumulative = [row["cumulative_seconds"] for row in report["top_functions"]]
+        self.assertEqual(cumulative, sorted(cumulative, reverse=True))
+
+    def test_stats_open_with_pstats(self):
+        _, report = profiling.profile_call(slow_sum, 100)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "analysis.prof")
+            with open(path, "wb") as f:
+                f.write(report["stats"])
+            stats = pstats.Stats(path)
+        self.assertTrue(any(name == "square" for _, _, name in stats.stats))
+
+    def test_format_report_lists_functions(self):
+        _, report = profiling.profile_call(slow_sum, 100, top_n=3)
+        lines = profiling.format_report(report).splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertIn("function", lines[0])
+        self.assertEqual(profiling.format_report({"error": "busy"}), "busy")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import os
+import unittest
+from unittest.mock import patch
+
+import chess
+import chess.engine
+
+os.environ.setdefault("GROQ_API_KEY", "test-key")
+
+from chess_analysis import StockfishService, engine_command, STUB_ENGINE
+
+
+class TestStubEngine(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        # Simulate a fast machine so the searches finish at once
+        with patch.dict(os.environ, {"STUB_ENGINE_NPS": "1000000000"}):
+            cls.engine = chess.engine.SimpleEngine.popen_uci(engine_command(STUB_ENGINE))
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.engine.quit()
+
+    def test_speaks_uci_deterministically(self):
+        self.engine.configure({"Threads": 2, "Hash": 64})
+        first = self.engine.analyse(chess.Board(), chess.engine.Limit(depth=6), multipv=3)
+        second = self.engine.analyse(chess.Board(), chess.engine.Limit(depth=6), multipv=3)
+        self.assertEqual(len(first), 3)
+        self.assertEqual([info["depth"] for info in first], [6, 6, 6])
+        self.assertEqual([info["pv"] for info in first], [info["pv"] for info in second])
+        self.assertEqual(first[0]["score"], second[0]["score"])
+
+    def test_finds_mate_and_reports_terminal_positions(self):
+        board = chess.Board("r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4")
+        info = self.engine.analyse(board, chess.engine.Limit(depth=3))
+        self.assertEqual(info["score"].relative, chess.engine.Mate(1))
+        self.assertEqual(info["pv"][0], chess.Move.from_uci("h5f7"))
+
+        board.push_uci("h5f7")
+        self.assertEqual(self.engine.analyse(board, chess.engine.Limit(depth=3))["score"].relative, chess.engine.Mate(0))
+
+    def test_honours_node_limits_and_stop(self):
+        self.engine.configure({"NodesPerSecond": 1000000000})
+        self.assertEqual(self.engine.analyse(chess.Board(), chess.engine.Limit(nodes=50000))["depth"], 7)
+        with self.engine.analysis(chess.Board()) as analysis:
+            for info in analysis:
+                if info.get("depth", 0) >= 2:
+                    break
+
+    def test_selected_through_stockfish_path(self):
+        with patch.dict(os.environ, {"STUB_ENGINE_NPS": "1000000000"}):
+            service = StockfishService(stockfish_path=STUB_ENGINE, depth=4)
+        try:
+            self.assertEqual(service.pool.engine_name, "Stub Engine 1.0")
+            result = service.analyze_position(chess.STARTING_FEN)
+            self.assertEqual(result["depth"], 4)
+            self.assertEqual(result["evaluation"]["type"], "cp")
+        finally:
+            service.pool.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import os
+import threading
+import unittest
+import urllib.request
+
+os.environ.setdefault("GROQ_API_KEY", "test-key")
+
+import telemetry
+from chess_analysis import GameAnalysisService, add_debug_info
+
+
+class FakeStockfishService:
+    available = False
+    depth = 18
+
+
+class FakeOpeningDBService:
+    def identify_opening(self, moves):
+        return {"name": "Test Opening", "eco": "A00"}
+
+
+class TestTracing(unittest.TestCase):
+    def test_spans_nest_and_record_status(self):
+        buffer = telemetry.TraceBuffer()
+        with telemetry.bind(buffer):
+            with telemetry.span("outer", game=1) as outer:
+                with telemetry.span("inner"):
+                    add_debug_info("inside")
+            with self.assertRaises(ValueError):
+                with telemetry.span("failing"):
+                    raise ValueError("boom")
+
+        inner, recorded_outer, failing = buffer.spans
+        self.assertEqual(recorded_outer, outer)
+        self.assertEqual(inner["parent_id"], outer["span_id"])
+        self.assertEqual(inner["trace_id"], outer["trace_id"])
+        self.assertEqual(outer["attributes"], {"game": 1})
+        self.assertEqual(failing["status"], "error")
+        self.assertIsNone(failing["parent_id"])
+        self.assertNotEqual(failing["trace_id"], outer["trace_id"])
+        self.assertEqual(buffer.messages(), ["inside"])
+        self.assertEqual(buffer.events[0]["span_id"], inner["span_id"])
+
+    def test_buffer_is_bounded(self):
+        buffer = telemetry.TraceBuffer(max_spans=3, max_events=2)
+        with telemetry.bind(buffer):
+            for i in range(10):
+                with telemetry.span(f"span-{i}"):
+                    add_debug_info(f"message {i}")
+        self.assertEqual([s["name"] for s in buffer.spans], ["span-7", "span-8", "span-9"])
+        self.assertEqual(buffer.messages(), ["message 8", "message 9"])
+
+    def test_buffers_are_separate_per_thread(self):
+        first, second = telemetry.TraceBuffer(), telemetry.TraceBuffer()
+
+        def run(buffer, name):
+            with telemetry.bind(buffer):
+                add_debug_info(name)
+
+        threads = [threading.Thread(target=run, args=(first, "first")),
+                   threading.Thread(target=run, args=(second, "second"))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(first.messages(), ["first"])
+        self.assertEqual(second.messages(), ["second"])
+        self.assertIsNone(telemetry.current_buffer())
+
+    def test_analyze_game_records_stage_spans(self):
+        service = GameAnalysisService(FakeStockfishService(), None, FakeOpeningDBService())
+        buffer = telemetry.TraceBuffer()
+        with telemetry.bind(buffer):
+            result = service.analyze_game("1. e4 e5 2. Nf3 *", include_ai=False)
+            service.analyze_game('[FEN "not a position"]\n\n1. e4 *', include_ai=False)
+
+        self.assertNotIn("error", result)
+        names = [s["name"] for s in buffer.spans]
+        self.assertEqual(names[:3], ["parse", "opening_lookup", "analyze_game"])
+        parse, _, root = list(buffer.spans)[:3]
+        self.assertEqual(parse["parent_id"], root["span_id"])
+        self.assertEqual(parse["attributes"]["plies"], 3)
+        self.assertEqual(buffer.spans[-1]["name"], "analyze_game")
+        self.assertEqual(buffer.spans[-1]["status"], "error")
+
+
+class TestMetrics(unittest.TestCase):
+    def test_counter_and_histogram_render_in_prometheus_format(self):
+        registry = telemetry.MetricsRegistry(prefix="test_")
+        counter = registry.counter("requests_total", "Requests")
+        counter.inc(route="/a")
+        counter.inc(2, route='say "hi"\n')
+        histogram = registry.histogram("latency_seconds", "Latency", buckets=(0.1, 1.0))
+        histogram.observe(0.05)
+        histogram.observe(0.5)
+        histogram.observe(5.0)
+
+        self.assertIs(registry.counter("requests_total"), counter)
+        self.assertEqual(counter.value(route="/a"), 1)
+        lines = registry.render_prometheus().splitlines()
+        self.assertIn("# TYPE test_requests_total counter", lines)
+        self.assertIn('test_requests_total{route="/a"} 1', lines)
+        self.assertIn('test_requests_total{route="say \\"hi\\"\\n"} 2', lines)
+        self.assertIn("# TYPE test_latency_seconds histogram", lines)
+        self.assertIn('test_latency_seconds_bucket{le="0.1"} 1', lines)
+        self.assertIn('test_latency_seconds_bucket{le="1.0"} 2', lines)
+        self.assertIn('test_latency_seconds_bucket{le="+Inf"} 3', lines)
+        self.assertIn("test_latency_seconds_sum 5.55", lines)
+        self.assertIn("test_latency_seconds_count 3", lines)
+
+    def test_spans_feed_the_global_metrics(self):
+        before = telemetry.METRICS.counter("spans_total").value(span="metered", status="ok")
+        with telemetry.span("metered"):
+            pass
+        self.assertEqual(telemetry.METRICS.counter("spans_total").value(span="metered", status="ok"), before + 1)
+        self.assertGreaterEqual(telemetry.METRICS.histogram("span_duration_seconds").count(span="metered"), 1)
+
+    def test_metrics_server_serves_the_registry(self):
+        registry = telemetry.MetricsRegistry(prefix="test_")
+        registry.counter("hits_total", "Hits").inc()
+        server = telemetry.start_metrics_server(0, registry=registry)
+        try:
+            url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+            with urllib.request.urlopen(url, timeout=5) as response:
+                body = response.read().decode("utf-8")
+            self.assertIn("test_hits_total 1", body)
+        finally:
+            server.shutdown()
+            server.server_close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,170 @@
+import os
+import random
+import tempfile
+import time
+import unittest
+from unittest.mock import patch
+
+import chess
+import numpy as np
+
+from compact_game import CompactGame
+from visualization_service import VisualizationService, attack_maps, cleanup_leaked_heatmaps
+
+
+def attackers_grid(board, color):
+    grid = np.zeros((8, 8), dtype=np.int64)
+    for square in chess.SQUARES:
+        grid[7 - square // 8, square % 8] = len(board.attackers(color, square))
+    return grid
+
+
+class TestAttackMaps(unittest.TestCase):
+    def setUp(self):
+        self.service = VisualizationService()
+
+    def test_matches_board_attackers(self):
+        rng = random.Random(7)
+        boards = []
+        for _ in range(5):
+            board = chess.Board()
+            for _ in range(rng.randint(10, 120)):
+                moves = list(board.legal_moves)
+                if not moves:
+                    break
+                board.push(rng.choice(moves))
+                boards.append(board.copy(stack=False))
+
+        maps = attack_maps(boards)
+        self.assertEqual(maps.shape, (len(boards), 2, 8, 8))
+        for index, board in enumerate(boards):
+            for color in chess.COLORS:
+                np.testing.assert_array_equal(maps[index, int(color)], attackers_grid(board, color))
+
+    def test_single_board_maps(self):
+        board = chess.Board("r3k2r/pp3ppp/2n5/3qp3/1b1P4/2N2N2/PP3PPP/R2QKB1R w KQkq - 0 1")
+        white = self.service.generate_control_heatmap(board, perspective=chess.WHITE)
+        black = self.service.generate_control_heatmap(board, perspective=chess.BLACK)
+        np.testing.assert_array_equal(white, attackers_grid(board, chess.WHITE))
+        np.testing.assert_array_equal(black, attackers_grid(board, chess.BLACK))
+        np.testing.assert_array_equal(self.service.generate_piece_influence_map(board), white - black)
+
+    def test_game_control_maps(self):
+        game = CompactGame.from_moves(
+            chess.Move.from_uci(uci) for uci in ["e2e4", "e7e5", "g1f3", "b8c6", "f1b5"]
+        )
+        maps = self.service.generate_game_control_maps(game.boards())
+        self.assertEqual(maps.shape, (6, 2, 8, 8))
+        np.testing.assert_array_equal(maps[5, int(chess.WHITE)], attackers_grid(game.board_at(5), chess.WHITE))
+        self.assertEqual(attack_maps([]).shape, (0, 2, 8, 8))
+
+
+
+class TestHeatmapRendering(unittest.TestCase):
+    def setUp(self):
+        self.service = VisualizationService(heatmap_cache_size=2)
+        self.grid = self.service.generate_control_heatmap(chess.Board(), perspective=chess.WHITE)
+
+    def test_renders_svg_in_memory(self):
+        svg = self.service.plot_heatmap(self.grid, title="White's Board Control", perspective="White")
+        self.assertTrue(svg.startswith("<svg"))
+        self.assertIn("White's Board Control", svg)
+        self.assertEqual(svg.count("<rect"), 64)
+
+    def test_caches_by_grid_and_style(self):
+        first = self.service.plot_heatmap(self.grid, title="A", perspective="White")
+        self.assertIs(self.service.plot_heatmap(self.grid.copy(), title="A", perspective="White"), first)
+        self.assertIsNot(self.service.plot_heatmap(self.grid, title="A", perspective="Black"), first)
+
+        # The cache is bounded and evicts the least recently used rendering
+        self.service.plot_heatmap(self.grid + 1, title="A", perspective="White")
+        self.assertEqual(len(self.service.heatmap_cache), 2)
+        self.assertIsNot(self.service.plot_heatmap(self.grid, title="A", perspective="White"), first)
+
+    def test_cleans_up_leaked_temp_files(self):
+        with tempfile.TemporaryDirectory() as directory:
+            leaked = os.path.join(directory, "tmpa1b2c3d4.png")
+            other = os.path.join(directory, "tmpe5f6g7h8.png")
+            recent = os.path.join(directory, "tmpi9j0k1l2.png")
+            # Another program's matplotlib output, under a name NamedTemporaryFile never picks
+            renamed = os.path.join(directory, "tmp_chart_final.png")
+            matplotlib_png = b"\x89PNG\r\n\x1a\n tEXtSoftware\x00Matplotlib version3.8"
+            for path, content in [(leaked, matplotlib_png), (other, b"\x89PNG not ours"),
+                                  (recent, matplotlib_png), (renamed, matplotlib_png)]:
+                with open(path, "wb") as png:
+                    png.write(content)
+            old = time.time() - 7200
+            for path in (leaked, other, renamed):
+                os.utime(path, (old, old))
+
+            with patch("tempfile.gettempdir", return_value=directory):
+                self.assertEqual(cleanup_leaked_heatmaps(), 1)
+            self.assertFalse(os.path.exists(leaked))
+            self.assertTrue(os.path.exists(other))
+            self.assertTrue(os.path.exists(recent))
+            self.assertTrue(os.path.exists(renamed))
+
+
+class TestBoardRendering(unittest.TestCase):
+    def setUp(self):
+        self.service = VisualizationService(board_cache_size=4)
+        self.board = chess.Board()
+
+    def test_reuses_identical_renderings(self):
+        svg = self.service.render_board(self.board)
+        self.assertIs(self.service.render_board(chess.Board()), svg)
+        self.assertIsNot(self.service.render_board(self.board, flip=True), svg)
+        self.assertIsNot(self.service.render_board(self.board, size=200), svg)
+
+        move = chess.Move.from_uci("e2e4")
+        with_arrows = self.service.render_board_with_arrows(self.board, moves=[move])
+        self.assertIs(self.service.render_board_with_arrows(self.board, moves=["e2e4"]), with_arrows)
+        self.assertIsNot(self.service.render_board(self.board, last_move=move), with_arrows)
+
+    def test_cache_is_bounded(self):
+        for uci in ["e2e4", "d2d4", "c2c4", "g1f3", "b1c3"]:
+            board = chess.Board()
+            board.push_uci(uci)
+            self.service.render_board(board)
+        self.assertEqual(len(self.service.board_cache), 4)
+
+    def test_prerenders_every_ply(self):
+        service = VisualizationService()
+        game = CompactGame.from_moves(chess.Move.from_uci(uci) for uci in ["e2e4", "e7e5", "g1f3"])
+        with patch("visualization_service.threading.Thread") as thread:
+            service.prerender_game(game, flip=True)
+            # Run the worker inline
+            thread.call_args.kwargs["target"]()
+        self.assertEqual(len(service.board_cache), 4)
+
+        last = game.board_at(3)
+        with patch("chess.svg.board") as render:
+            service.render_board(last, last_move=game.move(2), flip=True)
+        render.assert_not_called()
+
+    def test_prerenders_the_boards_with_suggested_moves(self):
+        service = VisualizationService()
+        game = CompactGame.from_moves(chess.Move.from_uci(uci) for uci in ["e2e4", "e7e5"])
+        after_e5 = game.board_at(2)
+        suggestions = {after_e5.fen(): [chess.Move.from_uci("g1f3"), chess.Move.from_uci("f1c4")]}
+        with patch("visualization_service.threading.Thread") as thread:
+            service.prerender_game(game, suggestions=suggestions)
+            thread.call_args.kwargs["target"]()
+        self.assertEqual(len(service.board_cache), 4)
+
+        # The board view's call for that position is served from the cache
+        with patch("chess.svg.board") as render:
+            service.render_board_with_arrows(after_e5, moves=suggestions[after_e5.fen()], last_move=game.move(1))
+        render.assert_not_called()
+
+    def test_prerender_can_be_cancelled(self):
+        service = VisualizationService()
+        game = CompactGame.from_moves(chess.Move.from_uci(uci) for uci in ["e2e4", "e7e5"])
+        with patch("visualization_service.threading.Thread") as thread:
+            cancelled = service.prerender_game(game)
+            cancelled.set()
+            thread.call_args.kwargs["target"]()
+        self.assertEqual(len(service.board_cache), 0)
+
+if __name__ == '__main__':
+    unittest.main()
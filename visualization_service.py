@@ -1,27 +1,266 @@
 import os
+import re
+import glob
+import time
+import hashlib
 import tempfile
-import matplotlib.pyplot as plt
-import seaborn as sns
+import threading
+from collections import OrderedDict
+from xml.sax.saxutils import escape
 import numpy as np
 import chess
+import chess.svg
 import logging
 
+import telemetry
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Debug info list for tracking application flow
-debug_info = []
-
 def add_debug_info(message):
-    """Add a debug message to the global debug info list"""
-    global debug_info
-    debug_info.append(message)
-    logger.info(message)
+    """Log a debug message and add it to the current session's trace"""
+    telemetry.event(message)
+
+# Destination masks that stop shifted bitboards from wrapping around the board edge
+_ALL = np.uint64(chess.BB_ALL)
+_NOT_A = np.uint64(chess.BB_ALL & ~chess.BB_FILE_A)
+_NOT_H = np.uint64(chess.BB_ALL & ~chess.BB_FILE_H)
+_NOT_AB = np.uint64(chess.BB_ALL & ~(chess.BB_FILE_A | chess.BB_FILE_B))
+_NOT_GH = np.uint64(chess.BB_ALL & ~(chess.BB_FILE_G | chess.BB_FILE_H))
+
+# (square offset, destination mask) for every direction a piece moves in
+_ROOK_DIRECTIONS = [(8, _ALL), (-8, _ALL), (1, _NOT_A), (-1, _NOT_H)]
+_BISHOP_DIRECTIONS = [(9, _NOT_A), (7, _NOT_H), (-7, _NOT_A), (-9, _NOT_H)]
+_KING_DIRECTIONS = _ROOK_DIRECTIONS + _BISHOP_DIRECTIONS
+_KNIGHT_DIRECTIONS = [
+    (17, _NOT_A), (15, _NOT_H), (10, _NOT_AB), (6, _NOT_GH),
+    (-6, _NOT_AB), (-10, _NOT_GH), (-15, _NOT_A), (-17, _NOT_H)
+]
+# Colors in the order of the color axis of attack maps, so int(color) indexes it
+_COLOR_AXIS = (chess.BLACK, chess.WHITE)
+
+_PAWN_DIRECTIONS = {
+    chess.WHITE: [(9, _NOT_A), (7, _NOT_H)],
+    chess.BLACK: [(-7, _NOT_A), (-9, _NOT_H)]
+}
+
+
+def _shift(bitboards, offset, mask):
+    if offset > 0:
+        return (bitboards << np.uint64(offset)) & mask
+    return (bitboards >> np.uint64(-offset)) & mask
+
+
+def _attack_sets(pieces, color, empty):
+    """
+    Attack bitboards of one side, one per piece type and direction.
+
+    No square can be attacked twice through the same direction by the same
+    kind of piece (sliders are stopped by the first blocker), so the number
+    of attackers of a square is the number of these sets it belongs to.
+    """
+    pawns, knights, bishops, rooks, queens, kings = pieces
+    sets = [_shift(pawns, offset, mask) for offset, mask in _PAWN_DIRECTIONS[color]]
+    sets += [_shift(knights, offset, mask) for offset, mask in _KNIGHT_DIRECTIONS]
+    sets += [_shift(kings, offset, mask) for offset, mask in _KING_DIRECTIONS]
+
+    for sliders, directions in ((rooks | queens, _ROOK_DIRECTIONS), (bishops | queens, _BISHOP_DIRECTIONS)):
+        for offset, mask in directions:
+            attacks = np.zeros_like(sliders)
+            ray = sliders
+            for _ in range(7):
+                ray = _shift(ray, offset, mask)
+                attacks |= ray
+                # Rays continue only through empty squares, the blocker itself is attacked
+                ray &= empty
+            sets.append(attacks)
+    return sets
+
+
+def attack_maps(boards):
+    """
+    Count the attackers of every square for both colors in many positions at once.
+
+    Args:
+        boards: An iterable of chess.Board positions
+
+    Returns:
+        An int array of shape (positions, 2, 8, 8) indexed by
+        [position, int(color), row, column], i.e. Black at 0 and White
+        at 1, and row 0 is the eighth rank, matching the grids
+        drawn by plot_heatmap. Counts agree with len(board.attackers(color, square)).
+    """
+    # Only the piece bitboards are read from each board; everything else is array arithmetic
+    pieces = [
+        [[board.pieces_mask(piece_type, color) for piece_type in chess.PIECE_TYPES] for color in _COLOR_AXIS]
+        for board in boards
+    ]
+    if not pieces:
+        return np.zeros((0, 2, 8, 8), dtype=np.int64)
+
+    bitboards = np.array(pieces, dtype=np.uint64)  # (positions, color, piece type)
+    occupied = np.bitwise_or.reduce(bitboards, axis=(1, 2))
+    empty = ~occupied
+
+    maps = []
+    for color in _COLOR_AXIS:
+        piece_sets = [bitboards[:, int(color), index] for index in range(len(chess.PIECE_TYPES))]
+        sets = np.stack(_attack_sets(piece_sets, color, empty))  # (sets, positions)
+        # Expand each bitboard into 64 bits in square order and count membership per square
+        bits = np.unpackbits(sets.astype("<u8").view(np.uint8), bitorder="little")
+        counts = bits.reshape(len(sets), -1, 64).sum(axis=0, dtype=np.int64)
+        maps.append(counts.reshape(-1, 8, 8)[:, ::-1, :])
+
+    return np.stack(maps, axis=1)
+
+
+# Anchor colors (low, middle, high) of the heatmap palettes, after the matplotlib colormaps
+HEATMAP_PALETTES = {
+    "White": ["#f7fcf5", "#74c476", "#00441b"],   # Greens
+    "Black": ["#fcfbfd", "#9e9ac8", "#3f007d"],   # Purples
+    "Neutral": ["#3b4cc0", "#dddddd", "#b40426"]  # coolwarm, centered on zero
+}
+
+HEATMAP_CELL_SIZE = 40
+HEATMAP_CACHE_SIZE = 256
+
+# Rendered board SVGs kept per process; large enough to hold every ply of a long game
+BOARD_SVG_CACHE_SIZE = 1024
+BOARD_SIZE = 400
+
+# Heatmaps used to be written to never-deleted NamedTemporaryFile PNGs; files older than this are removed
+LEAKED_HEATMAP_MAX_AGE = 3600
+# Names NamedTemporaryFile(suffix='.png') gives its files: "tmp" plus 8 random characters
+LEAKED_HEATMAP_NAME = re.compile(r"tmp[a-z0-9_]{8}\.png")
+
+
+def _hex_to_rgb(color):
+    return tuple(int(color[i:i + 2], 16) for i in (1, 3, 5))
+
+
+def _palette_color(palette, t):
+    """Interpolate a palette at t in [0, 1], returning the color and whether it is dark"""
+    low, middle, high = (_hex_to_rgb(color) for color in palette)
+    if t <= 0.5:
+        start, end, t = low, middle, t * 2
+    else:
+        start, end, t = middle, high, (t - 0.5) * 2
+    rgb = [round(a + (b - a) * t) for a, b in zip(start, end)]
+    luminance = (0.299 * rgb[0] + 0.587 * rgb[1] + 0.114 * rgb[2]) / 255
+    return "#%02x%02x%02x" % tuple(rgb), luminance < 0.5
+
+
+def render_heatmap_svg(data, title="Heatmap", perspective="White"):
+    """
+    Render an 8x8 grid as an annotated SVG heatmap.
+
+    Args:
+        data: 8x8 values, row 0 being the eighth rank
+        title: Title drawn above the grid
+        perspective: "White", "Black" or "Neutral", selecting the palette;
+            the neutral palette is centered on zero
+
+    Returns:
+        The SVG document as a string
+    """
+    grid = np.asarray(data)
+    palette = HEATMAP_PALETTES.get(perspective, HEATMAP_PALETTES["Neutral"])
+    if perspective in ("White", "Black"):
+        low, high = float(grid.min()), float(grid.max())
+    else:
+        bound = float(np.abs(grid).max())
+        low, high = -bound, bound
+    span = (high - low) or 1.0
+
+    cell = HEATMAP_CELL_SIZE
+    left, top = 24, 32
+    width, height = left + 8 * cell + 8, top + 8 * cell + 24
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}" font-family="sans-serif">',
+        f'<text x="{left + 4 * cell}" y="20" text-anchor="middle" font-size="14">{escape(title)}</text>'
+    ]
+    for row in range(8):
+        for col in range(8):
+            value = grid[row, col]
+            fill, dark = _palette_color(palette, (float(value) - low) / span)
+            x, y = left + col * cell, top + row * cell
+            parts.append(
+                f'<rect x="{x}" y="{y}" width="{cell}" height="{cell}" fill="{fill}" '
+                f'stroke="#ffffff" stroke-width="1"/>'
+            )
+            label = f"{value:g}" if isinstance(value, float) else str(value)
+            parts.append(
+                f'<text x="{x + cell / 2}" y="{y + cell / 2 + 4}" text-anchor="middle" font-size="12" '
+                f'fill="{"#ffffff" if dark else "#000000"}">{label}</text>'
+            )
+    # Chess coordinates along the edges
+    for index in range(8):
+        parts.append(
+            f'<text x="{left + index * cell + cell / 2}" y="{top + 8 * cell + 16}" '
+            f'text-anchor="middle" font-size="12">{chess.FILE_NAMES[index]}</text>'
+        )
+        parts.append(
+            f'<text x="{left - 8}" y="{top + index * cell + cell / 2 + 4}" '
+            f'text-anchor="end" font-size="12">{8 - index}</text>'
+        )
+    parts.append("</svg>")
+    return "".join(parts)
+
+
+def cleanup_leaked_heatmaps(max_age=LEAKED_HEATMAP_MAX_AGE):
+    """
+    Delete heatmap PNGs left in the temp directory by the old matplotlib renderer.
+
+    Only files named the way NamedTemporaryFile named them, that are PNGs
+    carrying matplotlib's Software metadata and are older than max_age
+    seconds are removed; anything else in the shared temp directory is left
+    alone. Returns the number of deleted files.
+    """
+    removed = 0
+    cutoff = time.time() - max_age
+    for path in glob.glob(os.path.join(tempfile.gettempdir(), "tmp*.png")):
+        if not LEAKED_HEATMAP_NAME.fullmatch(os.path.basename(path)):
+            continue
+        try:
+            if os.path.getmtime(path) > cutoff:
+                continue
+            with open(path, "rb") as png:
+                header = png.read(256)
+            if not header.startswith(b"\x89PNG") or b"Software\x00Matplotlib" not in header:
+                continue
+            os.remove(path)
+            removed += 1
+        except OSError:
+            continue
+    return removed
+
+
+# Leaked files are swept once per process
+_leaked_heatmaps_cleaned = False
+_cleanup_lock = threading.Lock()
+
 
 class VisualizationService:
-    def __init__(self):
-        pass
+    def __init__(self, heatmap_cache_size=HEATMAP_CACHE_SIZE, board_cache_size=BOARD_SVG_CACHE_SIZE):
+        # Rendered heatmaps keyed by a hash of the grid and style, least recently used first
+        self.heatmap_cache = OrderedDict()
+        self.heatmap_cache_size = heatmap_cache_size
+        self._heatmap_lock = threading.Lock()
+
+        # Rendered boards keyed by (FEN, arrows, last move, flip, size), least recently used first
+        self.board_cache = OrderedDict()
+        self.board_cache_size = board_cache_size
+        self._board_lock = threading.Lock()
+
+        global _leaked_heatmaps_cleaned
+        with _cleanup_lock:
+            if not _leaked_heatmaps_cleaned:
+                _leaked_heatmaps_cleaned = True
+                removed = cleanup_leaked_heatmaps()
+                if removed:
+                    add_debug_info(f"Removed {removed} leaked heatmap files")
 
     def render_board_with_arrows(self, board, moves=None, last_move=None, flip=False):
         try:
@@ -60,105 +299,144 @@ class VisualizationService:
                     add_debug_info(f"Error creating arrow for last move {last_move}: {str(e)}")
             
             # Generate SVG
-            svg = chess.svg.board(
-                board=board,
-                arrows=arrows,
-                flipped=flip,
-                size=400
-            )
-            
-            return svg
+            return self.render_board(board, arrows=arrows, flip=flip)
         except Exception as e:
             add_debug_info(f"Error rendering board with arrows: {str(e)}")
             return None
 
-    def generate_control_heatmap(self, board, perspective=chess.WHITE):
-        try:
-            # Create an 8x8 matrix for the heatmap
-            heatmap_data = [[0 for _ in range(8)] for _ in range(8)]
+    def render_board(self, board, arrows=(), last_move=None, flip=False, size=BOARD_SIZE):
+        """
+        Render a board to SVG, reusing the cached rendering of identical input.
 
-            # Calculate control values for each square
-            for square in chess.SQUARES:
-                row, col = 7 - (square // 8), square % 8  # Convert to 0-indexed row, col
+        Args:
+            board: The position to draw
+            arrows: chess.svg.Arrow objects to draw on the board
+            last_move: Move whose squares are highlighted, if any
+            flip: Draw the board from Black's side
+            size: Width and height of the SVG in pixels
 
-                # Count attackers for the square
-                try:
-                    attackers = len(board.attackers(perspective, square))
-                    # Set control value
-                    heatmap_data[row][col] = attackers
-                except Exception as e:
-                    add_debug_info(f"Error calculating attackers for square {square}: {str(e)}")
-                    # Default to 0 if error
-                    heatmap_data[row][col] = 0
+        Returns:
+            The SVG document as a string
+        """
+        key = (
+            board.fen(),
+            tuple((arrow.tail, arrow.head, arrow.color) for arrow in arrows),
+            last_move.uci() if last_move else None,
+            flip,
+            size
+        )
+        with self._board_lock:
+            svg = self.board_cache.get(key)
+            if svg is not None:
+                self.board_cache.move_to_end(key)
+                return svg
+
+        # Only cache misses are traced; a hit costs next to nothing
+        with telemetry.span("render.board"):
+            svg = chess.svg.board(board=board, arrows=list(arrows), lastmove=last_move, flipped=flip, size=size)
+
+        with self._board_lock:
+            self.board_cache[key] = svg
+            if len(self.board_cache) > self.board_cache_size:
+                self.board_cache.popitem(last=False)
+        return svg
+
+    def prerender_game(self, game, flip=False, suggestions=None, size=BOARD_SIZE):
+        """
+        Render every ply of a CompactGame into the board cache on a background thread.
+
+        Each ply is rendered the way the board view shows it: the position with
+        the move that led to it highlighted and, for positions with an entry
+        in `suggestions` ({fen: moves}), the render_board_with_arrows board
+        too. Stepping through the game then only hits the cache.
 
-            return heatmap_data
+        Returns:
+            A threading.Event; setting it stops the pre-render early
+        """
+        suggestions = dict(suggestions or {})
+        cancelled = threading.Event()
+
+        def run():
+            rendered = 0
+            try:
+                for ply, board in enumerate(game.boards()):
+                    if cancelled.is_set():
+                        break
+                    last_move = game.move(ply - 1) if ply else None
+                    self.render_board(board, last_move=last_move, flip=flip, size=size)
+                    rendered += 1
+                    moves = suggestions.get(board.fen())
+                    if moves:
+                        self.render_board_with_arrows(board, moves=moves, last_move=last_move, flip=flip)
+                        rendered += 1
+                add_debug_info(f"Pre-rendered {rendered} board positions")
+            except Exception as e:
+                add_debug_info(f"Error pre-rendering boards: {str(e)}")
+
+        thread = threading.Thread(target=run, daemon=True)
+        thread.start()
+        return cancelled
+
+    def generate_control_heatmap(self, board, perspective=chess.WHITE):
+        try:
+            # 8x8 array of attacker counts, row 0 being the eighth rank
+            return attack_maps([board])[0, int(perspective)]
         except Exception as e:
             add_debug_info(f"Error generating control heatmap: {str(e)}")
-            return [[0 for _ in range(8)] for _ in range(8)]
+            return np.zeros((8, 8), dtype=np.int64)
 
     def generate_piece_influence_map(self, board):
         try:
-            # Create an 8x8 matrix for the influence map
-            influence_data = [[0 for _ in range(8)] for _ in range(8)]
-
-            # Calculate influence values for each square
-            for square in chess.SQUARES:
-                row, col = 7 - (square // 8), square % 8  # Convert to 0-indexed row, col
+            # Influence is positive where White has more attackers, negative where Black has
+            maps = attack_maps([board])[0]
+            return maps[int(chess.WHITE)] - maps[int(chess.BLACK)]
+        except Exception as e:
+            add_debug_info(f"Error generating piece influence map: {str(e)}")
+            return np.zeros((8, 8), dtype=np.int64)
 
-                try:
-                    # Count white and black attackers
-                    white_attackers = len(board.attackers(chess.WHITE, square))
-                    black_attackers = len(board.attackers(chess.BLACK, square))
+    def generate_game_control_maps(self, boards):
+        """
+        Compute the control maps of every position of a game in one call.
 
-                    # Calculate influence (positive for white, negative for black)
-                    influence_data[row][col] = white_attackers - black_attackers
-                except Exception as e:
-                    add_debug_info(f"Error calculating influence for square {square}: {str(e)}")
-                    influence_data[row][col] = 0
+        Args:
+            boards: The positions of the game, e.g. CompactGame.boards()
 
-            return influence_data
+        Returns:
+            An int array of shape (plies, 2, 8, 8); see attack_maps
+        """
+        try:
+            return attack_maps(boards)
         except Exception as e:
-            add_debug_info(f"Error generating piece influence map: {str(e)}")
-            return [[0 for _ in range(8)] for _ in range(8)]
+            add_debug_info(f"Error generating game control maps: {str(e)}")
+            return None
 
     def plot_heatmap(self, data, title="Heatmap", perspective="White"):
+        """
+        Render a heatmap in memory, reusing the cached SVG for identical input.
+
+        Returns:
+            The SVG document as a string, or None on error
+        """
         try:
-            # Create a temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix='.png') as tmpfile:
-                # Create figure and axis
-                plt.figure(figsize=(8, 8))
-
-                # Determine colormap based on perspective
-                if perspective == "White":
-                    cmap = "Greens"
-                elif perspective == "Black":
-                    cmap = "Purples"
-                else:  # Neutral for influence map
-                    cmap = "coolwarm"
-
-                # Create heatmap
-                ax = sns.heatmap(
-                    data,
-                    cmap=cmap,
-                    annot=True,
-                    fmt="d",
-                    linewidths=0.5,
-                    square=True,
-                    cbar=True
-                )
-
-                # Set title and labels
-                plt.title(title)
-                
-                # Set axis labels (chess coordinates)
-                ax.set_xticklabels(['a', 'b', 'c', 'd', 'e', 'f', 'g', 'h'])
-                ax.set_yticklabels(['8', '7', '6', '5', '4', '3', '2', '1'])
-                
-                # Save to temporary file
-                plt.savefig(tmpfile.name, bbox_inches='tight')
-                plt.close()
-                
-                return tmpfile.name
+            grid = np.ascontiguousarray(data)
+            digest = hashlib.sha1(grid.tobytes())
+            digest.update(f"|{grid.dtype}|{grid.shape}|{title}|{perspective}".encode("utf-8"))
+            key = digest.hexdigest()
+
+            with self._heatmap_lock:
+                svg = self.heatmap_cache.get(key)
+                if svg is not None:
+                    self.heatmap_cache.move_to_end(key)
+                    return svg
+
+            with telemetry.span("render.heatmap", title=title):
+                svg = render_heatmap_svg(grid, title=title, perspective=perspective)
+
+            with self._heatmap_lock:
+                self.heatmap_cache[key] = svg
+                if len(self.heatmap_cache) > self.heatmap_cache_size:
+                    self.heatmap_cache.popitem(last=False)
+            return svg
         except Exception as e:
             add_debug_info(f"Error plotting heatmap: {str(e)}")
             return None